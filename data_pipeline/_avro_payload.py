@@ -16,6 +16,7 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from data_pipeline._schema_metadata import _SchemaMetadataStore
 from data_pipeline.config import get_config
 from data_pipeline.helpers.yelp_avro_store import _AvroStringStore
 from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
@@ -32,10 +33,12 @@ class _AvroPayload(object):
         reader_schema_id=None,
         payload=None,
         payload_data=None,
-        dry_run=False
+        dry_run=False,
+        payload_fields=None
     ):
         self._set_schema_id(schema_id)
         self._set_reader_schema_id(reader_schema_id)
+        self._payload_fields = payload_fields
         self._set_dry_run(dry_run)
         self._set_payload_or_payload_data(payload, payload_data)
 
@@ -163,9 +166,19 @@ class _AvroPayload(object):
         """get the reader from store if already exists"""
         return _AvroStringStore().get_reader(
             reader_id_key=self.reader_schema_id,
-            writer_id_key=self.schema_id
+            writer_id_key=self.schema_id,
+            fields=self._get_decoded_fields()
         )
 
+    def _get_decoded_fields(self):
+        """The primary key fields are always decoded along with the payload
+        fields, since the keys of the message are taken from them.
+        """
+        if self._payload_fields is None:
+            return None
+        primary_keys = _SchemaMetadataStore().get_metadata(self.schema_id).primary_keys
+        return frozenset(self._payload_fields).union(primary_keys)
+
     def reload_data(self):
         """Populate the payload data or the payload if it hasn't done so.
         """
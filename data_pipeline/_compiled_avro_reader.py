@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+This module compiles pairs of writer and reader avro schemas into decoders,
+trees of closures built once per pair which resolve the schemas ahead of
+time, and decode data the same way as the generic avro reader without
+matching the schemas for each datum.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import copy
+import struct
+
+import avro.io
+import avro.schema
+from data_pipeline_avro_util.avro_string_reader import AvroStringReader
+
+from data_pipeline._compiled_avro_writer import UnsupportedSchemaError
+from data_pipeline._envelope_codec import _EnvelopeDecoder
+
+
+_FLOAT = struct.Struct(str('<f'))
+_DOUBLE = struct.Struct(str('<d'))
+
+_UNSUPPORTED_TYPES = ('request', 'error_union')
+
+
+class _ResolutionError(Exception):
+    """Raised when encoded data can't be resolved with the reader schema, so
+    the generic avro reader can raise its usual error for it.
+    """
+    pass
+
+
+# Errors after which the data is decoded again with the generic reader, which
+# either raises the same error as without compiled decoders or decodes it.
+_FALLBACK_ERRORS = (
+    _ResolutionError,
+    IndexError,
+    TypeError,
+    ValueError,
+    struct.error
+)
+
+
+class CompiledAvroStringReader(AvroStringReader):
+    """AvroStringReader which decodes data with a decoder compiled for its
+    writer and reader schemas, and returns the same data as the generic avro
+    reader.
+
+    The schemas are resolved when the decoder is compiled: removed fields are
+    skipped, default values are filled in and reader unions are matched
+    without looking up the schemas for each datum.  Schemas that can't be
+    compiled, and data that can't be resolved, are handled by the generic
+    reader, so invalid data fails the same way.
+
+    Args:
+        fields (Optional[iterable(str)]): names of the fields of the reader
+            record schema to decode.  The other fields are skipped without
+            being decoded, and left out of the decoded data.  All the fields
+            are decoded by default, or if the reader schema isn't a record.
+    """
+
+    def __init__(self, reader_schema, writer_schema, fields=None):
+        super(CompiledAvroStringReader, self).__init__(
+            reader_schema,
+            writer_schema
+        )
+        self.fields = frozenset(fields) if fields is not None else None
+        try:
+            self._compiled_decode = compile_decoder(
+                self.writer_schema,
+                self.reader_schema,
+                self.fields
+            )
+        except UnsupportedSchemaError:
+            self._compiled_decode = None
+
+    def decode(self, encoded_message):
+        if self._compiled_decode is not None:
+            try:
+                return self._compiled_decode(encoded_message)
+            except _FALLBACK_ERRORS:
+                pass
+        decoded_message = super(CompiledAvroStringReader, self).decode(
+            encoded_message
+        )
+        if self.fields is None or self.reader_schema.type != 'record':
+            return decoded_message
+        return {
+            name: value for name, value in decoded_message.iteritems()
+            if name in self.fields
+        }
+
+
+def compile_decoder(writer_schema, reader_schema, fields=None):
+    """Compiles a decoder of the data encoded with the writer schema into the
+    representation of the reader schema.
+
+    Args:
+        writer_schema (avro.schema.Schema): schema the data is encoded with.
+        reader_schema (avro.schema.Schema): schema to decode the data into.
+        fields (Optional[set(str)]): names of the fields of the reader record
+            schema to decode, see :class:`CompiledAvroStringReader`.
+
+    Returns:
+        function: decodes bytes into the same representation as
+            :meth:`AvroStringReader.decode`.  It raises an error if the data
+            can't be resolved, which isn't necessarily the same as the error
+            of the generic reader.
+
+    Raises:
+        UnsupportedSchemaError: if the schemas can't be compiled.
+    """
+    read = _ResolutionCompiler(reader_schema, fields).compile_reader(
+        writer_schema,
+        reader_schema
+    )
+
+    def decode(encoded_message):
+        return read(_PayloadDecoder(encoded_message))
+
+    return decode
+
+
+class _PayloadDecoder(_EnvelopeDecoder):
+    """Reads the avro values of an encoded datum in order."""
+
+    def read_boolean(self):
+        code = self.codes[self.position]
+        self.position += 1
+        return code == 1
+
+    def read_float(self):
+        return _FLOAT.unpack(self.read_fixed(4))[0]
+
+    def read_double(self):
+        return _DOUBLE.unpack(self.read_fixed(8))[0]
+
+    def read_utf8(self):
+        return self.read_bytes().decode('utf-8')
+
+
+class _ResolutionCompiler(object):
+    """Compiles the readers which resolve writer schemas with reader schemas,
+    and the skippers of the writer fields the reader schemas don't have.
+    Both are functions of a :class:`_PayloadDecoder`.
+
+    Only the given fields of the projected record schema are read, the other
+    ones are skipped.
+    """
+
+    def __init__(self, projected_schema=None, projected_fields=None):
+        self._projected_schema = projected_schema
+        self._projected_fields = projected_fields
+        # Records being compiled, to detect recursive schemas.
+        self._compiling_records = set()
+
+    def compile_reader(self, writer_schema, reader_schema):
+        _check_supported(writer_schema)
+        _check_supported(reader_schema)
+        if not avro.io.DatumReader.match_schemas(writer_schema, reader_schema):
+            return _fail_resolution
+        writer_type = writer_schema.type
+        if writer_type != 'union' and reader_schema.type == 'union':
+            for reader_branch in reader_schema.schemas:
+                if avro.io.DatumReader.match_schemas(writer_schema, reader_branch):
+                    return self.compile_reader(writer_schema, reader_branch)
+            return _fail_resolution
+        # Like the generic reader, values are read as the writer's type, and
+        # promoted values such as ints read as longs or doubles are returned
+        # as they were written.
+        if writer_type in _PRIMITIVE_READERS:
+            return _PRIMITIVE_READERS[writer_type]
+        if writer_type == 'fixed':
+            size = writer_schema.size
+            return lambda decoder: decoder.read_fixed(size)
+        if writer_type == 'enum':
+            return _compile_enum_reader(
+                writer_schema.symbols,
+                reader_schema.symbols
+            )
+        if writer_type == 'array':
+            return _compile_array_reader(self.compile_reader(
+                writer_schema.items,
+                reader_schema.items
+            ))
+        if writer_type == 'map':
+            return _compile_map_reader(self.compile_reader(
+                writer_schema.values,
+                reader_schema.values
+            ))
+        if writer_type == 'union':
+            return _compile_union_reader([
+                self.compile_reader(writer_branch, reader_schema)
+                for writer_branch in writer_schema.schemas
+            ])
+        if writer_type in ('record', 'error'):
+            with self._compiling_record(writer_schema, reader_schema):
+                return self._compile_record_reader(writer_schema, reader_schema)
+        raise UnsupportedSchemaError()
+
+    def compile_skipper(self, writer_schema):
+        _check_supported(writer_schema)
+        writer_type = writer_schema.type
+        if writer_type in _PRIMITIVE_SKIPPERS:
+            return _PRIMITIVE_SKIPPERS[writer_type]
+        if writer_type == 'fixed':
+            size = writer_schema.size
+            return lambda decoder: decoder.skip_fixed(size)
+        if writer_type == 'enum':
+            return lambda decoder: decoder.read_long()
+        if writer_type == 'array':
+            return _compile_blocks_skipper(
+                self.compile_skipper(writer_schema.items)
+            )
+        if writer_type == 'map':
+            return _compile_blocks_skipper(
+                _compile_map_entry_skipper(
+                    self.compile_skipper(writer_schema.values)
+                )
+            )
+        if writer_type == 'union':
+            return _compile_union_reader([
+                self.compile_skipper(writer_branch)
+                for writer_branch in writer_schema.schemas
+            ])
+        if writer_type in ('record', 'error'):
+            with self._compiling_record(writer_schema, None):
+                return _compile_record_skipper([
+                    self.compile_skipper(field.type)
+                    for field in writer_schema.fields
+                ])
+        raise UnsupportedSchemaError()
+
+    def _compile_record_reader(self, writer_schema, reader_schema):
+        reader_fields = reader_schema.fields_dict
+        writer_fields = writer_schema.fields_dict
+        projected_fields = reader_fields
+        if (
+            reader_schema is self._projected_schema and
+            self._projected_fields is not None
+        ):
+            # The fields left out of the projection are skipped, but still
+            # fail like the generic reader when they can't be resolved.
+            for name, field in reader_fields.iteritems():
+                if name in writer_fields:
+                    resolvable = avro.io.DatumReader.match_schemas(
+                        writer_fields[name].type,
+                        field.type
+                    )
+                else:
+                    resolvable = field.has_default
+                if not resolvable:
+                    return _fail_resolution
+            projected_fields = {
+                name: field for name, field in reader_fields.iteritems()
+                if name in self._projected_fields
+            }
+        field_readers = [
+            (field.name, self.compile_reader(
+                field.type,
+                projected_fields[field.name].type
+            ))
+            if field.name in projected_fields
+            else (None, self.compile_skipper(field.type))
+            for field in writer_schema.fields
+        ]
+        default_factories = []
+        for name, field in projected_fields.iteritems():
+            if name in writer_fields:
+                continue
+            if not field.has_default:
+                return _fail_resolution
+            try:
+                default_factories.append(
+                    (name, _compile_default_factory(field))
+                )
+            except Exception:
+                # The generic reader fails on each datum with this default.
+                return _fail_resolution
+        return _compile_record_reader(field_readers, default_factories)
+
+    def _compiling_record(self, writer_schema, reader_schema):
+        return _CompilingRecord(
+            self._compiling_records,
+            (
+                writer_schema.fullname,
+                reader_schema.fullname if reader_schema is not None else None
+            )
+        )
+
+
+class _CompilingRecord(object):
+    """Context manager which tracks the records being compiled, and raises
+    UnsupportedSchemaError when a record contains itself.
+    """
+
+    def __init__(self, compiling_records, record_key):
+        self.compiling_records = compiling_records
+        self.record_key = record_key
+
+    def __enter__(self):
+        if self.record_key in self.compiling_records:
+            raise UnsupportedSchemaError()
+        self.compiling_records.add(self.record_key)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.compiling_records.discard(self.record_key)
+
+
+def _check_supported(schema):
+    if (
+        isinstance(schema, avro.schema.LogicalSchema) or
+        schema.type in _UNSUPPORTED_TYPES
+    ):
+        raise UnsupportedSchemaError()
+
+
+def _fail_resolution(decoder):
+    raise _ResolutionError()
+
+
+def _compile_default_factory(field):
+    # The default is converted the same way as the generic reader, which
+    # returns new containers for each datum.
+    default = avro.io.DatumReader()._read_default_value(field.type, field.default)
+    if isinstance(default, (list, dict)):
+        return lambda: copy.deepcopy(default)
+    return lambda: default
+
+
+def _read_null(decoder):
+    return None
+
+
+def _skip_null(decoder):
+    pass
+
+
+_PRIMITIVE_READERS = {
+    'null': _read_null,
+    'boolean': lambda decoder: decoder.read_boolean(),
+    'int': lambda decoder: decoder.read_long(),
+    'long': lambda decoder: decoder.read_long(),
+    'float': lambda decoder: decoder.read_float(),
+    'double': lambda decoder: decoder.read_double(),
+    'bytes': lambda decoder: decoder.read_bytes(),
+    'string': lambda decoder: decoder.read_utf8()
+}
+
+_PRIMITIVE_SKIPPERS = {
+    'null': _skip_null,
+    'boolean': lambda decoder: decoder.skip_fixed(1),
+    'int': lambda decoder: decoder.read_long(),
+    'long': lambda decoder: decoder.read_long(),
+    'float': lambda decoder: decoder.skip_fixed(4),
+    'double': lambda decoder: decoder.skip_fixed(8),
+    'bytes': lambda decoder: decoder.skip_bytes(),
+    'string': lambda decoder: decoder.skip_bytes()
+}
+
+
+def _compile_enum_reader(writer_symbols, reader_symbols):
+    # Symbols the reader doesn't have are None, and fail to resolve.
+    resolved_symbols = [
+        symbol if symbol in reader_symbols else None
+        for symbol in writer_symbols
+    ]
+    symbol_count = len(resolved_symbols)
+
+    def read_enum(decoder):
+        index = decoder.read_long()
+        if index >= symbol_count:
+            raise _ResolutionError()
+        symbol = resolved_symbols[index]
+        if symbol is None:
+            raise _ResolutionError()
+        return symbol
+    return read_enum
+
+
+def _read_block_count(decoder):
+    block_count = decoder.read_long()
+    if block_count < 0:
+        # Negative counts are followed by the size of the block.
+        decoder.read_long()
+        return -block_count
+    return block_count
+
+
+def _compile_array_reader(read_item):
+    def read_array(decoder):
+        items = []
+        block_count = _read_block_count(decoder)
+        while block_count != 0:
+            for _ in xrange(block_count):
+                items.append(read_item(decoder))
+            block_count = _read_block_count(decoder)
+        return items
+    return read_array
+
+
+def _compile_map_reader(read_value):
+    def read_map(decoder):
+        entries = {}
+        block_count = _read_block_count(decoder)
+        while block_count != 0:
+            for _ in xrange(block_count):
+                key = decoder.read_utf8()
+                entries[key] = read_value(decoder)
+            block_count = _read_block_count(decoder)
+        return entries
+    return read_map
+
+
+def _compile_union_reader(branch_readers):
+    branch_count = len(branch_readers)
+
+    def read_union(decoder):
+        index = decoder.read_long()
+        if index >= branch_count:
+            raise _ResolutionError()
+        return branch_readers[index](decoder)
+    return read_union
+
+
+def _compile_record_reader(field_readers, default_factories):
+    def read_record(decoder):
+        record = {}
+        for name, read in field_readers:
+            value = read(decoder)
+            if name is not None:
+                record[name] = value
+        for name, create_default in default_factories:
+            record[name] = create_default()
+        return record
+    return read_record
+
+
+def _compile_blocks_skipper(skip_item):
+    def skip_blocks(decoder):
+        block_count = decoder.read_long()
+        while block_count != 0:
+            if block_count < 0:
+                # The size of the block lets it be skipped as a whole.
+                block_size = decoder.read_long()
+                if block_size < 0:
+                    raise _ResolutionError()
+                decoder.skip_fixed(block_size)
+            else:
+                for _ in xrange(block_count):
+                    skip_item(decoder)
+            block_count = decoder.read_long()
+    return skip_blocks
+
+
+def _compile_map_entry_skipper(skip_value):
+    def skip_map_entry(decoder):
+        decoder.skip_bytes()
+        skip_value(decoder)
+    return skip_map_entry
+
+
+def _compile_record_skipper(field_skippers):
+    def skip_record(decoder):
+        for skip in field_skippers:
+            skip(decoder)
+    return skip_record
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+This module compiles avro schemas into encoders, trees of closures built once
+per schema which encode data the same way as the generic avro writer, byte
+for byte, without walking the schema for each datum.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import struct
+
+import avro.schema
+from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
+
+from data_pipeline._envelope_codec import _encode_long
+
+
+_INT_MIN_VALUE = -(1 << 31)
+_INT_MAX_VALUE = (1 << 31) - 1
+_LONG_MIN_VALUE = -(1 << 63)
+_LONG_MAX_VALUE = (1 << 63) - 1
+
+# The generic writer packs floats big-endian and writes the bytes in reverse
+# order, which is the same as packing them little-endian.
+_FLOAT = struct.Struct(str('<f'))
+_DOUBLE = struct.Struct(str('<d'))
+
+_FALSE = b'\x00'
+_TRUE = b'\x01'
+_END_OF_BLOCKS = b'\x00'
+
+
+class UnsupportedSchemaError(Exception):
+    """Raised when a schema can't be compiled, e.g. because it uses logical
+    types or is recursive.  The generic avro writer should be used instead.
+    """
+    pass
+
+
+class _InvalidDatumError(Exception):
+    """Raised when a datum doesn't match the compiled schema, so the generic
+    avro writer can raise its usual error for it.
+    """
+    pass
+
+
+# Errors after which a datum is encoded again with the generic writer, which
+# either raises the same error as without compiled encoders or encodes it.
+_FALLBACK_ERRORS = (
+    _InvalidDatumError,
+    OverflowError,
+    TypeError,
+    ValueError,
+    struct.error
+)
+
+
+class CompiledAvroStringWriter(AvroStringWriter):
+    """AvroStringWriter which encodes data with an encoder compiled for its
+    schema, and produces the same bytes as the generic avro writer.
+
+    Schemas that can't be compiled, and data that doesn't match the schema,
+    are handled by the generic writer, so invalid data fails the same way.
+    """
+
+    def __init__(self, schema):
+        super(CompiledAvroStringWriter, self).__init__(schema)
+        try:
+            self._compiled_encode = compile_encoder(self.schema)
+        except UnsupportedSchemaError:
+            self._compiled_encode = None
+
+    def encode(self, message_avro_representation):
+        if self._compiled_encode is not None:
+            try:
+                return self._compiled_encode(message_avro_representation)
+            except _FALLBACK_ERRORS:
+                pass
+        return super(CompiledAvroStringWriter, self).encode(
+            message_avro_representation
+        )
+
+
+def compile_encoder(schema):
+    """Compiles an encoder for the given schema.
+
+    Args:
+        schema (avro.schema.Schema): schema of the data to encode.
+
+    Returns:
+        function: encodes a datum matching the schema to bytes, like
+            :meth:`AvroStringWriter.encode`.  It raises an error if the datum
+            doesn't match the schema, which isn't necessarily the same as the
+            error of the generic writer.
+
+    Raises:
+        UnsupportedSchemaError: if the schema can't be compiled.
+    """
+    write = _SchemaCompiler().compile_writer(schema)
+
+    def encode(datum):
+        chunks = []
+        write(datum, chunks.append)
+        return b''.join(chunks)
+
+    return encode
+
+
+class _SchemaCompiler(object):
+    """Compiles the writers of a schema and the validators that resolve its
+    unions.  Writers are functions which append the encoding of a datum with
+    the given `append` function, and validators are functions which tell
+    whether a datum matches a schema, exactly like `avro.io.validate`.
+    """
+
+    def __init__(self):
+        # Names of the records being compiled, to detect recursive schemas.
+        self._compiling_records = set()
+
+    def compile_writer(self, schema):
+        if isinstance(schema, avro.schema.LogicalSchema):
+            raise UnsupportedSchemaError()
+        schema_type = schema.type
+        if schema_type in _PRIMITIVE_WRITERS:
+            return _PRIMITIVE_WRITERS[schema_type]
+        if schema_type == 'fixed':
+            return _compile_fixed_writer(schema.size)
+        if schema_type == 'enum':
+            return _compile_enum_writer(schema.symbols)
+        if schema_type == 'array':
+            return _compile_array_writer(self.compile_writer(schema.items))
+        if schema_type == 'map':
+            return _compile_map_writer(self.compile_writer(schema.values))
+        if schema_type == 'union':
+            return _compile_union_writer([
+                (self.compile_validator(branch), self.compile_writer(branch))
+                for branch in schema.schemas
+            ])
+        if schema_type in ('record', 'error'):
+            with self._compiling_record(schema):
+                return _compile_record_writer([
+                    (field.name, self.compile_writer(field.type))
+                    for field in schema.fields
+                ])
+        raise UnsupportedSchemaError()
+
+    def compile_validator(self, schema):
+        if isinstance(schema, avro.schema.LogicalSchema):
+            raise UnsupportedSchemaError()
+        schema_type = schema.type
+        if schema_type in _PRIMITIVE_VALIDATORS:
+            return _PRIMITIVE_VALIDATORS[schema_type]
+        if schema_type == 'fixed':
+            size = schema.size
+            return lambda datum: isinstance(datum, str) and len(datum) == size
+        if schema_type == 'enum':
+            symbols = schema.symbols
+            return lambda datum: datum in symbols
+        if schema_type == 'array':
+            is_valid_item = self.compile_validator(schema.items)
+            return lambda datum: isinstance(datum, list) and all(
+                is_valid_item(item) for item in datum
+            )
+        if schema_type == 'map':
+            is_valid_value = self.compile_validator(schema.values)
+            return lambda datum: isinstance(datum, dict) and all(
+                isinstance(key, basestring) for key in datum.iterkeys()
+            ) and all(is_valid_value(value) for value in datum.itervalues())
+        if schema_type == 'union':
+            branch_validators = [
+                self.compile_validator(branch) for branch in schema.schemas
+            ]
+            return lambda datum: any(
+                is_valid(datum) for is_valid in branch_validators
+            )
+        if schema_type in ('record', 'error'):
+            with self._compiling_record(schema):
+                field_validators = [
+                    (field.name, self.compile_validator(field.type))
+                    for field in schema.fields
+                ]
+            return lambda datum: isinstance(datum, dict) and all(
+                is_valid(datum.get(name)) for name, is_valid in field_validators
+            )
+        raise UnsupportedSchemaError()
+
+    def _compiling_record(self, schema):
+        return _CompilingRecord(self._compiling_records, schema.fullname)
+
+
+class _CompilingRecord(object):
+    """Context manager which tracks the records being compiled, and raises
+    UnsupportedSchemaError when a record contains itself.
+    """
+
+    def __init__(self, compiling_records, record_name):
+        self.compiling_records = compiling_records
+        self.record_name = record_name
+
+    def __enter__(self):
+        if self.record_name in self.compiling_records:
+            raise UnsupportedSchemaError()
+        self.compiling_records.add(self.record_name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.compiling_records.discard(self.record_name)
+
+
+def _write_null(datum, append):
+    if datum is not None:
+        raise _InvalidDatumError()
+
+
+def _write_boolean(datum, append):
+    if not isinstance(datum, bool):
+        raise _InvalidDatumError()
+    append(_TRUE if datum else _FALSE)
+
+
+def _write_int(datum, append):
+    if (
+        not isinstance(datum, (int, long)) or
+        not _INT_MIN_VALUE <= datum <= _INT_MAX_VALUE
+    ):
+        raise _InvalidDatumError()
+    append(_encode_long(datum))
+
+
+def _write_long(datum, append):
+    if (
+        not isinstance(datum, (int, long)) or
+        not _LONG_MIN_VALUE <= datum <= _LONG_MAX_VALUE
+    ):
+        raise _InvalidDatumError()
+    append(_encode_long(datum))
+
+
+def _write_float(datum, append):
+    if not isinstance(datum, (int, long, float)):
+        raise _InvalidDatumError()
+    append(_FLOAT.pack(datum))
+
+
+def _write_double(datum, append):
+    if not isinstance(datum, (int, long, float)):
+        raise _InvalidDatumError()
+    append(_DOUBLE.pack(datum))
+
+
+def _write_bytes(datum, append):
+    if not isinstance(datum, str):
+        raise _InvalidDatumError()
+    append(_encode_long(len(datum)))
+    append(datum)
+
+
+def _write_string(datum, append):
+    if not isinstance(datum, basestring):
+        raise _InvalidDatumError()
+    datum = datum.encode('utf-8')
+    append(_encode_long(len(datum)))
+    append(datum)
+
+
+_PRIMITIVE_WRITERS = {
+    'null': _write_null,
+    'boolean': _write_boolean,
+    'int': _write_int,
+    'long': _write_long,
+    'float': _write_float,
+    'double': _write_double,
+    'bytes': _write_bytes,
+    'string': _write_string
+}
+
+
+def _is_int(datum):
+    return (
+        isinstance(datum, (int, long)) and
+        _INT_MIN_VALUE <= datum <= _INT_MAX_VALUE
+    )
+
+
+def _is_long(datum):
+    return (
+        isinstance(datum, (int, long)) and
+        _LONG_MIN_VALUE <= datum <= _LONG_MAX_VALUE
+    )
+
+
+def _is_number(datum):
+    return isinstance(datum, (int, long, float))
+
+
+_PRIMITIVE_VALIDATORS = {
+    'null': lambda datum: datum is None,
+    'boolean': lambda datum: isinstance(datum, bool),
+    'int': _is_int,
+    'long': _is_long,
+    'float': _is_number,
+    'double': _is_number,
+    'bytes': lambda datum: isinstance(datum, str),
+    'string': lambda datum: isinstance(datum, basestring)
+}
+
+
+def _compile_fixed_writer(size):
+    def write_fixed(datum, append):
+        if not isinstance(datum, str) or len(datum) != size:
+            raise _InvalidDatumError()
+        append(datum)
+    return write_fixed
+
+
+def _compile_enum_writer(symbols):
+    symbol_encodings = {
+        symbol: _encode_long(index) for index, symbol in enumerate(symbols)
+    }
+
+    def write_enum(datum, append):
+        try:
+            append(symbol_encodings[datum])
+        except (KeyError, TypeError):
+            raise _InvalidDatumError()
+    return write_enum
+
+
+def _compile_array_writer(write_item):
+    def write_array(datum, append):
+        if not isinstance(datum, list):
+            raise _InvalidDatumError()
+        if datum:
+            append(_encode_long(len(datum)))
+            for item in datum:
+                write_item(item, append)
+        append(_END_OF_BLOCKS)
+    return write_array
+
+
+def _compile_map_writer(write_value):
+    def write_map(datum, append):
+        if not isinstance(datum, dict):
+            raise _InvalidDatumError()
+        if datum:
+            append(_encode_long(len(datum)))
+            for key, value in datum.iteritems():
+                _write_string(key, append)
+                write_value(value, append)
+        append(_END_OF_BLOCKS)
+    return write_map
+
+
+def _compile_union_writer(branches):
+    # The generic writer picks the last branch that matches the datum.
+    indexed_branches = [
+        (_encode_long(index), is_valid, write)
+        for index, (is_valid, write) in reversed(list(enumerate(branches)))
+    ]
+
+    def write_union(datum, append):
+        for index_encoding, is_valid, write in indexed_branches:
+            if is_valid(datum):
+                append(index_encoding)
+                write(datum, append)
+                return
+        raise _InvalidDatumError()
+    return write_union
+
+
+def _compile_record_writer(fields):
+    def write_record(datum, append):
+        if not isinstance(datum, dict):
+            raise _InvalidDatumError()
+        for name, write in fields:
+            write(datum.get(name), append)
+    return write_record
@@ -65,9 +65,12 @@ class _AVSCStore(object):
     __metaclass__ = Singleton
 
     def __init__(self):
-        self._schematizer = get_schematizer()
         self._schema_id_cache = {}
 
+    @property
+    def _schematizer(self):
+        return get_schematizer()
+
     def get_schema_id(self, avro_schema_info):
         key = avro_schema_info.id
         schema_id = self._schema_id_cache.get(key)
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+This module contains a codec specialized for the `envelope_v1.avsc` schema,
+which encodes and decodes envelopes the same way as the generic avro
+writer and reader, byte for byte, without walking the schema for each
+message.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+
+# Symbols of the `message_type` enum of the envelope schema, in order.
+MESSAGE_TYPE_SYMBOLS = (
+    'create',
+    'update',
+    'delete',
+    'refresh',
+    'heartbeat',
+    'monitor',
+    'registration',
+    'log'
+)
+
+_MESSAGE_TYPE_INDEXES = {
+    symbol: index for index, symbol in enumerate(MESSAGE_TYPE_SYMBOLS)
+}
+
+_INT_MIN_VALUE = -(1 << 31)
+_INT_MAX_VALUE = (1 << 31) - 1
+_UUID_SIZE = 16
+
+_BYTE_CHARS = [chr(value) for value in range(256)]
+
+# Encodings of the union branches of the optional fields.
+_NULL_BRANCH = _BYTE_CHARS[0]
+_VALUE_BRANCH = _BYTE_CHARS[2]
+_EMPTY_ARRAY_BLOCK = _BYTE_CHARS[0]
+
+
+class UnsupportedEnvelopeError(Exception):
+    """Raised when a datum or an encoded envelope can't be handled by this
+    codec, e.g. because it doesn't match the envelope schema.  The generic
+    avro writer or reader should be used instead, so the error is the same as
+    without this codec.
+    """
+    pass
+
+
+def encode_envelope(datum):
+    """Encodes the avro representation of a message with the envelope schema.
+
+    Args:
+        datum (dict): avro representation of the message, like
+            :attr:`data_pipeline.message.Message.avro_repr`.
+
+    Returns:
+        bytes: the same encoding as the generic avro writer.
+
+    Raises:
+        UnsupportedEnvelopeError: if the datum doesn't match the schema.
+    """
+    uuid = datum.get('uuid')
+    message_type_index = _MESSAGE_TYPE_INDEXES.get(datum.get('message_type'))
+    payload = datum.get('payload')
+    if (
+        not isinstance(uuid, str) or len(uuid) != _UUID_SIZE or
+        message_type_index is None or
+        not isinstance(payload, str)
+    ):
+        raise UnsupportedEnvelopeError()
+    chunks = [
+        uuid,
+        _BYTE_CHARS[message_type_index << 1],
+        _encode_int(datum.get('schema_id')),
+        _encode_long(len(payload)),
+        payload
+    ]
+    _append_optional_bytes(chunks, datum.get('previous_payload'))
+    _append_meta(chunks, datum.get('meta'))
+    _append_optional_string(chunks, datum.get('encryption_type'))
+    chunks.append(_encode_int(datum.get('timestamp')))
+    return b''.join(chunks)
+
+
+def decode_envelope(encoded_envelope):
+    """Decodes an envelope encoded with the envelope schema.
+
+    Args:
+        encoded_envelope (bytes): envelope, without the magic byte.
+
+    Returns:
+        dict: the same representation as the generic avro reader.
+
+    Raises:
+        UnsupportedEnvelopeError: if the envelope is truncated or malformed.
+    """
+    decoder = _EnvelopeDecoder(encoded_envelope)
+    try:
+        return {
+            'uuid': decoder.read_uuid(),
+            'message_type': decoder.read_message_type(),
+            'schema_id': decoder.read_long(),
+            'payload': decoder.read_bytes(),
+            'previous_payload': decoder.read_optional_bytes(),
+            'meta': decoder.read_meta(),
+            'encryption_type': decoder.read_optional_string(),
+            'timestamp': decoder.read_long()
+        }
+    except (IndexError, ValueError):
+        raise UnsupportedEnvelopeError()
+
+
+def peek_envelope(packed_envelope, fields):
+    """Decodes the given fields of an envelope, in schema order, and stops
+    after the last of them.  The fields before it are skipped without being
+    copied, so reading the leading fields doesn't depend on the size of the
+    payload.
+
+    Args:
+        packed_envelope (bytes): envelope, starting with the magic byte.
+        fields (set(str)): names of the fields to decode, from
+            :const:`ENVELOPE_FIELD_NAMES`.
+
+    Returns:
+        dict: the given fields, with the same values as the generic avro
+            reader.
+
+    Raises:
+        UnsupportedEnvelopeError: if the envelope is truncated or malformed.
+    """
+    decoder = _EnvelopePeekDecoder(packed_envelope, position=1)
+    remaining_fields = set(fields)
+    peeked_fields = {}
+    try:
+        for field, read_method, skip_method in _FIELD_DECODERS:
+            if not remaining_fields:
+                break
+            if field in remaining_fields:
+                peeked_fields[field] = getattr(decoder, read_method)()
+                remaining_fields.remove(field)
+            else:
+                getattr(decoder, skip_method)()
+    except (IndexError, ValueError):
+        raise UnsupportedEnvelopeError()
+    return peeked_fields
+
+
+def _encode_int(value):
+    if (
+        not isinstance(value, (int, long)) or
+        not _INT_MIN_VALUE <= value <= _INT_MAX_VALUE
+    ):
+        raise UnsupportedEnvelopeError()
+    return _encode_long(value)
+
+
+def _encode_long(value):
+    # Zig-zag encoded, 7 bits at a time from the least significant ones.
+    value = (value << 1) ^ (value >> 63)
+    if value < 0x80:
+        return _BYTE_CHARS[value]
+    chunks = []
+    while value > 0x7f:
+        chunks.append(_BYTE_CHARS[(value & 0x7f) | 0x80])
+        value >>= 7
+    chunks.append(_BYTE_CHARS[value])
+    return b''.join(chunks)
+
+
+def _append_optional_bytes(chunks, value):
+    if value is None:
+        chunks.append(_NULL_BRANCH)
+        return
+    if not isinstance(value, str):
+        raise UnsupportedEnvelopeError()
+    chunks.append(_VALUE_BRANCH)
+    chunks.append(_encode_long(len(value)))
+    chunks.append(value)
+
+
+def _append_optional_string(chunks, value):
+    if value is None:
+        chunks.append(_NULL_BRANCH)
+        return
+    if not isinstance(value, basestring):
+        raise UnsupportedEnvelopeError()
+    try:
+        value = value.encode('utf-8')
+    except UnicodeError:
+        raise UnsupportedEnvelopeError()
+    chunks.append(_VALUE_BRANCH)
+    chunks.append(_encode_long(len(value)))
+    chunks.append(value)
+
+
+def _append_meta(chunks, meta):
+    if meta is None:
+        chunks.append(_NULL_BRANCH)
+        return
+    if not isinstance(meta, list):
+        raise UnsupportedEnvelopeError()
+    chunks.append(_VALUE_BRANCH)
+    if meta:
+        chunks.append(_encode_long(len(meta)))
+        for meta_attr in meta:
+            if not isinstance(meta_attr, dict):
+                raise UnsupportedEnvelopeError()
+            payload = meta_attr.get('payload')
+            if not isinstance(payload, str):
+                raise UnsupportedEnvelopeError()
+            chunks.append(_encode_int(meta_attr.get('schema_id')))
+            chunks.append(_encode_long(len(payload)))
+            chunks.append(payload)
+    chunks.append(_EMPTY_ARRAY_BLOCK)
+
+
+class _EnvelopeDecoder(object):
+    """Reads the avro values of an encoded envelope in order."""
+
+    def __init__(self, encoded_envelope, position=0):
+        self.data = encoded_envelope
+        self.codes = bytearray(encoded_envelope)
+        self.position = position
+
+    def read_long(self):
+        codes = self.codes
+        position = self.position
+        code = codes[position]
+        position += 1
+        value = code & 0x7f
+        shift = 7
+        while code & 0x80:
+            code = codes[position]
+            position += 1
+            value |= (code & 0x7f) << shift
+            shift += 7
+        self.position = position
+        return (value >> 1) ^ -(value & 1)
+
+    def read_fixed(self, size):
+        end = self.position + size
+        if end > len(self.data):
+            raise IndexError()
+        value = self.data[self.position:end]
+        self.position = end
+        return value
+
+    def skip_fixed(self, size):
+        end = self.position + size
+        if end > len(self.data):
+            raise IndexError()
+        self.position = end
+
+    def read_bytes(self):
+        size = self.read_long()
+        if size < 0:
+            raise ValueError()
+        return self.read_fixed(size)
+
+    def skip_bytes(self):
+        size = self.read_long()
+        if size < 0:
+            raise ValueError()
+        self.skip_fixed(size)
+
+    def read_uuid(self):
+        return self.read_fixed(_UUID_SIZE)
+
+    def skip_uuid(self):
+        self.skip_fixed(_UUID_SIZE)
+
+    def read_union_branch(self):
+        branch = self.read_long()
+        if branch not in (0, 1):
+            raise ValueError()
+        return branch
+
+    def read_message_type(self):
+        index = self.read_long()
+        if not 0 <= index < len(MESSAGE_TYPE_SYMBOLS):
+            raise ValueError()
+        return MESSAGE_TYPE_SYMBOLS[index]
+
+    def read_optional_bytes(self):
+        if self.read_union_branch() == 0:
+            return None
+        return self.read_bytes()
+
+    def skip_optional_bytes(self):
+        if self.read_union_branch() == 1:
+            self.skip_bytes()
+
+    def read_optional_string(self):
+        if self.read_union_branch() == 0:
+            return None
+        return self.read_bytes().decode('utf-8')
+
+    def read_meta(self):
+        if self.read_union_branch() == 0:
+            return None
+        meta = []
+        block_count = self.read_long()
+        while block_count != 0:
+            if block_count < 0:
+                # Negative counts are followed by the size of the block.
+                block_count = -block_count
+                self.read_long()
+            for _ in xrange(block_count):
+                meta.append({
+                    'schema_id': self.read_long(),
+                    'payload': self.read_bytes()
+                })
+            block_count = self.read_long()
+        return meta
+
+    def skip_meta(self):
+        if self.read_union_branch() == 0:
+            return
+        block_count = self.read_long()
+        while block_count != 0:
+            if block_count < 0:
+                # The size of the block lets it be skipped as a whole.
+                block_size = self.read_long()
+                if block_size < 0:
+                    raise ValueError()
+                self.skip_fixed(block_size)
+            else:
+                for _ in xrange(block_count):
+                    self.read_long()
+                    self.skip_bytes()
+            block_count = self.read_long()
+
+
+class _EnvelopePeekDecoder(_EnvelopeDecoder):
+    """Reads the avro values of an envelope directly from its bytes, so the
+    envelope isn't copied when only a few of its values are needed.
+    """
+
+    def __init__(self, encoded_envelope, position=0):
+        self.data = encoded_envelope
+        self.position = position
+
+    def read_long(self):
+        data = self.data
+        position = self.position
+        code = ord(data[position])
+        position += 1
+        value = code & 0x7f
+        shift = 7
+        while code & 0x80:
+            code = ord(data[position])
+            position += 1
+            value |= (code & 0x7f) << shift
+            shift += 7
+        self.position = position
+        return (value >> 1) ^ -(value & 1)
+
+
+# Names of the decoder methods that read and skip each field of the envelope
+# schema, in order.
+_FIELD_DECODERS = (
+    ('uuid', 'read_uuid', 'skip_uuid'),
+    ('message_type', 'read_message_type', 'read_message_type'),
+    ('schema_id', 'read_long', 'read_long'),
+    ('payload', 'read_bytes', 'skip_bytes'),
+    ('previous_payload', 'read_optional_bytes', 'skip_optional_bytes'),
+    ('meta', 'read_meta', 'skip_meta'),
+    ('encryption_type', 'read_optional_string', 'skip_optional_bytes'),
+    ('timestamp', 'read_long', 'read_long')
+)
+
+# Names of the fields of the envelope schema, in order.
+ENVELOPE_FIELD_NAMES = tuple(field for field, _, _ in _FIELD_DECODERS)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+This module contains the pool of kafka clients shared by the producers,
+consumers and tools of a process.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import threading
+
+from kafka import KafkaClient
+
+from data_pipeline.config import get_config
+
+
+class _PooledKafkaClient(object):
+    """A kafka client of the pool, with the number of references to it."""
+
+    def __init__(self, broker_list):
+        self.kafka_client = KafkaClient(broker_list)
+        self.lock = threading.RLock()
+        self.reference_count = 0
+
+
+class SharedKafkaClient(object):
+    """Reference to a kafka client shared with the other components of the
+    process using the same cluster.  It can be used as a
+    :class:`kafka.client.KafkaClient`, which isn't thread-safe, so the calls
+    made through the shared clients of the same cluster are serialized.
+
+    Closing it only gives up the reference.  The kafka client is closed once
+    all the references to it are closed.
+    """
+
+    def __init__(self, pool_key, pooled_client):
+        self._pool_key = pool_key
+        self._pooled_client = pooled_client
+        self._is_closed = False
+
+    def __getattr__(self, name):
+        attribute = getattr(self._pooled_client.kafka_client, name)
+        if not callable(attribute):
+            return attribute
+        lock = self._pooled_client.lock
+
+        def call_with_lock(*args, **kwargs):
+            with lock:
+                return attribute(*args, **kwargs)
+        return call_with_lock
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        _release_kafka_client(self._pool_key, self._pooled_client)
+
+
+_pool_lock = threading.Lock()
+_broker_list_to_pooled_client = {}
+_pool_pid = None
+
+
+def get_kafka_client(broker_list):
+    """Returns a kafka client for the cluster with the given brokers.
+
+    When `share_kafka_clients` is set, it's a
+    :class:`SharedKafkaClient`, so the process holds a single set of broker
+    connections and a single metadata cache per cluster.  A forked child
+    process gets its own clients rather than reusing the connections of its
+    parent.  Otherwise it's a new :class:`kafka.client.KafkaClient`.
+
+    Either way, the returned client should be closed when it's no longer used.
+    """
+    if not get_config().share_kafka_clients:
+        return KafkaClient(broker_list)
+    global _pool_pid
+    pool_key = _get_pool_key(broker_list)
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _broker_list_to_pooled_client.clear()
+            _pool_pid = os.getpid()
+        pooled_client = _broker_list_to_pooled_client.get(pool_key)
+        if pooled_client is None:
+            pooled_client = _PooledKafkaClient(broker_list)
+            _broker_list_to_pooled_client[pool_key] = pooled_client
+        pooled_client.reference_count += 1
+    return SharedKafkaClient(pool_key, pooled_client)
+
+
+def _release_kafka_client(pool_key, pooled_client):
+    with _pool_lock:
+        pooled_client.reference_count -= 1
+        if pooled_client.reference_count > 0:
+            return
+        if _broker_list_to_pooled_client.get(pool_key) is pooled_client:
+            del _broker_list_to_pooled_client[pool_key]
+    with pooled_client.lock:
+        pooled_client.kafka_client.close()
+
+
+def _get_pool_key(broker_list):
+    if isinstance(broker_list, (list, tuple)):
+        return tuple(sorted(broker_list))
+    return broker_list
@@ -23,24 +23,61 @@ from contextlib import contextmanager
 
 from cached_property import cached_property
 from kafka import create_message
-from kafka import KafkaClient
-from kafka.common import ProduceRequest
+from kafka.codec import has_snappy
+from kafka.protocol import create_message_set
 
+from data_pipeline._kafka_client_pool import get_kafka_client
+from data_pipeline._kafka_util import get_topic_partitions
 from data_pipeline._position_data_tracker import PositionDataTracker
+from data_pipeline._producer_memory_budget import get_producer_memory_budget
+from data_pipeline._producer_retry import _ProduceRequest
+from data_pipeline._producer_retry import _TopicPartition
 from data_pipeline._producer_retry import RetryHandler
 from data_pipeline._retry_util import ExpBackoffPolicy
 from data_pipeline._retry_util import MaxRetryError
 from data_pipeline._retry_util import Predicate
 from data_pipeline._retry_util import retry_on_condition
 from data_pipeline._retry_util import RetryPolicy
+from data_pipeline.compression_codec import CompressionCodecEnum
 from data_pipeline.config import get_config
 from data_pipeline.envelope import Envelope
+from data_pipeline.partitioner import KeyHashPartitioner
 
 
 _EnvelopeAndMessage = namedtuple("_EnvelopeAndMessage", ["envelope", "message"])
 logger = get_config().logger
 
 
+# Bytes of the offset, size, crc, magic byte, attributes and key and value
+# lengths that kafka adds to each message.
+_KAFKA_MESSAGE_OVERHEAD_BYTES = 26
+
+
+# Messages are wrapped into compressed message sets of at most this many bytes
+# before compression, so each compressed set stays below the default
+# `message.max.bytes` of the brokers.
+_MAX_COMPRESSED_MESSAGE_SET_BYTES = 1000000
+
+
+def _get_message_bytes(kafka_message):
+    return (
+        _KAFKA_MESSAGE_OVERHEAD_BYTES +
+        len(kafka_message.key or b'') +
+        len(kafka_message.value or b'')
+    )
+
+
+def _remove_published_messages(message_buffer, topic_partition, message_count):
+    """Removes the first messages of the topic partition, once they're
+    published, so they aren't sent again if the rest of the buffer is retried.
+    """
+    messages = message_buffer[topic_partition]
+    assert message_count <= len(messages)
+    del messages[:message_count]
+    if not messages:
+        message_buffer.pop(topic_partition)
+
+
 # prepare needs to be in the module top level so it can be serialized for
 # multiprocessing
 def _prepare(envelope_and_message):
@@ -68,15 +105,34 @@ class KafkaProducer(object):
             information of successfully published messages.
         dry_run (Optional[bool]): When dry_run mode is on, the producer won't
             talk to real KafKa topic, nor to real Schematizer.  Default to False.
+        partitioner (Optional[data_pipeline.partitioner.Partitioner]): Decides
+            which partition each message of a topic with several partitions is
+            published to.  Default to
+            :class:`data_pipeline.partitioner.KeyHashPartitioner`.
+        compression_codec (Optional[data_pipeline.compression_codec.CompressionCodecEnum]):
+            How the messages of each topic partition are compressed when
+            they're published.  Default to
+            :attr:`data_pipeline.compression_codec.CompressionCodecEnum.none`.
     """
     @cached_property
     def envelope(self):
         return Envelope()
 
-    def __init__(self, producer_position_callback, dry_run=False):
+    def __init__(
+        self,
+        producer_position_callback,
+        dry_run=False,
+        partitioner=None,
+        compression_codec=CompressionCodecEnum.none
+    ):
+        if compression_codec == CompressionCodecEnum.snappy and not has_snappy():
+            raise ValueError("The snappy codec requires python-snappy.")
         self.producer_position_callback = producer_position_callback
         self.dry_run = dry_run
-        self.kafka_client = KafkaClient(get_config().cluster_config.broker_list)
+        self.partitioner = partitioner or KeyHashPartitioner()
+        self.compression_codec = compression_codec
+        self._topic_to_partitions = {}
+        self.kafka_client = get_kafka_client(get_config().cluster_config.broker_list)
         self.position_data_tracker = PositionDataTracker()
         self._reset_message_buffer()
         self.skip_messages_with_pii = get_config().skip_messages_with_pii
@@ -89,7 +145,8 @@ class KafkaProducer(object):
     @contextmanager
     def disable_automatic_flushing(self):
         """Prevents the producer from flushing automatically (e.g. for timeouts
-        or batch size) while the context manager is open.
+        or batch size) while the context manager is open.  The buffer is still
+        flushed, synchronously, when messages don't fit in the memory budget.
         """
         try:
             self._automatic_flush_enabled = False
@@ -104,7 +161,25 @@ class KafkaProducer(object):
         # if we haven't woken up in a while, we may need to flush messages
         self._flush_if_necessary()
 
-    def publish(self, message):
+    def publish(self, message, topic_partition=None):
+        """Adds the message to the buffer.
+
+        Args:
+            message (data_pipeline.message.Message): message to publish
+            topic_partition (Optional[_TopicPartition]): Topic partition the
+                message is published to, as returned by
+                :meth:`get_topic_partition` for it.  It's looked up if not
+                given.  Callers which already looked it up must pass it in,
+                since the partitioner may pick a different partition each
+                time for messages without keys.
+        """
+        if self._should_skip_message(message):
+            return
+        self._add_message_to_buffer(message, topic_partition)
+        self.position_data_tracker.record_message_buffered(message)
+        self._flush_if_necessary()
+
+    def _should_skip_message(self, message):
         if message.contains_pii and self.skip_messages_with_pii:
             logger.info(
                 "Skipping a PII message - "
@@ -118,21 +193,37 @@ class KafkaProducer(object):
                     message.message_type.name
                 )
             )
-            return
-        self._add_message_to_buffer(message)
-        self.position_data_tracker.record_message_buffered(message)
-        self._flush_if_necessary()
+            return True
+        return False
 
     def flush_buffered_messages(self):
-        produce_method = (self._publish_produce_requests_dry_run
-                          if self.dry_run else self._publish_produce_requests)
-        produce_method(self._generate_produce_requests())
+        self._publish_buffered_messages()
         self._reset_message_buffer()
 
+    def discard_buffered_messages(self):
+        """Drops the buffered messages without publishing them, giving back
+        the memory they hold.  The position data tracker still counts them as
+        unpublished, so it's up to the caller to roll it back.
+        """
+        get_producer_memory_budget().release(self.message_buffer_bytes)
+        self.start_time = time.time()
+        self.message_buffer = defaultdict(list)
+        self.message_buffer_size = 0
+        self.message_buffer_bytes = 0
+
     def close(self):
-        self.flush_buffered_messages()
+        try:
+            self.flush_buffered_messages()
+        finally:
+            self._release_unpublished_memory()
         self.kafka_client.close()
 
+    def _publish_buffered_messages(self):
+        produce_method = (self._publish_produce_requests_dry_run
+                          if self.dry_run else self._publish_produce_requests)
+        for requests in self._generate_produce_requests():
+            produce_method(requests)
+
     def _publish_produce_requests(self, requests):
         """It will try to publish all the produce requests for topics, and
         retry a number of times until either all the requests are successfully
@@ -175,7 +266,7 @@ class KafkaProducer(object):
 
         retry_handler.update_requests_to_be_sent(
             responses,
-            self.position_data_tracker.topic_to_kafka_offset_map
+            self.position_data_tracker.topic_to_partition_offset_map
         )
         self._record_success_requests(retry_handler.success_topic_stats_map)
         return retry_handler
@@ -200,14 +291,17 @@ class KafkaProducer(object):
 
     def _record_success_requests(self, success_topic_stats_map):
         for topic_partition, stats in success_topic_stats_map.iteritems():
-            topic = topic_partition.topic_name
-            assert stats.message_count == len(self.message_buffer[topic])
             self.position_data_tracker.record_messages_published(
-                topic=topic,
+                topic=topic_partition.topic_name,
                 offset=stats.original_offset,
-                message_count=stats.message_count
+                message_count=stats.message_count,
+                partition=topic_partition.partition
+            )
+            _remove_published_messages(
+                self.message_buffer,
+                topic_partition,
+                stats.message_count
             )
-            self.message_buffer.pop(topic)
 
     def _publish_produce_requests_dry_run(self, requests):
         for request in requests:
@@ -215,36 +309,178 @@ class KafkaProducer(object):
 
     def _publish_single_request_dry_run(self, request):
         topic = request.topic
-        message_count = len(request.messages)
+        message_count = request.message_count
         self.position_data_tracker.record_messages_published(
             topic,
             -1,
-            message_count
+            message_count,
+            request.partition
+        )
+
+    def is_buffer_full(self):
+        """Whether the buffer holds as many messages, or bytes, as are
+        published at once, regardless of whether automatic flushing is enabled.
+        """
+        return (
+            self.message_buffer_size >= get_config().kafka_producer_buffer_size or
+            self.message_buffer_bytes >= get_config().kafka_producer_buffer_bytes
         )
 
     def _is_ready_to_flush(self):
         time_limit = get_config().kafka_producer_flush_time_limit_seconds
         return (self._automatic_flush_enabled and (
             (time.time() - self.start_time) >= time_limit or
-            self.message_buffer_size >= get_config().kafka_producer_buffer_size
+            self.is_buffer_full()
         ))
 
+    def _reserve_buffer_memory(self, message_bytes):
+        """Reserves the bytes of a message to be buffered in the producer
+        memory budget, flushing the buffer first to give back the memory it
+        holds if they don't fit.
+        """
+        memory_budget = get_producer_memory_budget()
+        if memory_budget.try_reserve(message_bytes):
+            return
+        if self.message_buffer_size > 0:
+            if self._automatic_flush_enabled:
+                self._flush_to_release_memory()
+            else:
+                # Waiting on the budget would only time out when the memory
+                # is held by this buffer, so it's published, and only returns
+                # once the position data tracker is quiet again.
+                self.flush_buffered_messages()
+        memory_budget.reserve(
+            message_bytes,
+            get_config().kafka_producer_memory_budget_timeout_seconds
+        )
+
+    def _flush_to_release_memory(self):
+        self.flush_buffered_messages()
+
+    def _get_message_bytes(self, prepared_message):
+        return _get_message_bytes(prepared_message)
+
     def _flush_if_necessary(self):
         if self._is_ready_to_flush():
             self.flush_buffered_messages()
 
-    def _add_message_to_buffer(self, message):
-        topic = message.topic
+    def _add_message_to_buffer(self, message, topic_partition=None):
+        if topic_partition is None:
+            topic_partition = self.get_topic_partition(message)
         message = self._prepare_message(message)
+        message_bytes = self._get_message_bytes(message)
+        self._reserve_buffer_memory(message_bytes)
 
-        self.message_buffer[topic].append(message)
+        self.message_buffer[topic_partition].append(message)
         self.message_buffer_size += 1
+        self.message_buffer_bytes += message_bytes
+
+    def get_topic_partition(self, message):
+        """Returns the topic and partition the message is published to."""
+        topic = message.topic
+        partitions = self._get_partitions(topic)
+        if len(partitions) == 1:
+            return _TopicPartition(topic, partitions[0])
+        return _TopicPartition(
+            topic,
+            self.partitioner.partition(message, partitions)
+        )
+
+    def _get_partitions(self, topic):
+        # Partitions are only looked up once per topic, so the messages of a
+        # key keep going to the same partition for the life of the producer.
+        partitions = self._topic_to_partitions.get(topic)
+        if partitions is None:
+            partitions = self._load_partitions(topic)
+            if not partitions:
+                # The topic doesn't exist yet, or its metadata couldn't be
+                # loaded.  A topic created by publishing into it starts with
+                # partition 0, and the partitions are looked up again for the
+                # next message, so a transient error doesn't pin the topic to
+                # partition 0.
+                return [0]
+            self._topic_to_partitions[topic] = partitions
+        return partitions
+
+    def _load_partitions(self, topic):
+        if self.dry_run:
+            return [0]
+        return get_topic_partitions(self.kafka_client, topic)
 
     def _generate_produce_requests(self):
-        return [
-            ProduceRequest(topic=topic, partition=0, messages=messages)
-            for topic, messages in self._generate_prepared_topic_and_messages()
-        ]
+        """Returns the produce requests of the buffered messages, in groups
+        which are each sent to kafka at once.  The messages of a topic
+        partition are split across groups when needed, so a group holds at
+        most `kafka_producer_max_request_bytes`, unless it's a single message.
+        """
+        max_request_bytes = get_config().kafka_producer_max_request_bytes
+        request_groups = []
+        requests = []
+        request_bytes = 0
+        for topic_partition, messages in self._generate_prepared_topic_and_messages():
+            start = 0
+            for index, message in enumerate(messages):
+                message_bytes = _get_message_bytes(message)
+                if request_bytes > 0 and request_bytes + message_bytes > max_request_bytes:
+                    if index > start:
+                        requests.append(self._create_produce_request(
+                            topic_partition,
+                            messages[start:index]
+                        ))
+                        start = index
+                    request_groups.append(requests)
+                    requests = []
+                    request_bytes = 0
+                request_bytes += message_bytes
+            if start < len(messages):
+                requests.append(self._create_produce_request(
+                    topic_partition,
+                    messages[start:]
+                ))
+        if requests:
+            request_groups.append(requests)
+        return request_groups
+
+    def _create_produce_request(self, topic_partition, messages):
+        return _ProduceRequest(
+            topic=topic_partition.topic_name,
+            partition=topic_partition.partition,
+            messages=self._compress_messages(messages),
+            message_count=len(messages)
+        )
+
+    def _compress_messages(self, messages):
+        """Wraps the messages into compressed message sets with the
+        compression codec of the producer.  Kafka assigns offsets to the
+        messages inside the sets, so the published offsets and message counts
+        are the same as without compression.
+        """
+        if self.compression_codec == CompressionCodecEnum.none:
+            return messages
+        compressed_messages = []
+        message_set = []
+        message_set_bytes = 0
+        for message in messages:
+            message_bytes = _get_message_bytes(message)
+            if (
+                message_set and
+                message_set_bytes + message_bytes > _MAX_COMPRESSED_MESSAGE_SET_BYTES
+            ):
+                compressed_messages.append(self._compress_message_set(message_set))
+                message_set = []
+                message_set_bytes = 0
+            message_set.append(message)
+            message_set_bytes += message_bytes
+        if message_set:
+            compressed_messages.append(self._compress_message_set(message_set))
+        return compressed_messages
+
+    def _compress_message_set(self, messages):
+        compressed_message, = create_message_set(
+            [(message.value, message.key) for message in messages],
+            codec=self.compression_codec.value
+        )
+        return compressed_message
 
     def _generate_prepared_topic_and_messages(self):
         return self.message_buffer.iteritems()
@@ -252,19 +488,36 @@ class KafkaProducer(object):
     def _prepare_message(self, message):
         return _prepare(_EnvelopeAndMessage(envelope=self.envelope, message=message))
 
+    def _release_unpublished_memory(self):
+        # Only left when publishing failed, and the producer can't be used
+        # anymore, so other producers of the process can have the memory.
+        get_producer_memory_budget().release(self.message_buffer_bytes)
+        self.message_buffer_bytes = 0
+
     def _reset_message_buffer(self):
         if not hasattr(self, 'message_buffer_size') or self.message_buffer_size > 0:
             self.producer_position_callback(self.position_data_tracker.get_position_data())
+            get_producer_memory_budget().release(
+                getattr(self, 'message_buffer_bytes', 0)
+            )
         self.start_time = time.time()
         self.message_buffer = defaultdict(list)
         self.message_buffer_size = 0
+        self.message_buffer_bytes = 0
 
 
 class LoggingKafkaProducer(KafkaProducer):
     def _publish_produce_requests(self, requests):
         logger.info(
-            "Flushing buffered messages - requests={0}, messages={1}".format(
-                len(requests), self.message_buffer_size
+            "Flushing buffered messages - requests={0}, messages={1}, "
+            "bytes={2}".format(
+                len(requests),
+                sum(request.message_count for request in requests),
+                sum(
+                    _get_message_bytes(message)
+                    for request in requests
+                    for message in request.messages
+                )
             )
         )
         try:
@@ -283,6 +536,6 @@ class LoggingKafkaProducer(KafkaProducer):
     def _publish_single_request_dry_run(self, request):
         super(LoggingKafkaProducer, self)._publish_single_request_dry_run(request)
         logger.debug("dry_run mode: Would have published {0} messages to {1}".format(
-            len(request.messages),
+            request.message_count,
             request.topic
         ))
@@ -16,31 +16,59 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from kafka.common import LeaderNotAvailableError
+from kafka.common import OffsetRequest
+from kafka.common import TopicAndPartition
+from kafka.common import UnknownTopicOrPartitionError
+from kafka.util import kafka_bytestring
 from kafka_utils.util.offsets import get_topics_watermarks
 
 
+def get_topic_partitions(kafka_client, topic):
+    """Get the ids of the partitions of the topic, loading the metadata of the
+    topic if the client doesn't have it yet.
+
+    Args:
+        kafka_client (kafka.client.KafkaClient): kafka client
+        topic (str): topic name
+
+    Returns:
+        [int]: Sorted ids of the partitions of the topic, or an empty list if
+            the topic doesn't exist yet or its metadata can't be loaded.
+    """
+    if not kafka_client.has_metadata_for_topic(topic):
+        try:
+            kafka_client.load_metadata_for_topics(topic)
+        except Exception:
+            return []
+    return kafka_client.get_partition_ids_for_topic(topic)
+
+
 def get_actual_published_messages_count(
     kafka_client,
     topics,
-    topic_tracked_offset_map,
+    topic_to_partition_offset_map,
     raise_on_error=True,
 ):
-    """Get the actual number of published messages of specified topics.
+    """Get the actual number of published messages of each partition of
+    specified topics.
 
     Args:
         kafka_client (kafka.client.KafkaClient): kafka client
         topics ([str]): List of topic names to get message count
-        topic_tracked_offset_map (dict(str, int)): dictionary which
-            contains each topic and its current stored offset value.
+        topic_to_partition_offset_map (dict(str, dict(int, int))): dictionary
+            which contains the current stored offset value of each partition
+            of each topic.  Partitions without a stored offset are counted
+            from offset 0.
         raise_on_error (Optional[bool]): if False,  the function ignores
             missing topics and missing partitions. It still may fail on
             the request send.  Default to True.
 
     Returns:
-        dict(str, int): Each topic and its actual published messages count
-            since last offset.  If a topic or partition is missing when
-            `raise_on_error` is False, the returned dict will not contain
-            the missing topic.
+        dict(str, dict(int, int)): Each topic and the actual published messages
+            count of each of its partitions since last offset.  If a topic or
+            partition is missing when `raise_on_error` is False, the returned
+            dict will not contain the missing topic.
 
     Raises:
         :class:`~yelp_kafka.error.UnknownTopic`: upon missing topics and
@@ -57,8 +85,102 @@ def get_actual_published_messages_count(
 
     topic_to_published_msgs_count = {}
     for topic, partition_offsets in topic_watermarks.iteritems():
-        high_watermark = partition_offsets[0].highmark
-        offset = topic_tracked_offset_map.get(topic, 0)
-        topic_to_published_msgs_count[topic] = high_watermark - offset
+        partition_to_offset_map = topic_to_partition_offset_map.get(topic, {})
+        topic_to_published_msgs_count[topic] = {
+            partition: offsets.highmark - partition_to_offset_map.get(partition, 0)
+            for partition, offsets in partition_offsets.iteritems()
+        }
 
     return topic_to_published_msgs_count
+
+
+def get_high_watermarks(kafka_client, topic_partitions):
+    """Get the high watermark of each of the given topic partitions, isolating
+    the errors of each of them.
+
+    Unlike `get_topics_watermarks`, which fails all the topics if any
+    partition leader is not available, the metadata of all the topics is
+    refreshed with a single request, and the high watermarks are fetched with
+    a single offset request per leader broker, which the kafka client sends to
+    the brokers concurrently.
+
+    Args:
+        kafka_client (kafka.client.KafkaClient): kafka client
+        topic_partitions ([(str, int)]): topic and partition pairs
+
+    Returns:
+        dict((str, int), int or Exception): The high watermark of each topic
+            partition, or the error that prevented getting it.
+            :class:`kafka.common.LeaderNotAvailableError` means the partition
+            has no leader yet, e.g. while its topic is auto-created or during a
+            broker failover.
+    """
+    topic_errors = _load_topics_metadata(
+        kafka_client,
+        {topic for topic, _ in topic_partitions}
+    )
+
+    high_watermarks = {}
+    requested_topic_partitions = []
+    for topic, partition in topic_partitions:
+        if topic in topic_errors:
+            high_watermarks[(topic, partition)] = topic_errors[topic]
+        elif kafka_client.topics_to_brokers.get(
+            TopicAndPartition(kafka_bytestring(topic), partition)
+        ) is None:
+            high_watermarks[(topic, partition)] = LeaderNotAvailableError(
+                "No leader for topic {} partition {}".format(topic, partition)
+            )
+        else:
+            requested_topic_partitions.append((topic, partition))
+
+    if not requested_topic_partitions:
+        return high_watermarks
+
+    try:
+        responses = kafka_client.send_offset_request(
+            [
+                # -1 requests the latest offset, i.e. the high watermark.
+                OffsetRequest(kafka_bytestring(topic), partition, -1, max_offsets=1)
+                for topic, partition in requested_topic_partitions
+            ],
+            fail_on_error=False
+        )
+    except Exception as e:
+        # fail_on_error = False does not prevent network errors
+        responses = [e] * len(requested_topic_partitions)
+
+    # The responses are in the same order as the requests.
+    for topic_partition, response in zip(requested_topic_partitions, responses):
+        if isinstance(response, Exception):
+            high_watermarks[topic_partition] = response
+        elif response.error:
+            high_watermarks[topic_partition] = Exception(
+                "Offset request error code {}".format(response.error)
+            )
+        else:
+            high_watermarks[topic_partition] = response.offsets[0]
+    return high_watermarks
+
+
+def _load_topics_metadata(kafka_client, topics):
+    """Refreshes the metadata of the topics, and returns the errors of the
+    topics whose metadata can't be loaded.
+    """
+    try:
+        kafka_client.load_metadata_for_topics(*topics)
+        return {}
+    except (LeaderNotAvailableError, UnknownTopicOrPartitionError):
+        # The kafka client raises on the first topic with an error, so the
+        # topics are loaded one by one to find the ones with errors.
+        pass
+    except Exception as e:
+        return {topic: e for topic in topics}
+
+    topic_errors = {}
+    for topic in topics:
+        try:
+            kafka_client.load_metadata_for_topics(topic)
+        except Exception as e:
+            topic_errors[topic] = e
+    return topic_errors
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import sys
+import threading
+import time
+from collections import defaultdict
+from collections import deque
+from collections import namedtuple
+from contextlib import contextmanager
+
+from data_pipeline._kafka_client_pool import get_kafka_client
+from data_pipeline._kafka_producer import _remove_published_messages
+from data_pipeline._kafka_producer import LoggingKafkaProducer
+from data_pipeline._kafka_util import get_topic_partitions
+from data_pipeline._producer_memory_budget import get_producer_memory_budget
+from data_pipeline.config import get_config
+
+
+logger = get_config().logger
+
+
+_Batch = namedtuple('_Batch', [
+    'message_buffer',           # Prepared messages of each topic partition
+    'message_count',            # Number of messages in the batch
+    'message_bytes',            # Memory reserved for the messages of the batch
+    'position_info_snapshot'    # Position info once the batch is published
+])
+
+
+class PipelinedKafkaProducer(LoggingKafkaProducer):
+    """PipelinedKafkaProducer extends KafkaProducer to publish buffered
+    messages from a dedicated sender thread.  When the buffer is ready to be
+    flushed, it is handed off to the sender thread as a batch, and publishing
+    carries on into a fresh buffer.  The caller only blocks on Kafka when
+    `kafka_producer_max_in_flight_batches` batches are already waiting to be
+    sent, or when it flushes.
+
+    Batches are sent one at a time in the order they're handed off, and the
+    position data is updated after each batch with the position info
+    snapshotted when the batch was handed off, so the position data never
+    covers a message that hasn't been published.  The sender thread also
+    hands off the buffer on its own once it's older than
+    `kafka_producer_flush_time_limit_seconds`, so :meth:`wake` doesn't need
+    to be called.
+
+    If a batch can't be published, no later batch is sent, and the error is
+    re-raised from every subsequent call to publish or flush.
+
+    The sender thread uses the kafka client of the producer, so the partitions
+    of new topics are looked up with a client of their own, which is only a
+    separate reference to the same client when kafka clients are shared.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._condition = threading.Condition()
+        self._batches = deque()
+        self._in_flight_batch_count = 0
+        self._sending_batch = None
+        self._sender_exc_info = None
+        self._is_closed = False
+        self._metadata_client = None
+        super(PipelinedKafkaProducer, self).__init__(*args, **kwargs)
+        self.producer_position_callback(
+            self.position_data_tracker.get_position_data()
+        )
+        self._sender = threading.Thread(
+            target=self._run_sender,
+            name='data_pipeline_producer_sender'
+        )
+        self._sender.daemon = True
+        self._sender.start()
+
+    @contextmanager
+    def disable_automatic_flushing(self):
+        # The position data tracker is updated directly while automatic
+        # flushing is disabled, so let the sender thread finish first.
+        with self._condition:
+            self._wait_for_in_flight_batches()
+        with super(PipelinedKafkaProducer, self).disable_automatic_flushing():
+            yield
+
+    def publish(self, message, topic_partition=None):
+        if self._should_skip_message(message):
+            return
+        # Preparing the message is the expensive part, and only the publishing
+        # thread touches the message buffer, so it's done outside of the lock.
+        if topic_partition is None:
+            topic_partition = self.get_topic_partition(message)
+        prepared_message = self._prepare_message(message)
+        message_bytes = self._get_message_bytes(prepared_message)
+        with self._condition:
+            self._raise_if_sender_failed()
+        # The sender thread needs the lock to publish the batches holding the
+        # memory, so it isn't held while waiting on the memory budget.
+        self._reserve_buffer_memory(message_bytes)
+        with self._condition:
+            self._buffer_prepared_message(topic_partition, prepared_message)
+            self.message_buffer_size += 1
+            self.message_buffer_bytes += message_bytes
+            self.position_data_tracker.record_message_buffered(message)
+            if self._is_ready_to_flush():
+                self._hand_off_message_buffer()
+
+    def flush_buffered_messages(self):
+        with self._condition:
+            self._raise_if_sender_failed()
+            if self.message_buffer_size > 0:
+                self._hand_off_message_buffer()
+            self._wait_for_in_flight_batches()
+
+    def discard_buffered_messages(self):
+        with self._condition:
+            super(PipelinedKafkaProducer, self).discard_buffered_messages()
+
+    def close(self):
+        try:
+            self.flush_buffered_messages()
+        finally:
+            with self._condition:
+                self._is_closed = True
+                self._condition.notify_all()
+            self._sender.join()
+            self._release_unpublished_memory()
+        self.kafka_client.close()
+        if self._metadata_client is not None:
+            self._metadata_client.close()
+
+    def _flush_if_necessary(self):
+        with self._condition:
+            self._raise_if_sender_failed()
+            if self._is_ready_to_flush():
+                self._hand_off_message_buffer()
+
+    def _flush_to_release_memory(self):
+        with self._condition:
+            self._raise_if_sender_failed()
+            if self.message_buffer_size > 0:
+                self._hand_off_message_buffer()
+
+    def _release_unpublished_memory(self):
+        get_producer_memory_budget().release(
+            sum(batch.message_bytes for batch in self._batches)
+        )
+        self._batches.clear()
+        super(PipelinedKafkaProducer, self)._release_unpublished_memory()
+
+    def _buffer_prepared_message(self, topic_partition, prepared_message):
+        """Adds the prepared message to the buffer.  Must be called with the
+        lock held.
+        """
+        self.message_buffer[topic_partition].append(prepared_message)
+
+    def _load_partitions(self, topic):
+        if self.dry_run:
+            return [0]
+        if self._metadata_client is None:
+            self._metadata_client = get_kafka_client(
+                get_config().cluster_config.broker_list
+            )
+        return get_topic_partitions(self._metadata_client, topic)
+
+    def _is_ready_to_flush(self):
+        return (
+            self.message_buffer_size > 0 and
+            super(PipelinedKafkaProducer, self)._is_ready_to_flush()
+        )
+
+    def _reset_message_buffer(self):
+        # Position data is only passed to the callback by the sender thread,
+        # once the messages are published.
+        self.start_time = time.time()
+        self.message_buffer = defaultdict(list)
+        self.message_buffer_size = 0
+        self.message_buffer_bytes = 0
+
+    def _hand_off_message_buffer(self):
+        """Hands off the current buffer to the sender thread, blocking while
+        the maximum number of batches are in flight.  Must be called with the
+        lock held.
+        """
+        while self._is_batch_limit_reached() and self._sender_exc_info is None:
+            self._condition.wait()
+        self._raise_if_sender_failed()
+        # The sender thread may have handed off the buffer on time while this
+        # thread was waiting.
+        if self.message_buffer_size == 0:
+            return
+        batch = self._create_batch()
+        self._in_flight_batch_count += 1
+        self._reset_message_buffer()
+        self._append_batch(batch)
+        self._condition.notify_all()
+
+    def _append_batch(self, batch):
+        """Queues the batch for the sender thread.  Must be called with the
+        lock held.
+        """
+        self._batches.append(batch)
+
+    def _is_batch_limit_reached(self):
+        max_in_flight_batches = get_config().kafka_producer_max_in_flight_batches
+        return self._in_flight_batch_count >= max_in_flight_batches
+
+    def _create_batch(self):
+        return _Batch(
+            message_buffer=self.message_buffer,
+            message_count=self.message_buffer_size,
+            message_bytes=self.message_buffer_bytes,
+            position_info_snapshot=(
+                self.position_data_tracker.get_position_info_snapshot()
+            )
+        )
+
+    def _wait_for_in_flight_batches(self):
+        while self._in_flight_batch_count > 0 and self._sender_exc_info is None:
+            self._condition.wait()
+        self._raise_if_sender_failed()
+
+    def _raise_if_sender_failed(self):
+        if self._sender_exc_info is not None:
+            exc_type, exc_value, exc_traceback = self._sender_exc_info
+            raise exc_type, exc_value, exc_traceback
+
+    def _run_sender(self):
+        while True:
+            with self._condition:
+                batch = self._wait_for_batch()
+            if batch is None:
+                return
+            self._send_batch(batch)
+
+    def _wait_for_batch(self):
+        """Returns the next batch to be sent, handing off the buffer once the
+        flush time limit passes, or `None` once the producer is closed.  Must
+        be called with the lock held.
+        """
+        while not self._batches or self._sender_exc_info is not None:
+            if self._is_closed:
+                return None
+            if (
+                not self._batches and
+                self._sender_exc_info is None and
+                self._is_ready_to_flush()
+            ):
+                self._hand_off_message_buffer()
+                continue
+            self._condition.wait(self._get_time_until_flush())
+        return self._batches.popleft()
+
+    def _get_time_until_flush(self):
+        time_limit = get_config().kafka_producer_flush_time_limit_seconds
+        if self.message_buffer_size == 0 or not self._automatic_flush_enabled:
+            return time_limit
+        return max(self.start_time + time_limit - time.time(), 0.001)
+
+    def _send_batch(self, batch):
+        self._sending_batch = batch
+        try:
+            self._publish_buffered_messages()
+            with self._condition:
+                position_data = self.position_data_tracker.get_position_data_at_snapshot(
+                    batch.position_info_snapshot
+                )
+            self.producer_position_callback(position_data)
+        except Exception:
+            logger.exception("Failed to publish a batch of {0} messages.".format(
+                batch.message_count
+            ))
+            with self._condition:
+                self._sender_exc_info = sys.exc_info()
+                self._condition.notify_all()
+            return
+        finally:
+            self._sending_batch = None
+            get_producer_memory_budget().release(batch.message_bytes)
+        with self._condition:
+            self._in_flight_batch_count -= 1
+            self._condition.notify_all()
+
+    def _generate_prepared_topic_and_messages(self):
+        return self._sending_batch.message_buffer.iteritems()
+
+    def _record_success_requests(self, success_topic_stats_map):
+        message_buffer = self._sending_batch.message_buffer
+        with self._condition:
+            for topic_partition, stats in success_topic_stats_map.iteritems():
+                self._record_messages_published(topic_partition, stats)
+                _remove_published_messages(
+                    message_buffer,
+                    topic_partition,
+                    stats.message_count
+                )
+
+    def _record_messages_published(self, topic_partition, stats):
+        """Records the messages of the batch being sent to the topic partition
+        as published.  Must be called with the lock held.
+        """
+        self.position_data_tracker.record_messages_published(
+            topic=topic_partition.topic_name,
+            offset=stats.original_offset,
+            message_count=stats.message_count,
+            partition=topic_partition.partition
+        )
+
+    def _publish_single_request_dry_run(self, request):
+        with self._condition:
+            super(PipelinedKafkaProducer, self)._publish_single_request_dry_run(
+                request
+            )
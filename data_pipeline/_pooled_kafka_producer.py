@@ -16,22 +16,83 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from collections import defaultdict
+from collections import deque
+from collections import namedtuple
 from multiprocessing import Pool
 
 from data_pipeline._kafka_producer import _EnvelopeAndMessage
+from data_pipeline._kafka_producer import _get_message_bytes
 from data_pipeline._kafka_producer import _prepare
-from data_pipeline._kafka_producer import LoggingKafkaProducer
+from data_pipeline._pipelined_kafka_producer import PipelinedKafkaProducer
 from data_pipeline.config import get_config
 
 
 logger = get_config().logger
 
 
-class PooledKafkaProducer(LoggingKafkaProducer):
-    """PooledKafkaProducer extends KafkaProducer to use a pool of subprocesses
-    to schematize and pack envelopes, instead of performing those operations
-    synchronously.  Parallelizing and backgrounding these expensive operations
-    can result in a substantial performance improvement.
+# Size assumed for messages until the pool has prepared some to go by.
+_DEFAULT_MESSAGE_BYTES_ESTIMATE = 1024
+
+
+# In Python 2, a pool result only wakes one of the threads waiting on it, and
+# both the publishing and the sender threads can wait on the same chunk, so
+# they wait for this long at a time until the chunk is ready.
+_CHUNK_WAIT_SECONDS = 0.1
+
+
+def _wait_for_chunk(chunk):
+    while not chunk.result.ready():
+        chunk.result.wait(_CHUNK_WAIT_SECONDS)
+
+
+StageStats = namedtuple('StageStats', [
+    'prepare_queue_depth',      # Messages waiting for the pool to prepare them
+    'send_queue_depth',         # Batches waiting for the sender thread to send them
+    'prepared_message_count',   # Messages prepared by the pool so far
+    'published_message_count'   # Messages published into Kafka so far
+])
+
+
+class _PrepareChunk(object):
+    """Messages handed to the pool to be prepared together."""
+
+    def __init__(self):
+        self.envelope_and_messages = []
+        self.result = None
+
+
+class _PendingMessage(namedtuple('_PendingMessage', ['chunk', 'index'])):
+    """Placeholder in the message buffer for a message being prepared."""
+
+    __slots__ = ()
+
+    def get(self):
+        _wait_for_chunk(self.chunk)
+        return self.chunk.result.get()[self.index]
+
+
+class PooledKafkaProducer(PipelinedKafkaProducer):
+    """PooledKafkaProducer extends PipelinedKafkaProducer to use a pool of
+    subprocesses to schematize and pack envelopes, instead of performing those
+    operations synchronously.  Parallelizing and backgrounding these expensive
+    operations can result in a substantial performance improvement.
+
+    Publishing goes through two stages.  Messages are handed to the pool in
+    chunks of `kafka_producer_prepare_chunk_size` as they're published, so the
+    pool works while the buffer fills, and publishing blocks once
+    `kafka_producer_max_pending_prepare_chunks` chunks are waiting to be
+    prepared.  Buffers are then handed off to the sender thread, which waits
+    for their messages to be prepared and publishes them, with the same
+    bounds and ordering as :class:`PipelinedKafkaProducer`.  There is a single
+    sender, so messages of each topic partition and the position data stay in
+    publishing order.
+
+    Messages are only encoded in the pool, so their size in the buffer is
+    estimated from the average size of the messages prepared so far.
+
+    :meth:`get_stage_stats` reports the depth and throughput of each stage, and
+    they're also sent to meteorite when `enable_meteorite` is set.
 
     See the Quick Start for more information about choosing an appropriate
     producer.
@@ -40,7 +101,16 @@ class PooledKafkaProducer(LoggingKafkaProducer):
     """
 
     def __init__(self, *args, **kwargs):
-        self.pool = Pool()
+        self.pool = Pool(
+            processes=get_config().kafka_producer_prepare_worker_count or None
+        )
+        self._prepare_chunk = _PrepareChunk()
+        self._pending_prepare_chunks = deque()
+        self._stage_message_counts = defaultdict(int)
+        self._prepared_message_bytes = 0
+        self._stage_message_counter, self._queue_depth_gauge = (
+            self._get_stage_monitors()
+        )
         super(PooledKafkaProducer, self).__init__(*args, **kwargs)
 
     def close(self):
@@ -64,45 +134,140 @@ class PooledKafkaProducer(LoggingKafkaProducer):
             self.pool.terminate()
             self.pool.join()
 
+    def discard_buffered_messages(self):
+        with self._condition:
+            # The messages of the chunk that hasn't been handed to the pool
+            # yet are all in the buffer.
+            self._prepare_chunk = _PrepareChunk()
+            super(PooledKafkaProducer, self).discard_buffered_messages()
+
+    def get_stage_stats(self):
+        """Returns the :class:`StageStats` of the producer."""
+        with self._condition:
+            self._collect_prepared_chunks()
+            return StageStats(
+                prepare_queue_depth=self._get_prepare_queue_depth(),
+                send_queue_depth=self._in_flight_batch_count,
+                prepared_message_count=self._stage_message_counts['prepare'],
+                published_message_count=self._stage_message_counts['publish']
+            )
+
+    def _get_stage_monitors(self):
+        if not get_config().enable_meteorite:
+            return None, None
+        try:
+            from data_pipeline.tools.meteorite_wrappers import StatGauge
+            from data_pipeline.tools.meteorite_wrappers import StatsCounter
+        except ImportError:
+            return None, None
+        dimensions = dict(
+            container_name=get_config().container_name,
+            container_env=get_config().container_env
+        )
+        return (
+            StatsCounter(
+                'kafka_producer.stage_messages',
+                counted_dimension='stage',
+                **dimensions
+            ),
+            StatGauge('kafka_producer.queue_depth', **dimensions)
+        )
+
     def _prepare_message(self, message):
-        """This happens in the pool, so this is a noop"""
-        return message
+        """This happens in the pool, so the message is only paired with the
+        envelope here.
+        """
+        return _EnvelopeAndMessage(envelope=self.envelope, message=message)
+
+    def _get_message_bytes(self, envelope_and_message):
+        prepared_message_count = self._stage_message_counts['prepare']
+        if prepared_message_count == 0:
+            return _DEFAULT_MESSAGE_BYTES_ESTIMATE
+        return self._prepared_message_bytes // prepared_message_count
+
+    def _buffer_prepared_message(self, topic_partition, envelope_and_message):
+        chunk = self._prepare_chunk
+        self.message_buffer[topic_partition].append(
+            _PendingMessage(chunk, len(chunk.envelope_and_messages))
+        )
+        chunk.envelope_and_messages.append(envelope_and_message)
+        if (
+            len(chunk.envelope_and_messages) >=
+            get_config().kafka_producer_prepare_chunk_size
+        ):
+            self._submit_prepare_chunk()
+
+    def _hand_off_message_buffer(self):
+        # The messages of the buffer that haven't been handed to the pool yet
+        # are needed to send the batch.
+        self._submit_prepare_chunk()
+        super(PooledKafkaProducer, self)._hand_off_message_buffer()
+
+    def _submit_prepare_chunk(self):
+        """Hands the current chunk to the pool, blocking while the maximum
+        number of chunks are waiting to be prepared.  Must be called with the
+        lock held.
+        """
+        chunk = self._prepare_chunk
+        if not chunk.envelope_and_messages:
+            return
+        self._collect_prepared_chunks()
+        max_pending_chunks = get_config().kafka_producer_max_pending_prepare_chunks
+        while len(self._pending_prepare_chunks) >= max_pending_chunks:
+            _wait_for_chunk(self._pending_prepare_chunks[0])
+            self._collect_prepared_chunks()
+        chunk.result = self.pool.map_async(_prepare, chunk.envelope_and_messages)
+        self._pending_prepare_chunks.append(chunk)
+        self._prepare_chunk = _PrepareChunk()
+        self._report_queue_depths()
+
+    def _collect_prepared_chunks(self):
+        while (
+            self._pending_prepare_chunks and
+            self._pending_prepare_chunks[0].result.ready()
+        ):
+            chunk = self._pending_prepare_chunks.popleft()
+            if chunk.result.successful():
+                self._prepared_message_bytes += sum(
+                    _get_message_bytes(prepared_message)
+                    for prepared_message in chunk.result.get()
+                )
+            self._count_stage_messages('prepare', len(chunk.envelope_and_messages))
+
+    def _get_prepare_queue_depth(self):
+        return len(self._prepare_chunk.envelope_and_messages) + sum(
+            len(chunk.envelope_and_messages)
+            for chunk in self._pending_prepare_chunks
+        )
+
+    def _count_stage_messages(self, stage, message_count):
+        self._stage_message_counts[stage] += message_count
+        if self._stage_message_counter is not None:
+            self._stage_message_counter.increment(stage, message_count)
+
+    def _report_queue_depths(self):
+        if self._queue_depth_gauge is None:
+            return
+        self._queue_depth_gauge.set(
+            self._get_prepare_queue_depth(),
+            {'stage': 'prepare'}
+        )
+        self._queue_depth_gauge.set(self._in_flight_batch_count, {'stage': 'send'})
 
     def _generate_prepared_topic_and_messages(self):
-        # The setup here isn't great, it's probably worth switching this to
-        # keep the buffer in an array, then map it here.  It'd also be worth
-        # looking at pipelining this, so there would be a regular buffer, and a
-        # buffer that was being prepared.
-        #
-        # That would look like:
-        #
-        # publish -> accumulate in buffer -> move to prep area -> async prepare
-        #   -> publish to kafka
-        #
-        # clin proposed an alternative approach:
-        # I personally would prefer to pipeline this, and spawn certain number
-        # of workers doing schematizing and packing messages (listen to regular
-        # queue and move items from it to schematized queue), and another
-        # certain number of workers sending messages to kafka (listen to
-        # schematized queue and move items from it to kafka topic). The number
-        # of workers can be configurable so we can treak performance if needed.
-        # One benefit is we can build some metric from it and see the throughput
-        # or identify where the bottleneck is if there is one.
-        #
-        # Also, in this way, it seems the schematizing workers don't have to
-        # work in bulk and can continuously schematize and pack the incoming raw
-        # messages, and move them into schemaized/packed queue (if there are
-        # free workers). The send-requests workers can then send the messages
-        # in bulk or every certain amount of time. The down side is this is a
-        # more complicated approach.
-        topics_and_messages_result = [
-            (topic, self.pool.map_async(
-                _prepare,
-                [
-                    _EnvelopeAndMessage(envelope=self.envelope, message=message)
-                    for message in messages
-                ]
-            )) for topic, messages in self.message_buffer.iteritems()
+        # This runs in the sender thread, which waits here for the pool to
+        # finish preparing the messages of the batch.
+        return [
+            (topic_partition, [pending_message.get() for pending_message in messages])
+            for topic_partition, messages
+            in self._sending_batch.message_buffer.iteritems()
         ]
 
-        return [(topic, messages_result.get()) for topic, messages_result in topics_and_messages_result]
+    def _record_success_requests(self, success_topic_stats_map):
+        super(PooledKafkaProducer, self)._record_success_requests(
+            success_topic_stats_map
+        )
+        with self._condition:
+            self._count_stage_messages('publish', sum(
+                stats.message_count for stats in success_topic_stats_map.itervalues()
+            ))
@@ -16,14 +16,23 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import copy
 from collections import defaultdict
 from collections import Mapping
+from collections import namedtuple
 
 from data_pipeline.config import get_config
 from data_pipeline.helpers.log import debug_log
 from data_pipeline.position_data import PositionData
 
 
+_PositionInfoSnapshot = namedtuple('_PositionInfoSnapshot', [
+    'last_published_message_position_info',
+    'topic_to_last_position_info_map',
+    'merged_upstream_position_info_map'
+])
+
+
 def PositionDataTracker():
     """Factory method for generating PositionDataTracker or subclasses
     """
@@ -44,6 +53,7 @@ class _PositionDataTracker(object):
     def __init__(self):
         self.unpublished_messages = 0
         self.topic_to_kafka_offset_map = {}
+        self.topic_to_partition_offset_map = defaultdict(dict)
         self.merged_upstream_position_info_map = {}
         self._setup_position_info()
 
@@ -60,31 +70,111 @@ class _PositionDataTracker(object):
             self._update_position_info(message)
         self._update_merged_upstream_position_info(message)
 
-    def update_high_watermark(self, topic, offset, message_count):
-        self.topic_to_kafka_offset_map[topic] = offset + message_count
+    def update_high_watermark(self, topic, offset, message_count, partition=0):
+        high_watermark = offset + message_count
+        self.topic_to_partition_offset_map[topic][partition] = high_watermark
+        if partition == 0:
+            self.topic_to_kafka_offset_map[topic] = high_watermark
 
     def record_message_buffered(self, message):
         debug_log(lambda: "Message buffered: %s" % repr(message))
         self.record_message(message)
         self.unpublished_messages += 1
 
-    def record_messages_published(self, topic, offset, message_count):
+    def record_messages_published(self, topic, offset, message_count, partition=0):
         debug_log(
-            lambda: "Messages published: %s, %s" % (topic, message_count)
+            lambda: "Messages published: %s, %s, %s" % (topic, partition, message_count)
         )
-        self.update_high_watermark(topic, offset, message_count)
+        self.update_high_watermark(topic, offset, message_count, partition)
         self.unpublished_messages -= message_count
 
     def get_position_data(self):
         # Only allow checkpointing when there aren't unpublished messages
         assert self.unpublished_messages == 0
+        # The position info is updated in place as messages are recorded, so
+        # it's copied for the position data to stay as it was when taken.
         return PositionData(
-            last_published_message_position_info=self.last_published_message_position_info,
-            topic_to_last_position_info_map=dict(self.topic_to_last_position_info_map),
+            last_published_message_position_info=copy.deepcopy(
+                self.last_published_message_position_info
+            ),
+            topic_to_last_position_info_map=copy.deepcopy(
+                dict(self.topic_to_last_position_info_map)
+            ),
             topic_to_kafka_offset_map=dict(self.topic_to_kafka_offset_map),
-            merged_upstream_position_info_map=dict(self.merged_upstream_position_info_map)
+            merged_upstream_position_info_map=copy.deepcopy(
+                self.merged_upstream_position_info_map
+            ),
+            topic_to_partition_offset_map=self._copy_topic_to_partition_offset_map()
+        )
+
+    def get_position_info_snapshot(self):
+        """Returns a copy of the upstream position info of the messages
+        recorded so far.  The snapshot can be turned into position data with
+        :meth:`get_position_data_at_snapshot` as soon as those messages are
+        published, even if more messages have been buffered since.
+        """
+        return _PositionInfoSnapshot(
+            last_published_message_position_info=copy.deepcopy(
+                self.last_published_message_position_info
+            ),
+            topic_to_last_position_info_map=copy.deepcopy(
+                dict(self.topic_to_last_position_info_map)
+            ),
+            merged_upstream_position_info_map=copy.deepcopy(
+                self.merged_upstream_position_info_map
+            )
         )
 
+    def get_position_data_at_snapshot(self, position_info_snapshot):
+        """Returns the position data of the point the given snapshot was
+        taken at, with the kafka offsets of all the messages published so far.
+        Callers must ensure that every message recorded before the snapshot
+        has been published, and that no message recorded after it has been.
+        """
+        return PositionData(
+            last_published_message_position_info=(
+                position_info_snapshot.last_published_message_position_info
+            ),
+            topic_to_last_position_info_map=(
+                position_info_snapshot.topic_to_last_position_info_map
+            ),
+            topic_to_kafka_offset_map=dict(self.topic_to_kafka_offset_map),
+            merged_upstream_position_info_map=(
+                position_info_snapshot.merged_upstream_position_info_map
+            ),
+            topic_to_partition_offset_map=self._copy_topic_to_partition_offset_map()
+        )
+
+    def reset_to_position_data(self, position_data):
+        """Drops everything recorded since the given position data was taken,
+        e.g. when the messages buffered since then are discarded.  The
+        messages recorded until then must all have been published.
+        """
+        self.unpublished_messages = 0
+        self.topic_to_kafka_offset_map = dict(position_data.topic_to_kafka_offset_map)
+        self.topic_to_partition_offset_map = defaultdict(dict)
+        for topic, partition_to_offset_map in (
+            position_data.topic_to_partition_offset_map.iteritems()
+        ):
+            self.topic_to_partition_offset_map[topic].update(partition_to_offset_map)
+        self.merged_upstream_position_info_map = copy.deepcopy(
+            position_data.merged_upstream_position_info_map
+        )
+        self._setup_position_info()
+        self.last_published_message_position_info = copy.deepcopy(
+            position_data.last_published_message_position_info
+        )
+        self.topic_to_last_position_info_map.update(
+            copy.deepcopy(position_data.topic_to_last_position_info_map)
+        )
+
+    def _copy_topic_to_partition_offset_map(self):
+        return {
+            topic: dict(partition_to_offset_map)
+            for topic, partition_to_offset_map
+            in self.topic_to_partition_offset_map.iteritems()
+        }
+
     def _setup_position_info(self):
         self.last_published_message_position_info = None
         self.topic_to_last_position_info_map = {}
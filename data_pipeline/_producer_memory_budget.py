@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from data_pipeline.config import get_config
+
+
+class MemoryBudgetExceededError(Exception):
+    """Raised when a message can't be buffered within
+    `kafka_producer_memory_budget_bytes` before
+    `kafka_producer_memory_budget_timeout_seconds` passes.
+    """
+    pass
+
+
+class ProducerMemoryBudget(object):
+    """Keeps count of the bytes of encoded messages that the producers of the
+    process hold until they're published, and holds back producers once
+    `kafka_producer_memory_budget_bytes` is reached.
+
+    A message is always let in when nothing else is reserved, so a message
+    larger than the whole budget can still be published on its own.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.reserved_bytes = 0
+
+    def try_reserve(self, byte_count):
+        """Reserves the bytes if they fit in the budget.
+
+        Returns:
+            bool: whether the bytes were reserved.
+        """
+        with self._condition:
+            return self._try_reserve(byte_count)
+
+    def reserve(self, byte_count, timeout):
+        """Reserves the bytes, waiting up to `timeout` seconds for others to be
+        released if they don't fit in the budget.
+
+        Raises:
+            MemoryBudgetExceededError: if the bytes still don't fit once the
+                timeout passes.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while not self._try_reserve(byte_count):
+                remaining_time = deadline - time.time()
+                if remaining_time <= 0:
+                    raise MemoryBudgetExceededError(
+                        "Can't reserve {0} bytes with {1} of {2} bytes "
+                        "reserved.".format(
+                            byte_count,
+                            self.reserved_bytes,
+                            get_config().kafka_producer_memory_budget_bytes
+                        )
+                    )
+                self._condition.wait(remaining_time)
+
+    def release(self, byte_count):
+        if byte_count == 0:
+            return
+        with self._condition:
+            self.reserved_bytes -= byte_count
+            self._condition.notify_all()
+
+    def _try_reserve(self, byte_count):
+        budget_bytes = get_config().kafka_producer_memory_budget_bytes
+        if (
+            budget_bytes and
+            self.reserved_bytes > 0 and
+            self.reserved_bytes + byte_count > budget_bytes
+        ):
+            return False
+        self.reserved_bytes += byte_count
+        return True
+
+
+_producer_memory_budget = ProducerMemoryBudget()
+
+
+def get_producer_memory_budget():
+    """Returns the memory budget shared by the producers of the process."""
+    return _producer_memory_budget
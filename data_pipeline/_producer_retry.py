@@ -23,8 +23,9 @@ from __future__ import unicode_literals
 from collections import namedtuple
 
 from kafka.common import LeaderNotAvailableError
+from kafka.common import ProduceRequest
 
-from data_pipeline._kafka_util import get_actual_published_messages_count
+from data_pipeline._kafka_util import get_high_watermarks
 from data_pipeline.config import get_config
 from data_pipeline.publish_guarantee import PublishGuaranteeEnum
 
@@ -38,6 +39,15 @@ _TopicPartition = namedtuple('_TopicPartition', ['topic_name', 'partition'])
 _Stats = namedtuple('_Stats', ['original_offset', 'message_count'])
 
 
+# A ProduceRequest that also carries the number of messages it publishes, which
+# differs from the number of its messages once they're wrapped into compressed
+# message sets.
+_ProduceRequest = namedtuple(
+    '_ProduceRequest',
+    ProduceRequest._fields + ('message_count',)
+)
+
+
 class RetryHandler(object):
     """The class tracks the message publishing statistics in each retry,
     such as topic offset, number of published messages, etc., and determines
@@ -67,8 +77,10 @@ class RetryHandler(object):
         Args:
             responses (kafka.common.FetchResponse or kafka.common.KafkaError):
                 responses of the requests that publish messages to kafka topics
-            topic_offsets (Optional[dict]): offset of each topic tracked by the
-                producer so far.  It is used for exact-once publishing guarantee.
+            topic_offsets (Optional[dict]): offset of each partition of each
+                topic tracked by the producer so far, in the format of
+                :attr:`data_pipeline.position_data.PositionData.topic_to_partition_offset_map`.
+                It is used for exact-once publishing guarantee.
         """
         self.success_topic_stats_map = {}
         requests_to_retry = self._update_success_requests_stats(
@@ -100,7 +112,7 @@ class RetryHandler(object):
                 requests_to_retry.append(request)
                 continue
 
-            new_stats = _Stats(response.offset, len(request.messages))
+            new_stats = _Stats(response.offset, request.message_count)
             self._update_success_topic_stats(topic, partition, new_stats)
 
         return requests_to_retry
@@ -119,90 +131,82 @@ class RetryHandler(object):
 
     def _verify_failed_requests(self, requests, topic_offsets):
         """Verify if the requests actually fail by checking the high watermark
-        of the corresponding topics.  If the high watermark of a topic matches
-        the number of messages in the request, the request is considered as
-        successfully published, and the offset is saved in the position_data_tracker.
+        of the corresponding topic partitions.  If the high watermark of a
+        partition matches the number of messages in the request, the request
+        is considered as successfully published, and the offset is saved in
+        the position_data_tracker.
 
         If the high watermark data cannot be retrieved and it is not due to
-        missing topic/partition, the request will be considered as failed but
-        won't be retried because it cannot determine whether the messages are
-        actually published.  Otherwise, the request will be retried.
+        missing topic/partition leader, the request will be considered as
+        failed but won't be retried because it cannot determine whether the
+        messages are actually published.  Otherwise, the request will be
+        retried.
+
+        The high watermarks of all the failed requests are fetched together,
+        so a retry round costs a metadata request and an offset request per
+        broker however many topics failed, and the errors of a topic don't
+        affect the others.
         """
-        # `get_topics_watermarks` fails all the topics if any partition leader
-        # is not available, so here it checks each topic individually.
+        if not requests:
+            return []
+        topic_offsets = topic_offsets or {}
+
+        logger.debug("Verifying {} failed requests.".format(len(requests)))
+        high_watermarks = get_high_watermarks(
+            self.kafka_client,
+            [(request.topic, request.partition) for request in requests]
+        )
+
         requests_to_retry = []
         for request in requests:
             topic, partition = request.topic, request.partition
             topic_desc = "topic {} partition {} request".format(topic, partition)
-            try:
-                logger.debug("Verifying failed {}.".format(topic_desc))
-
-                # try to load the metadata in case it is stale
-                success = self._try_load_topic_metadata(topic)
-                if not success:
-                    logger.debug("Cannot load the metadata of topic {}. Skip {}."
-                                 .format(topic, topic_desc))
-                    continue
-
-                published_count = self._get_published_msg_count(topic, topic_offsets)
-                if len(request.messages) != published_count:
-                    logger.debug(
-                        "Request message count {} doesn't match actual published "
-                        "message count {}. Retry {}.".format(
-                            len(request.messages),
-                            published_count,
-                            topic_desc
-                        )
-                    )
-                    requests_to_retry.append(request)
-                    continue
-
-                # Update stats for the request that actually succeeds
-                logger.debug("{} actually succeeded.".format(topic_desc))
-                new_stats = _Stats(topic_offsets[topic], published_count)
-                self._update_success_topic_stats(topic, partition, new_stats)
+            high_watermark = high_watermarks[(topic, partition)]
 
-            except LeaderNotAvailableError:
+            if isinstance(high_watermark, LeaderNotAvailableError):
                 # Topic doesn't exist yet but the broker is configured to create
-                # the topic automatically. Retry the request.
+                # the topic automatically, or the partition is failing over.
+                # Retry the request.
                 logger.debug(
-                    "Topic {} doesn't exists. Retry {}.".format(topic, topic_desc)
+                    "No leader for topic {} partition {}. Retry {}.".format(
+                        topic,
+                        partition,
+                        topic_desc
+                    )
                 )
                 requests_to_retry.append(request)
+                continue
 
-            except Exception:
+            if isinstance(high_watermark, Exception):
                 # Unable to get the high watermark of this topic; do not retry
                 # this request since it's unclear if the messages are actually
                 # successfully published.
+                logger.debug("Cannot get the high watermark: {!r}. Skip {}.".format(
+                    high_watermark,
+                    topic_desc
+                ))
+                continue
+
+            original_offset = topic_offsets.get(topic, {}).get(partition, 0)
+            published_count = high_watermark - original_offset
+            if request.message_count != published_count:
                 logger.debug(
-                    "Cannot get the high watermark. Skip {}.".format(topic_desc),
-                    exc_info=1
+                    "Request message count {} doesn't match actual published "
+                    "message count {}. Retry {}.".format(
+                        request.message_count,
+                        published_count,
+                        topic_desc
+                    )
                 )
+                requests_to_retry.append(request)
+                continue
 
-        return requests_to_retry
-
-    def _get_published_msg_count(self, topic, topic_offsets):
-        published_msgs_count_map = get_actual_published_messages_count(
-            self.kafka_client,
-            [topic],
-            topic_tracked_offset_map=topic_offsets
-        )
-        return published_msgs_count_map.get(topic)
+            # Update stats for the request that actually succeeds
+            logger.debug("{} actually succeeded.".format(topic_desc))
+            new_stats = _Stats(original_offset, published_count)
+            self._update_success_topic_stats(topic, partition, new_stats)
 
-    def _try_load_topic_metadata(self, topic):
-        """Try to load the metadata of the topic of the given request.  It
-        returns True if it succeeds, and False otherwise with one exception:
-        if the topic doesn't exist but the broker is configured to create it
-        automatically, it will re-raise LeaderNotAvailableError.
-        """
-        try:
-            self.kafka_client.load_metadata_for_topics(topic)
-            return True
-        except LeaderNotAvailableError:
-            raise
-        except Exception:
-            logger.exception("Failed to load metadata of topic {}.".format(topic))
-            return False
+        return requests_to_retry
 
     @property
     def total_published_message_count(self):
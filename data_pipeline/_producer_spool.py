@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+This module contains the local spool, a write-ahead log on disk that a
+spooling producer appends its batches of prepared messages to before they're
+published into Kafka.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import errno
+import fcntl
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import defaultdict
+from collections import deque
+from collections import namedtuple
+
+from kafka import create_message
+
+from data_pipeline._producer_retry import _TopicPartition
+from data_pipeline.config import get_config
+
+
+logger = get_config().logger
+
+
+SpoolRecord = namedtuple('SpoolRecord', [
+    'segment_id',       # Id of the segment file the record is in
+    'offset',           # Byte offset of the record in its segment
+    'byte_count',       # Size of the record, header included
+    'message_count'     # Number of messages in the record
+])
+
+
+_SEGMENT_FILE_NAME_FORMAT = 'segment-{0:020d}.log'
+_SEGMENT_FILE_NAME_PATTERN = re.compile(r'^segment-(\d{20})\.log$')
+_CHECKPOINT_FILE_NAME = 'checkpoint'
+_LOCK_FILE_NAME = 'spool.lock'
+
+# Each record is its payload size, message count and payload crc32, followed
+# by the payload.
+_RECORD_HEADER = struct.Struct(b'>III')
+_COUNT = struct.Struct(b'>I')
+_TOPIC_SIZE = struct.Struct(b'>H')
+_PARTITION = struct.Struct(b'>i')
+_BYTES_SIZE = struct.Struct(b'>i')
+
+
+class SpoolLockedError(Exception):
+    """Raised when the spool directory is already used by another producer."""
+    pass
+
+
+class ProducerSpool(object):
+    """Durable, ordered log of batches of prepared messages in a local
+    directory.
+
+    Batches are appended as records to segment files, and each append is
+    fsynced before it returns, so one fsync covers all the messages of a
+    batch.  Records are read back in the order they were appended, and
+    committed once they're published, which moves a checkpoint forward and
+    deletes the segments that only hold committed records.
+
+    When a spool is opened, the records appended but not committed by the
+    previous user of the directory are recovered, dropping a record that was
+    only partly written when it crashed.  They're returned by
+    :meth:`get_recovered_records`.  A new segment is started for the records
+    appended from then on.
+
+    Only one spool can use a directory at a time.
+
+    Args:
+        spool_dir (str): directory of the spool, created if needed.
+
+    Raises:
+        SpoolLockedError: if another spool uses the directory.
+    """
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        if not os.path.isdir(spool_dir):
+            os.makedirs(spool_dir)
+        self._lock_file = self._lock_directory()
+        self._recovered_records = self._recover()
+        self.pending_bytes = sum(
+            record.byte_count for record in self._recovered_records
+        )
+        self._segment_ids = deque(sorted(self._get_segment_ids()))
+        self._active_segment_id = (
+            self._segment_ids[-1] + 1 if self._segment_ids else 0
+        )
+        self._segment_ids.append(self._active_segment_id)
+        self._active_segment = open(
+            self._get_segment_path(self._active_segment_id),
+            'ab'
+        )
+        self._active_segment_bytes = 0
+
+    def get_recovered_records(self):
+        """Returns the records left uncommitted in the directory when the
+        spool was opened, in order.
+        """
+        return list(self._recovered_records)
+
+    def append(self, message_buffer):
+        """Writes a batch of prepared messages to the spool, and returns its
+        :class:`SpoolRecord` once it's on disk.
+
+        Args:
+            message_buffer (dict): prepared messages
+                (:class:`kafka.common.Message`) of each topic partition
+                (:class:`data_pipeline._producer_retry._TopicPartition`).
+        """
+        payload = _encode_message_buffer(message_buffer)
+        message_count = sum(
+            len(messages) for messages in message_buffer.itervalues()
+        )
+        header = _RECORD_HEADER.pack(
+            len(payload),
+            message_count,
+            _get_crc(payload)
+        )
+        with self._lock:
+            if (
+                self._active_segment_bytes > 0 and
+                self._active_segment_bytes + len(header) + len(payload) >
+                get_config().kafka_producer_spool_segment_bytes
+            ):
+                self._roll_segment()
+            record = SpoolRecord(
+                segment_id=self._active_segment_id,
+                offset=self._active_segment_bytes,
+                byte_count=len(header) + len(payload),
+                message_count=message_count
+            )
+            self._active_segment.write(header)
+            self._active_segment.write(payload)
+            self._active_segment.flush()
+            os.fsync(self._active_segment.fileno())
+            self._active_segment_bytes += record.byte_count
+            self.pending_bytes += record.byte_count
+        return record
+
+    def read(self, record):
+        """Returns the prepared messages of each topic partition in the given
+        record, in the format passed to :meth:`append`.
+        """
+        with open(self._get_segment_path(record.segment_id), 'rb') as segment:
+            segment.seek(record.offset)
+            data = segment.read(record.byte_count)
+        payload = data[_RECORD_HEADER.size:]
+        return _decode_message_buffer(payload)
+
+    def commit(self, record):
+        """Marks the given record, and all the records before it, as
+        published.  They won't be recovered when the spool is opened again.
+        """
+        with self._lock:
+            self._write_checkpoint(
+                record.segment_id,
+                record.offset + record.byte_count
+            )
+            self.pending_bytes -= record.byte_count
+            while self._segment_ids[0] < record.segment_id:
+                self._remove_segment(self._segment_ids.popleft())
+
+    def close(self):
+        with self._lock:
+            self._active_segment.close()
+            if self._active_segment_bytes == 0:
+                self._segment_ids.pop()
+                self._remove_segment(self._active_segment_id)
+        self._lock_file.close()
+
+    def _lock_directory(self):
+        lock_file = open(os.path.join(self.spool_dir, _LOCK_FILE_NAME), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            lock_file.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise SpoolLockedError(
+                    "The spool {0} is used by another producer.".format(
+                        self.spool_dir
+                    )
+                )
+            raise
+        return lock_file
+
+    def _recover(self):
+        checkpoint_segment_id, checkpoint_offset = self._read_checkpoint()
+        records = []
+        for segment_id in sorted(self._get_segment_ids()):
+            if segment_id < checkpoint_segment_id:
+                self._remove_segment(segment_id)
+                continue
+            offset = checkpoint_offset if segment_id == checkpoint_segment_id else 0
+            records.extend(self._recover_segment(segment_id, offset))
+        if records:
+            logger.info("Recovered {0} batches of {1} messages from {2}.".format(
+                len(records),
+                sum(record.message_count for record in records),
+                self.spool_dir
+            ))
+        return records
+
+    def _recover_segment(self, segment_id, offset):
+        path = self._get_segment_path(segment_id)
+        with open(path, 'rb') as segment:
+            data = segment.read()
+        records = []
+        while offset < len(data):
+            record = _read_record(segment_id, data, offset)
+            if record is None:
+                logger.warning(
+                    "Dropping the incomplete record at {0} of {1}.".format(
+                        offset,
+                        path
+                    )
+                )
+                with open(path, 'r+b') as segment:
+                    segment.truncate(offset)
+                break
+            records.append(record)
+            offset += record.byte_count
+        return records
+
+    def _roll_segment(self):
+        self._active_segment.close()
+        self._active_segment_id += 1
+        self._segment_ids.append(self._active_segment_id)
+        self._active_segment = open(
+            self._get_segment_path(self._active_segment_id),
+            'ab'
+        )
+        self._active_segment_bytes = 0
+
+    def _get_segment_ids(self):
+        return [
+            int(match.group(1))
+            for match in (
+                _SEGMENT_FILE_NAME_PATTERN.match(file_name)
+                for file_name in os.listdir(self.spool_dir)
+            )
+            if match
+        ]
+
+    def _get_segment_path(self, segment_id):
+        return os.path.join(
+            self.spool_dir,
+            _SEGMENT_FILE_NAME_FORMAT.format(segment_id)
+        )
+
+    def _remove_segment(self, segment_id):
+        try:
+            os.remove(self._get_segment_path(segment_id))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _read_checkpoint(self):
+        path = os.path.join(self.spool_dir, _CHECKPOINT_FILE_NAME)
+        if not os.path.exists(path):
+            return 0, 0
+        with open(path, 'rb') as checkpoint:
+            segment_id, offset = checkpoint.read().split()
+        return int(segment_id), int(offset)
+
+    def _write_checkpoint(self, segment_id, offset):
+        # The checkpoint is replaced atomically, so a crash leaves either the
+        # previous or the new one.
+        path = os.path.join(self.spool_dir, _CHECKPOINT_FILE_NAME)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as checkpoint:
+            checkpoint.write(b'{0} {1}\n'.format(segment_id, offset))
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.rename(temp_path, path)
+
+
+def _get_crc(payload):
+    return zlib.crc32(payload) & 0xffffffff
+
+
+def _read_record(segment_id, data, offset):
+    """Returns the record at the given offset of the segment data, or `None`
+    if it's incomplete or corrupted.
+    """
+    if offset + _RECORD_HEADER.size > len(data):
+        return None
+    payload_size, message_count, crc = _RECORD_HEADER.unpack_from(data, offset)
+    payload_offset = offset + _RECORD_HEADER.size
+    payload = data[payload_offset:payload_offset + payload_size]
+    if len(payload) < payload_size or _get_crc(payload) != crc:
+        return None
+    return SpoolRecord(
+        segment_id=segment_id,
+        offset=offset,
+        byte_count=_RECORD_HEADER.size + payload_size,
+        message_count=message_count
+    )
+
+
+def _encode_message_buffer(message_buffer):
+    chunks = [_COUNT.pack(len(message_buffer))]
+    for topic_partition, messages in message_buffer.iteritems():
+        chunks.append(_TOPIC_SIZE.pack(len(topic_partition.topic_name)))
+        chunks.append(topic_partition.topic_name)
+        chunks.append(_PARTITION.pack(topic_partition.partition))
+        chunks.append(_COUNT.pack(len(messages)))
+        for message in messages:
+            chunks.append(_encode_bytes(message.key))
+            chunks.append(_encode_bytes(message.value))
+    return b''.join(chunks)
+
+
+def _encode_bytes(value):
+    if value is None:
+        return _BYTES_SIZE.pack(-1)
+    return _BYTES_SIZE.pack(len(value)) + value
+
+
+def _decode_message_buffer(payload):
+    message_buffer = defaultdict(list)
+    topic_partition_count, offset = _unpack(_COUNT, payload, 0)
+    for _ in xrange(topic_partition_count):
+        topic_size, offset = _unpack(_TOPIC_SIZE, payload, offset)
+        topic = payload[offset:offset + topic_size]
+        partition, offset = _unpack(_PARTITION, payload, offset + topic_size)
+        message_count, offset = _unpack(_COUNT, payload, offset)
+        messages = message_buffer[_TopicPartition(topic, partition)]
+        for _ in xrange(message_count):
+            key, offset = _decode_bytes(payload, offset)
+            value, offset = _decode_bytes(payload, offset)
+            messages.append(create_message(value, key=key))
+    return message_buffer
+
+
+def _decode_bytes(payload, offset):
+    size, offset = _unpack(_BYTES_SIZE, payload, offset)
+    if size < 0:
+        return None, offset
+    return payload[offset:offset + size], offset + size
+
+
+def _unpack(struct_format, payload, offset):
+    value, = struct_format.unpack_from(payload, offset)
+    return value, offset + struct_format.size
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
+
+from data_pipeline.config import get_config
+from data_pipeline.helpers.singleton import Singleton
+from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
+
+
+class _SchemaMetadata(object):
+    """Information about a schema that every message of the schema needs,
+    resolved from the Schematizer once and shared by all those messages.
+
+    Args:
+        schema_id (int): Id of the schema.
+        topic_name (str): Name of the topic of the schema.
+        contains_pii (bool): Whether the topic of the schema contains PII.
+        primary_keys (tuple): Names of the primary key fields, in primary key
+            order.
+        key_fields (tuple): Avro field definitions of the primary key fields,
+            in primary key order.
+    """
+
+    __slots__ = (
+        'schema_id',
+        'topic_name',
+        'contains_pii',
+        'primary_keys',
+        'key_fields',
+        '_keys_writer'
+    )
+
+    def __init__(self, schema_id, topic_name, contains_pii, primary_keys, key_fields):
+        self.schema_id = schema_id
+        self.topic_name = topic_name
+        self.contains_pii = contains_pii
+        self.primary_keys = primary_keys
+        self.key_fields = key_fields
+        self._keys_writer = None
+
+    @classmethod
+    def from_avro_schema(cls, avro_schema):
+        primary_keys = tuple(avro_schema.primary_keys or ())
+        key_fields = ()
+        if primary_keys:
+            fields = avro_schema.schema_json.get('fields', [])
+            field_positions = {
+                field['name']: position for position, field in enumerate(fields)
+            }
+            key_fields = tuple(
+                fields[field_positions[pkey]] for pkey in primary_keys
+            )
+        return cls(
+            schema_id=avro_schema.schema_id,
+            topic_name=str(avro_schema.topic.name),
+            contains_pii=avro_schema.topic.contains_pii,
+            primary_keys=primary_keys,
+            key_fields=key_fields
+        )
+
+    @property
+    def should_be_encrypted(self):
+        """Whether messages of this schema should be encrypted.  So far the
+        criteria used to determine if the message should be encrypted is the
+        pii information.  Include additional criteria if necessary.
+        """
+        return self.contains_pii
+
+    @property
+    def keys_avro_json(self):
+        return {
+            "type": "record",
+            "namespace": "yelp.data_pipeline",
+            "name": "primary_keys",
+            "doc": "Represents primary keys present in Message payload.",
+            "fields": list(self.key_fields)
+        }
+
+    @property
+    def keys_writer(self):
+        """AvroStringWriter which encodes the primary keys of a message."""
+        if self._keys_writer is None:
+            self._keys_writer = AvroStringWriter(schema=self.keys_avro_json)
+        return self._keys_writer
+
+    def __getstate__(self):
+        # Messages carry their metadata into the producer pool processes, and
+        # the writer is cheaper to rebuild there than to pickle.
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__ if name != '_keys_writer'
+        }
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+        self._keys_writer = None
+
+
+class _SchemaMetadataStore(object):
+    """Singleton store of :class:`_SchemaMetadata` keyed by schema id.
+
+    The metadata of a schema is resolved from the avro schema the schematizer
+    client returns for it, and is then returned without asking the client
+    again until the schema or its topic may have expired in the client cache,
+    see :meth:`data_pipeline.config.Config.schematizer_cache_ttl_seconds`.
+    The avro schema is then looked up again, which refreshes it in the client
+    cache if it's stale, and the metadata is only resolved again if the client
+    returns a different avro schema, e.g. because the pii flag of the topic
+    changed.  The store holds the metadata of at most as many schemas as the
+    client cache, see
+    :meth:`data_pipeline.config.Config.schematizer_cache_max_entries`.
+
+    The store is also emptied whenever
+    :func:`data_pipeline.schematizer_clientlib.schematizer.get_schematizer`
+    returns a different client, so that a reset client is never answered
+    from metadata resolved with the previous one.
+    """
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        self._schematizer = None
+        self._metadata_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_metadata(self, schema_id):
+        schematizer = get_schematizer()
+        with self._lock:
+            if schematizer is not self._schematizer:
+                self._metadata_cache = OrderedDict()
+                self._schematizer = schematizer
+            cached_entry = self._metadata_cache.get(schema_id)
+        if cached_entry is not None and cached_entry[2] > time.time():
+            return cached_entry[1]
+
+        # The lock isn't held while the client may be fetching the schema.
+        avro_schema = schematizer.get_schema_by_id(schema_id)
+        if cached_entry is not None and cached_entry[0] is avro_schema:
+            metadata = cached_entry[1]
+        else:
+            metadata = _SchemaMetadata.from_avro_schema(avro_schema)
+        with self._lock:
+            if schematizer is self._schematizer:
+                self._metadata_cache.pop(schema_id, None)
+                self._metadata_cache[schema_id] = (
+                    avro_schema,
+                    metadata,
+                    self._get_revalidate_at()
+                )
+                max_entries = get_config().schematizer_cache_max_entries['schema']
+                while (
+                    max_entries is not None and
+                    len(self._metadata_cache) > max_entries
+                ):
+                    self._metadata_cache.popitem(last=False)
+        return metadata
+
+    def _get_revalidate_at(self):
+        ttl_seconds = get_config().schematizer_cache_ttl_seconds
+        ttls = [
+            ttl_seconds[entity_name] for entity_name in ('schema', 'topic')
+            if ttl_seconds[entity_name] is not None
+        ]
+        return time.time() + min(ttls) if ttls else float('inf')
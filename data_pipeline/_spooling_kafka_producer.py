@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import sys
+import time
+from collections import namedtuple
+
+from data_pipeline._pipelined_kafka_producer import PipelinedKafkaProducer
+from data_pipeline._producer_memory_budget import get_producer_memory_budget
+from data_pipeline._producer_spool import ProducerSpool
+from data_pipeline._retry_util import MaxRetryError
+from data_pipeline.config import get_config
+
+
+logger = get_config().logger
+
+
+_SpooledBatch = namedtuple('_SpooledBatch', [
+    'spool_record',             # Record of the batch in the spool
+    'message_buffer',           # Prepared messages, read back from the spool
+    'message_count',            # Number of messages in the batch
+    'message_bytes',            # Memory reserved for the messages until
+                                # they're written to the spool
+    'position_info_snapshot'    # Position info once the batch is published,
+                                # or None for batches recovered from the spool
+])
+
+
+SpoolStats = namedtuple('SpoolStats', [
+    'pending_batch_count',      # Batches in the spool waiting to be published
+    'pending_bytes',            # Bytes of the batches waiting in the spool
+    'replayed_message_count',   # Messages published from the spool so far
+    'replayed_bytes',           # Bytes published from the spool so far
+    'replay_seconds'            # Time spent publishing from the spool so far
+])
+
+
+class SpoolingKafkaProducer(PipelinedKafkaProducer):
+    """SpoolingKafkaProducer extends PipelinedKafkaProducer to write each
+    buffer handed off to the sender thread to a local spool on disk first, so
+    publishing carries on while Kafka is unavailable.
+
+    Handing off a buffer appends it to the spool with a single fsync, and
+    gives back its memory.  The sender thread reads the batches back from
+    the spool and publishes them in order.  When a batch can't be published
+    within `producer_max_publish_retry_count` retries, the sender waits
+    `kafka_producer_spool_retry_interval_seconds` and retries it again, for
+    as long as it takes, instead of failing.  Publishing only blocks once
+    `kafka_producer_spool_max_bytes` bytes of batches are waiting in the
+    spool, and :meth:`flush_buffered_messages` blocks until the spool is
+    drained.
+
+    A batch is removed from the spool once it's published, before the
+    position data is updated, so the position data never covers a message
+    that hasn't been published.  Batches left in the spool by a producer
+    that crashed or was closed while Kafka was unavailable are published
+    when a producer is created with the same spool directory, before any
+    new message.  Their position info isn't known anymore, so they don't
+    update the position data.  The upstream source should then be replayed
+    with :meth:`data_pipeline.producer.Producer.ensure_messages_published`,
+    which flushes the producer to publish them before looking up the high
+    watermarks, and then skips them as already published.
+
+    Messages that were published by a retry round which failed to verify
+    them may be published twice.
+
+    :meth:`get_spool_stats` reports the size of the spool and the throughput
+    of the sender thread publishing from it.
+
+    Args:
+        producer_position_callback (function): See
+            :class:`data_pipeline._kafka_producer.KafkaProducer`.
+        spool_dir (str): directory of the spool.  Only one producer can use a
+            spool directory at a time.
+    """
+
+    def __init__(self, producer_position_callback, spool_dir, *args, **kwargs):
+        self._spool = ProducerSpool(spool_dir)
+        self._is_closing = False
+        self._handed_off_batch_count = 0
+        self._spooled_batch_count = 0
+        self._replayed_message_count = 0
+        self._replayed_bytes = 0
+        self._replay_seconds = 0
+        self._backlog_start_time = None
+        try:
+            super(SpoolingKafkaProducer, self).__init__(
+                producer_position_callback,
+                *args,
+                **kwargs
+            )
+        except:
+            self._spool.close()
+            raise
+        recovered_records = self._spool.get_recovered_records()
+        if recovered_records:
+            self._backlog_start_time = time.time()
+        with self._condition:
+            for record in recovered_records:
+                self._batches.append(_SpooledBatch(
+                    spool_record=record,
+                    message_buffer=None,
+                    message_count=record.message_count,
+                    message_bytes=0,
+                    position_info_snapshot=None
+                ))
+                self._in_flight_batch_count += 1
+            self._condition.notify_all()
+
+    def close(self):
+        try:
+            with self._condition:
+                self._raise_if_sender_failed()
+                # The spool may be full, but the last buffer is spooled anyway
+                # so closing doesn't wait on Kafka.
+                self._is_closing = True
+                if self.message_buffer_size > 0:
+                    self._hand_off_message_buffer()
+        finally:
+            # The sender thread tries to publish the batches left once more,
+            # and leaves them in the spool if Kafka is still unavailable.
+            with self._condition:
+                self._is_closed = True
+                self._condition.notify_all()
+            self._sender.join()
+            self._release_unpublished_memory()
+            if self._in_flight_batch_count > 0:
+                logger.warning(
+                    "Closing with {0} batches ({1} bytes) left in the spool "
+                    "{2}.".format(
+                        self._in_flight_batch_count,
+                        self._spool.pending_bytes,
+                        self._spool.spool_dir
+                    )
+                )
+            self._spool.close()
+        self.kafka_client.close()
+        if self._metadata_client is not None:
+            self._metadata_client.close()
+
+    def get_spool_stats(self):
+        """Returns the :class:`SpoolStats` of the producer."""
+        with self._condition:
+            return SpoolStats(
+                pending_batch_count=self._in_flight_batch_count,
+                pending_bytes=self._spool.pending_bytes,
+                replayed_message_count=self._replayed_message_count,
+                replayed_bytes=self._replayed_bytes,
+                replay_seconds=self._replay_seconds
+            )
+
+    def _is_batch_limit_reached(self):
+        return (
+            not self._is_closing and
+            self._in_flight_batch_count > 0 and
+            self._spool.pending_bytes >= get_config().kafka_producer_spool_max_bytes
+        )
+
+    def _create_batch(self):
+        return _SpooledBatch(
+            spool_record=None,
+            message_buffer=self.message_buffer,
+            message_count=self.message_buffer_size,
+            message_bytes=self.message_buffer_bytes,
+            position_info_snapshot=(
+                self.position_data_tracker.get_position_info_snapshot()
+            )
+        )
+
+    def _append_batch(self, batch):
+        """Writes the batch to the spool and queues it for the sender thread.
+        The lock is released while the batch is written, so publishing and
+        sending aren't held up by the fsync, and the batches are written and
+        queued in the order they're handed off.  Must be called with the lock
+        held.
+        """
+        batch_index = self._handed_off_batch_count
+        self._handed_off_batch_count += 1
+        while self._spooled_batch_count < batch_index:
+            self._condition.wait()
+        self._condition.release()
+        try:
+            record = self._spool.append(batch.message_buffer)
+        except Exception:
+            logger.exception("Failed to spool a batch of {0} messages.".format(
+                batch.message_count
+            ))
+            record = None
+            exc_info = sys.exc_info()
+        finally:
+            # The messages are on disk now, so their memory is given back
+            # right away instead of once they're published.
+            get_producer_memory_budget().release(batch.message_bytes)
+            self._condition.acquire()
+        self._spooled_batch_count += 1
+        self._condition.notify_all()
+        if record is None:
+            # The messages of the batch are lost, so the producer fails like
+            # it does when the sender thread can't publish a batch.
+            self._in_flight_batch_count -= 1
+            self._sender_exc_info = exc_info
+            return
+        self._batches.append(batch._replace(
+            spool_record=record,
+            message_buffer=None,
+            message_bytes=0
+        ))
+
+    def _record_messages_published(self, topic_partition, stats):
+        if self._sending_batch.position_info_snapshot is not None:
+            super(SpoolingKafkaProducer, self)._record_messages_published(
+                topic_partition,
+                stats
+            )
+            return
+        # The messages of batches recovered from the spool were never
+        # recorded as buffered, so only their offsets are tracked.
+        self.position_data_tracker.update_high_watermark(
+            topic=topic_partition.topic_name,
+            offset=stats.original_offset,
+            message_count=stats.message_count,
+            partition=topic_partition.partition
+        )
+
+    def _send_batch(self, batch):
+        start_time = time.time()
+        try:
+            self._sending_batch = batch._replace(
+                message_buffer=self._spool.read(batch.spool_record)
+            )
+            self._publish_spooled_batch()
+            self._spool.commit(batch.spool_record)
+            if batch.position_info_snapshot is not None:
+                with self._condition:
+                    position_data = self.position_data_tracker.get_position_data_at_snapshot(
+                        batch.position_info_snapshot
+                    )
+                self.producer_position_callback(position_data)
+        except Exception:
+            logger.exception("Failed to publish a spooled batch of {0} messages.".format(
+                batch.message_count
+            ))
+            with self._condition:
+                self._sender_exc_info = sys.exc_info()
+                self._condition.notify_all()
+            return
+        finally:
+            self._sending_batch = None
+        with self._condition:
+            self._replayed_message_count += batch.message_count
+            self._replayed_bytes += batch.spool_record.byte_count
+            self._replay_seconds += time.time() - start_time
+            self._in_flight_batch_count -= 1
+            if self._in_flight_batch_count == 0:
+                self._log_backlog_drained()
+            self._condition.notify_all()
+
+    def _publish_spooled_batch(self):
+        """Publishes the batch being sent, retrying until Kafka is available
+        again, unless the producer is closed.
+        """
+        while True:
+            try:
+                self._publish_buffered_messages()
+                return
+            except MaxRetryError:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+            retry_interval = get_config().kafka_producer_spool_retry_interval_seconds
+            with self._condition:
+                if self._backlog_start_time is None:
+                    self._backlog_start_time = time.time()
+                if not self._is_closed:
+                    logger.warning(
+                        "Kafka is unavailable, {0} batches ({1} bytes) are "
+                        "waiting in the spool.  Retrying in {2} seconds.".format(
+                            self._in_flight_batch_count,
+                            self._spool.pending_bytes,
+                            retry_interval
+                        )
+                    )
+                    self._condition.wait(retry_interval)
+                if self._is_closed:
+                    raise exc_type, exc_value, exc_traceback
+
+    def _log_backlog_drained(self):
+        """Logs the throughput of publishing the batches that piled up in the
+        spool while Kafka was unavailable, or that were recovered from it,
+        once they're all published.  Must be called with the lock held.
+        """
+        if self._backlog_start_time is None:
+            return
+        logger.info(
+            "The spool is drained after {0:.1f} seconds.  Published {1} "
+            "messages ({2} bytes) from it so far, at {3:.1f} messages per "
+            "second.".format(
+                time.time() - self._backlog_start_time,
+                self._replayed_message_count,
+                self._replayed_bytes,
+                self._replayed_message_count / max(self._replay_seconds, 0.001)
+            )
+        )
+        self._backlog_start_time = None
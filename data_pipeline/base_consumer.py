@@ -20,13 +20,13 @@ from collections import defaultdict
 from contextlib import contextmanager
 
 from cached_property import cached_property
-from kafka import KafkaClient
 from kafka.common import FailedPayloadsError
 from kafka.common import OffsetCommitRequest
 from kafka.util import kafka_bytestring
 from yelp_kafka.config import KafkaConsumerConfig
 
 from data_pipeline._consumer_tick import _ConsumerTick
+from data_pipeline._kafka_client_pool import get_kafka_client
 from data_pipeline._retry_util import ExpBackoffPolicy
 from data_pipeline._retry_util import retry_on_exception
 from data_pipeline._retry_util import RetryPolicy
@@ -167,6 +167,16 @@ class BaseConsumer(Client):
             Consumer will connect to Kafka cluster in the corresponding region.
             All topics should belong to the same kafka cluster name.
             Defaults to None.
+        payload_fields (Optional[dict]): Map of topic names (str) or reader
+            schema ids (int) to the names of the payload fields the consumer
+            needs from their messages.  Only these fields are decoded into
+            the `payload_data` and `previous_payload_data` of the messages,
+            the others are skipped without being decoded, which is much
+            cheaper for wide schemas.  The primary key fields are always
+            decoded too, for the `keys` of the messages.  Schema ids take precedence over topic
+            names; the reader schema id is the one the message was encoded
+            with when no reader schema is specified for its topic.  All the
+            fields of the other messages are decoded.  Defaults to None.
     """
 
     def __init__(
@@ -185,7 +195,8 @@ class BaseConsumer(Client):
         post_rebalance_callback=None,
         fetch_offsets_for_topics=None,
         pre_topic_refresh_callback=None,
-        cluster_name=None
+        cluster_name=None,
+        payload_fields=None
     ):
         super(BaseConsumer, self).__init__(
             consumer_name,
@@ -223,6 +234,10 @@ class BaseConsumer(Client):
             max_retry_count=get_config().consumer_max_offset_retry_count
         )
         self._envelope = Envelope()
+        self._payload_fields = payload_fields or {}
+        self._has_schema_payload_fields = any(
+            isinstance(key, int) for key in self._payload_fields
+        )
         if self.topic_to_consumer_topic_state_map:
             self.cluster_type = self._determine_cluster_type_from_topics(
                 self.topic_to_consumer_topic_state_map.keys()
@@ -312,6 +327,24 @@ class BaseConsumer(Client):
                     )
         return topic_to_reader_schema_map
 
+    def _get_payload_fields(self, topic, reader_schema_id, packed_message):
+        """Returns the payload fields to decode from the packed message, or
+        None to decode all of them.  The schema id of messages without a
+        reader schema is only peeked from the envelope when fields are
+        specified by schema id.
+        """
+        if not self._payload_fields:
+            return None
+        if self._has_schema_payload_fields:
+            if reader_schema_id is None:
+                reader_schema_id = self._envelope.peek(
+                    packed_message,
+                    fields=['schema_id']
+                )['schema_id']
+            if reader_schema_id in self._payload_fields:
+                return self._payload_fields[reader_schema_id]
+        return self._payload_fields.get(topic)
+
     def _set_topic_to_partition_map(self, topic_to_consumer_topic_state_map):
         """ This function takes a topic_to_consumer_topic_state_map and sets
         the topic_to_partition_map instance variable with topic names as keys
@@ -404,7 +437,7 @@ class BaseConsumer(Client):
     @cached_property
     def kafka_client(self):
         """ Returns the `KafkaClient` object."""
-        return KafkaClient(self._region_cluster_config.broker_list)
+        return get_kafka_client(self._region_cluster_config.broker_list)
 
     @property
     def client_type(self):
@@ -482,6 +515,8 @@ class BaseConsumer(Client):
             self._stop()
         self.registrar.stop()
         self.kafka_client.close()
+        # A new client is taken if the consumer is started again.
+        del self.kafka_client
         self.reset_topic_to_partition_offset_cache()
         self.running = False
         logger.info("Consumer '{0}' stopped".format(self.client_name))
@@ -313,6 +313,33 @@ class _Monitor(object):
         track_info = self._flush_previous_track_info(track_info)
         track_info['message_count'] += 1
 
+    def record_messages(self, messages):
+        """Records the messages in order, the same as calling
+        :meth:`record_message` with each of them.  The record of the topic is
+        only looked up again when the topic changes or a message falls past
+        the monitoring window of the record.
+        """
+        if not self.monitoring_enabled:
+            return
+
+        track_info = None
+        next_start_time = None
+        for message in messages:
+            if (
+                track_info is None or
+                message.topic != track_info['topic'] or
+                message.timestamp >= next_start_time
+            ):
+                self._last_msg_timestamp = message.timestamp
+                track_info = self._flush_previous_track_info(
+                    self._get_record(message.topic)
+                )
+                next_start_time = (track_info['start_timestamp'] +
+                                   self._monitoring_window_in_sec)
+            track_info['message_count'] += 1
+        if track_info is not None:
+            self._last_msg_timestamp = message.timestamp
+
     def _flush_previous_track_info(self, current_track_info):
         next_start_time = (current_track_info['start_timestamp'] +
                            self._monitoring_window_in_sec)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from enum import Enum
+from kafka.protocol import CODEC_GZIP
+from kafka.protocol import CODEC_NONE
+from kafka.protocol import CODEC_SNAPPY
+
+
+class CompressionCodecEnum(Enum):
+    """Enum that specifies how the producer compresses the messages it
+    publishes into Kafka.  Compressed messages are wrapped into message sets
+    that Kafka stores and hands to consumers as they are, and consumers
+    decompress them transparently.
+
+    Attributes:
+      none: messages are published uncompressed.
+      gzip: messages are compressed with gzip.
+      snappy: messages are compressed with snappy, which requires the
+        python-snappy package.
+    """
+
+    none = CODEC_NONE
+    gzip = CODEC_GZIP
+    snappy = CODEC_SNAPPY
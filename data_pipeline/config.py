@@ -24,6 +24,8 @@ from bravado.client import SwaggerClient
 from cached_property import cached_property
 from kafka_utils.util.config import ClusterConfig
 
+from data_pipeline.schematizer_clientlib.http_client import PooledRequestsClient
+
 
 namespace = 'data_pipeline'
 data_pipeline_conf = staticconf.NamespaceReaders(namespace)
@@ -131,9 +133,23 @@ class Config(object):
 
         By default, this will connect to a schematizer instance running in the
         included docker-compose file.
+
+        A new client is built, and the swagger spec fetched, on every access.
+        Use :func:`data_pipeline.schematizer_clientlib.schematizer.get_schematizer`
+        to share a single client across the process instead.
+
+        The client keeps pooled keep-alive connections to the schematizer, see
+        :meth:`schematizer_client_max_connections_per_host`,
+        :meth:`schematizer_client_connect_timeout_seconds`, and
+        :meth:`schematizer_client_read_timeout_seconds`.
         """
         return SwaggerClient.from_url(
-            'http://{0}/swagger.json'.format(self.schematizer_host_and_port)
+            'http://{0}/swagger.json'.format(self.schematizer_host_and_port),
+            http_client=PooledRequestsClient(
+                max_connections_per_host=self.schematizer_client_max_connections_per_host,
+                connect_timeout=self.schematizer_client_connect_timeout_seconds,
+                read_timeout=self.schematizer_client_read_timeout_seconds
+            )
         )
 
     @property
@@ -146,6 +162,140 @@ class Config(object):
             default=5
         )
 
+    @property
+    def schematizer_client_max_connections_per_host(self):
+        """Maximum number of keep-alive connections schematizer_clientlib keeps
+        open to the schematizer.  It also bounds the number of requests in
+        flight, as a request waits for a free connection when all of them are
+        in use.  Default to 10.
+        """
+        return data_pipeline_conf.read_int(
+            'schematizer_client_max_connections_per_host',
+            default=10
+        )
+
+    @property
+    def schematizer_client_connect_timeout_seconds(self):
+        """Number of seconds schematizer_clientlib waits for a connection to
+        the schematizer to be established before the attempt fails and is
+        retried.  Default to 5 seconds.
+        """
+        return data_pipeline_conf.read_float(
+            'schematizer_client_connect_timeout_seconds',
+            default=5
+        )
+
+    @property
+    def schematizer_client_read_timeout_seconds(self):
+        """Number of seconds schematizer_clientlib waits for the response of a
+        schematizer request before the attempt fails and is retried.  Default
+        to 30 seconds.
+        """
+        return data_pipeline_conf.read_float(
+            'schematizer_client_read_timeout_seconds',
+            default=30
+        )
+
+    @property
+    def schematizer_client_max_concurrent_requests(self):
+        """Maximum number of requests schematizer_clientlib sends to the
+        schematizer at the same time when it looks up entities in bulk, such
+        as :meth:`data_pipeline.schematizer_clientlib.schematizer.
+        SchematizerClient.get_schemas_by_ids`.  Default to 10.
+        """
+        return data_pipeline_conf.read_int(
+            'schematizer_client_max_concurrent_requests',
+            default=10
+        )
+
+    @property
+    def schematizer_persistent_cache_path(self):
+        """Path of the local file that persists the schematizer client cache
+        across restarts, so schemas, topics, and sources seen by a previous
+        run are loaded from disk instead of the Schematizer.  The persistent
+        cache is disabled if this is not set, which is the default.
+        """
+        return data_pipeline_conf.read_string(
+            'schematizer_persistent_cache_path',
+            default=None
+        )
+
+    @property
+    def schematizer_persistent_cache_max_age_seconds(self):
+        """Entries in the persistent schematizer client cache older than this
+        many seconds are ignored and fetched from the Schematizer again.
+        Default to 86400 seconds (1 day).
+        """
+        return data_pipeline_conf.read_float(
+            'schematizer_persistent_cache_max_age_seconds',
+            default=86400
+        )
+
+    @property
+    def schematizer_negative_cache_ttl_seconds(self):
+        """Number of seconds the schematizer client remembers that a schema,
+        topic, or source doesn't exist in the Schematizer, so that repeated
+        lookups of it fail right away with the same error instead of asking
+        the Schematizer again.  Enabling it means an entity registered right
+        after a failed lookup of it isn't found until the error expires.
+        Default to 0, which disables the negative cache.
+        """
+        return data_pipeline_conf.read_float(
+            'schematizer_negative_cache_ttl_seconds',
+            default=0
+        )
+
+    @property
+    def schematizer_cache_max_entries(self):
+        """Maximum number of entities of each type the schematizer client keeps
+        in memory, as a dict keyed by entity type: `schema`, `topic`, `source`,
+        `data_target`, and `consumer_group`.  The least recently used entities
+        are evicted beyond that.  Each type can be configured separately, e.g.
+        `schematizer_cache_max_entries.schema: 20000`, and `None` means the type
+        is unbounded.  Default to 5000 schemas, topics, and sources, and 1000
+        data targets and consumer groups.
+        """
+        defaults = {
+            'schema': 5000,
+            'topic': 5000,
+            'source': 5000,
+            'data_target': 1000,
+            'consumer_group': 1000
+        }
+        return {
+            entity_name: data_pipeline_conf.read(
+                'schematizer_cache_max_entries.{0}'.format(entity_name),
+                default=default
+            )
+            for entity_name, default in defaults.iteritems()
+        }
+
+    @property
+    def schematizer_cache_ttl_seconds(self):
+        """Number of seconds an entity cached by the schematizer client is used
+        before it's fetched from the Schematizer again, as a dict keyed by the
+        same entity types as :meth:`schematizer_cache_max_entries`, e.g.
+        `schematizer_cache_ttl_seconds.topic: 300`.  A stale schema, topic, or
+        source keeps being served while it's refreshed in the background.
+        `None` means the entity never expires.  Default to 600 seconds for
+        topics and sources, so that changes such as `contains_pii` are picked
+        up, and no expiration for the other types.
+        """
+        defaults = {
+            'schema': None,
+            'topic': 600,
+            'source': 600,
+            'data_target': None,
+            'consumer_group': None
+        }
+        return {
+            entity_name: data_pipeline_conf.read(
+                'schematizer_cache_ttl_seconds.{0}'.format(entity_name),
+                default=default
+            )
+            for entity_name, default in defaults.iteritems()
+        }
+
     @property
     def cluster_config(self):
         """Returns a yelp_kafka.config.ClusterConfig.
@@ -328,6 +478,18 @@ class Config(object):
         """
         return data_pipeline_conf.read_int('kafka_client_ack_count', default=-1)
 
+    @property
+    def share_kafka_clients(self):
+        """Whether the producers, consumers and tools of the process share a
+        kafka client per cluster, instead of each opening its own broker
+        connections and metadata cache.  Calls through a shared client are
+        serialized, since kafka clients aren't thread-safe, so sharing trades
+        latency for fewer connections: e.g. the offset commits of a consumer
+        wait for the produce requests of a producer of the same process to
+        the same cluster.  Default to False.
+        """
+        return data_pipeline_conf.read_bool('share_kafka_clients', default=False)
+
     @property
     def producer_max_publish_retry_count(self):
         """Number of times the producer will retry to publish messages.
@@ -356,6 +518,83 @@ class Config(object):
             default=5000
         )
 
+    @property
+    def kafka_producer_buffer_bytes(self):
+        """The maximum number of bytes of encoded messages that the clientlib
+        will buffer before sending them out to kafka.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_buffer_bytes',
+            default=5 * 1024 * 1024
+        )
+
+    @property
+    def kafka_producer_max_request_bytes(self):
+        """The maximum number of bytes of encoded messages sent to kafka at
+        once.  Larger buffers are published in several requests.  It should
+        stay below the `socket.request.max.bytes` of the brokers.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_max_request_bytes',
+            default=100 * 1024 * 1024
+        )
+
+    @property
+    def kafka_producer_memory_budget_bytes(self):
+        """The maximum number of bytes of encoded messages that all the
+        producers of the process together hold before they're published.
+        Publishing blocks once it's reached.  The default of 0 means no limit.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_memory_budget_bytes',
+            default=0
+        )
+
+    @property
+    def kafka_producer_memory_budget_timeout_seconds(self):
+        """The maximum amount of time in seconds that publishing blocks on
+        the producer memory budget before raising
+        :class:`data_pipeline._producer_memory_budget.MemoryBudgetExceededError`.
+        0 raises right away.
+        """
+        return data_pipeline_conf.read_float(
+            'kafka_producer_memory_budget_timeout_seconds',
+            default=10
+        )
+
+    @property
+    def kafka_producer_spool_max_bytes(self):
+        """The maximum number of bytes of batches a producer created with a
+        `spool_dir` keeps in its spool waiting to be published, before
+        publishing blocks until some of them are published.  Default to 1 GiB.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_spool_max_bytes',
+            default=1024 * 1024 * 1024
+        )
+
+    @property
+    def kafka_producer_spool_segment_bytes(self):
+        """The size in bytes a segment file of a producer spool grows to
+        before a new segment is started.  Segments are deleted once all their
+        batches are published.  Default to 64 MiB.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_spool_segment_bytes',
+            default=64 * 1024 * 1024
+        )
+
+    @property
+    def kafka_producer_spool_retry_interval_seconds(self):
+        """The amount of time in seconds a producer created with a
+        `spool_dir` waits, after failing to publish a batch from its spool
+        within `producer_max_publish_retry_count` retries, before retrying it.
+        """
+        return data_pipeline_conf.read_float(
+            'kafka_producer_spool_retry_interval_seconds',
+            default=5
+        )
+
     @property
     def kafka_producer_flush_time_limit_seconds(self):
         """The maximum amount of time in seconds that the clientlib will wait
@@ -366,6 +605,50 @@ class Config(object):
             default=0.1
         )
 
+    @property
+    def kafka_producer_max_in_flight_batches(self):
+        """The maximum number of buffers a pipelined producer hands off to its
+        sender thread before publishing blocks until one of them is sent.  The
+        default of 1 double-buffers publishing: one buffer is being sent while
+        the next one is filled.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_max_in_flight_batches',
+            default=1
+        )
+
+    @property
+    def kafka_producer_prepare_worker_count(self):
+        """The number of subprocesses a producer created with `use_work_pool`
+        uses to schematize and pack messages.  The default of 0 uses one
+        subprocess per CPU.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_prepare_worker_count',
+            default=0
+        )
+
+    @property
+    def kafka_producer_prepare_chunk_size(self):
+        """The number of messages a producer created with `use_work_pool`
+        hands to its subprocesses at a time.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_prepare_chunk_size',
+            default=100
+        )
+
+    @property
+    def kafka_producer_max_pending_prepare_chunks(self):
+        """The maximum number of chunks of messages a producer created with
+        `use_work_pool` waits on its subprocesses to prepare before publishing
+        blocks until one of them is prepared.
+        """
+        return data_pipeline_conf.read_int(
+            'kafka_producer_max_pending_prepare_chunks',
+            default=16
+        )
+
     @property
     def skip_position_info_update_when_not_set(self):
         """By default, the clientlib will replace upstream position info in the
@@ -101,6 +101,10 @@ class Consumer(BaseConsumer):
             from (current_topics) and a set of topic names Consumer will be
             consuming from (refreshed_topics). The return value of the
             function is ignored.
+        payload_fields (Optional[dict]): Map of topic names (str) or reader
+            schema ids (int) to the names of the payload fields to decode.
+            See parameter `payload_fields` in
+            :class:`data_pipeline.base_consumer.BaseConsumer`.
 
     Note:
         The Consumer leverages the yelp_kafka `KafkaConsumerGroup`.
@@ -223,12 +227,18 @@ class Consumer(BaseConsumer):
                 # It's possible kafka_message is None if we used all our time
                 # stuck getting EINTR IOErrors
                 if kafka_message:
+                    reader_schema_id = self._topic_to_reader_schema_map.get(
+                        kafka_message.topic
+                    )
                     message = create_from_kafka_message(
                         kafka_message,
                         self._envelope,
                         self.force_payload_decode,
-                        reader_schema_id=self._topic_to_reader_schema_map.get(
-                            kafka_message.topic
+                        reader_schema_id=reader_schema_id,
+                        payload_fields=self._get_payload_fields(
+                            kafka_message.topic,
+                            reader_schema_id,
+                            kafka_message.value
                         )
                     )
                     messages.append(message)
@@ -133,16 +133,14 @@ class FixedSchemas(ConsumerSource):
         self.schema_ids = schema_ids
 
     def get_topics(self):
-        topics = {
-            self.schematizer.get_schema_by_id(schema_id).topic.name
-            for schema_id in self.schema_ids
-        }
+        topics = set(self.get_schema_to_topic_map().values())
         return list(topics)
 
     def get_schema_to_topic_map(self):
+        schemas = self.schematizer.get_schemas_by_ids(self.schema_ids)
         schema_to_topic_map = {
-            schema_id: self.schematizer.get_schema_by_id(schema_id).topic.name
-            for schema_id in self.schema_ids
+            schema_id: schema.topic.name
+            for schema_id, schema in zip(self.schema_ids, schemas)
         }
         return schema_to_topic_map
 
@@ -25,6 +25,12 @@ from cached_property import cached_property
 from data_pipeline_avro_util.avro_string_reader import AvroStringReader
 from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
 
+from data_pipeline._envelope_codec import decode_envelope
+from data_pipeline._envelope_codec import encode_envelope
+from data_pipeline._envelope_codec import ENVELOPE_FIELD_NAMES
+from data_pipeline._envelope_codec import peek_envelope
+from data_pipeline._envelope_codec import UnsupportedEnvelopeError
+
 
 class Envelope(object):
     """Envelope used to encode and identify a message for transport.
@@ -32,6 +38,11 @@ class Envelope(object):
     Envelope instances are meant to be long-lived and used to encode multiple
     messages.
 
+    Envelopes are encoded and decoded by a codec specialized for the envelope
+    schema, which produces the same bytes as the generic avro writer and
+    reader.  The generic ones are only used for data the codec doesn't
+    support, so invalid data fails the same way.
+
     Example:
         >>> from data_pipeline.message import CreateMessage
         >>> message = CreateMessage(schema_id=1, payload=bytes("FAKE MESSAGE"))
@@ -46,6 +57,8 @@ class Envelope(object):
         1
         >>> unpacked['payload']
         'FAKE MESSAGE'
+        >>> envelope.peek(packed_message, fields=['schema_id'])
+        {'schema_id': 1}
     """
 
     # Magic byte value of packed message specifying that it is base64 encoded.
@@ -93,7 +106,7 @@ class Envelope(object):
         Producer/Consumer registration will make use of this to instead send base64
         encoded strings.
         """
-        msg = bytes(0) + self._avro_string_writer.encode(message.avro_repr)
+        msg = bytes(0) + self._encode(message.avro_repr)
 
         if ascii_encoded:
             return self.ASCII_MAGIC_BYTE + base64.urlsafe_b64encode(msg)
@@ -118,4 +131,51 @@ class Envelope(object):
         if packed_message[0] == self.ASCII_MAGIC_BYTE:
             packed_message = base64.urlsafe_b64decode(packed_message[1:])
 
-        return self._avro_string_reader.decode(packed_message[1:])
+        return self._decode(packed_message[1:])
+
+    def peek(self, packed_message, fields):
+        """Decodes only the given fields of a message packed with :func:`pack`,
+        for readers that only need its metadata, e.g. its `timestamp` or
+        `schema_id`.  Decoding stops after the last of the fields in the
+        envelope schema, and the fields before it aren't copied, so peeking is
+        much cheaper than :func:`unpack` for large messages.
+
+        Args:
+            packed_message (bytes): The previously packed message
+            fields ([str]): Names of the envelope fields to decode, e.g.
+                `['message_type', 'timestamp']`.
+
+        Returns:
+            dict: The given fields, with the same values as :func:`unpack`.
+
+        Raises:
+            ValueError: If a field isn't in the envelope schema.
+        """
+        fields = set(fields)
+        unknown_fields = fields.difference(ENVELOPE_FIELD_NAMES)
+        if unknown_fields:
+            raise ValueError(
+                "Unknown envelope fields: {}".format(sorted(unknown_fields))
+            )
+
+        # If the magic byte is ASCII_MAGIC_BYTE, decode it from base64 to ASCII
+        if packed_message[0] == self.ASCII_MAGIC_BYTE:
+            packed_message = base64.urlsafe_b64decode(packed_message[1:])
+
+        try:
+            return peek_envelope(packed_message, fields)
+        except UnsupportedEnvelopeError:
+            unpacked_message = self._avro_string_reader.decode(packed_message[1:])
+            return {field: unpacked_message[field] for field in fields}
+
+    def _encode(self, avro_repr):
+        try:
+            return encode_envelope(avro_repr)
+        except UnsupportedEnvelopeError:
+            return self._avro_string_writer.encode(avro_repr)
+
+    def _decode(self, encoded_message):
+        try:
+            return decode_envelope(encoded_message)
+        except UnsupportedEnvelopeError:
+            return self._avro_string_reader.decode(encoded_message)
@@ -16,9 +16,8 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-from data_pipeline_avro_util.avro_string_reader import AvroStringReader
-from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
-
+from data_pipeline._compiled_avro_reader import CompiledAvroStringReader
+from data_pipeline._compiled_avro_writer import CompiledAvroStringWriter
 from data_pipeline.helpers.singleton import Singleton
 from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
 
@@ -31,6 +30,11 @@ class _AvroStringStore(object):
     This class was added for performance enhancements
     w store : pb/199453
     w/o store : pb/199448
+
+    The writers encode data with an encoder compiled for their schema, and
+    the readers decode data with a decoder compiled for their pair of schemas,
+    see :class:`data_pipeline._compiled_avro_writer.CompiledAvroStringWriter`
+    and :class:`data_pipeline._compiled_avro_reader.CompiledAvroStringReader`.
     """
     __metaclass__ = Singleton
 
@@ -47,6 +51,14 @@ class _AvroStringStore(object):
             schema_id
         ).schema_json
 
+    def _get_avro_schemas(self, schema_ids):
+        if not schema_ids:
+            return []
+        return [
+            schema.schema_json
+            for schema in self._schematizer.get_schemas_by_ids(schema_ids)
+        ]
+
     def get_writer(self, id_key, avro_schema=None):
         key = id_key
         avro_string_writer = self._writer_cache.get(key)
@@ -54,7 +66,7 @@ class _AvroStringStore(object):
             return avro_string_writer
 
         avro_schema = avro_schema or self._get_avro_schema(id_key)
-        avro_string_writer = AvroStringWriter(schema=avro_schema)
+        avro_string_writer = CompiledAvroStringWriter(schema=avro_schema)
         self._writer_cache[key] = avro_string_writer
         return avro_string_writer
 
@@ -63,22 +75,31 @@ class _AvroStringStore(object):
         reader_id_key,
         writer_id_key,
         reader_avro_schema=None,
-        writer_avro_schema=None
+        writer_avro_schema=None,
+        fields=None
     ):
         key = reader_id_key, writer_id_key
+        if fields is not None:
+            fields = frozenset(fields)
+            key += (fields,)
         avro_string_reader = self._reader_cache.get(key)
         if avro_string_reader:
             return avro_string_reader
 
-        reader_schema = (
-            reader_avro_schema or self._get_avro_schema(reader_id_key)
-        )
-        writer_schema = (
-            writer_avro_schema or self._get_avro_schema(writer_id_key)
-        )
-        avro_string_reader = AvroStringReader(
+        # Both schemas are looked up in one round if neither is given.
+        missing_id_keys = [
+            id_key for id_key, avro_schema in (
+                (reader_id_key, reader_avro_schema),
+                (writer_id_key, writer_avro_schema)
+            ) if not avro_schema
+        ]
+        fetched_schemas = iter(self._get_avro_schemas(missing_id_keys))
+        reader_schema = reader_avro_schema or next(fetched_schemas)
+        writer_schema = writer_avro_schema or next(fetched_schemas)
+        avro_string_reader = CompiledAvroStringReader(
             reader_schema=reader_schema,
-            writer_schema=writer_schema
+            writer_schema=writer_schema,
+            fields=fields
         )
         self._reader_cache[key] = avro_string_reader
         return avro_string_reader
@@ -24,10 +24,10 @@ from uuid import UUID
 from data_pipeline._avro_payload import _AvroPayload
 from data_pipeline._encryption_helper import EncryptionHelper
 from data_pipeline._fast_uuid import FastUUID
+from data_pipeline._schema_metadata import _SchemaMetadataStore
 from data_pipeline.config import get_config
 from data_pipeline.envelope import Envelope
 from data_pipeline.helpers.lists import unlist
-from data_pipeline.helpers.yelp_avro_store import _AvroStringStore
 from data_pipeline.message_type import _ProtectedMessageType
 from data_pipeline.message_type import MessageType
 from data_pipeline.meta_attribute import MetaAttribute
@@ -140,6 +140,11 @@ class Message(object):
             Hence meta should be set with a dict which contains schema_id and
             payload as keys to construct the MetaAttribute objects. The
             payload is deserialized using the schema_id.
+        payload_fields (Optional[iterable(str)]): Names of the fields of the
+            reader schema to decode the payload into `payload_data`.  The
+            other fields are skipped when decoding, and are left out of
+            `payload_data`.  The primary key fields are always decoded, so
+            `keys` is available.  All the fields are decoded by default.
 
     Remarks:
         Although `previous_payload` and `previous_payload_data` are not
@@ -160,6 +165,17 @@ class Message(object):
     def _schematizer(self):
         return get_schematizer()
 
+    @property
+    def _schema_metadata(self):
+        """Schematizer information about the schema of this message, which
+        is resolved once per schema and shared by all its messages.
+        """
+        if self._schema_metadata_state is None:
+            self._schema_metadata_state = _SchemaMetadataStore().get_metadata(
+                self.schema_id
+            )
+        return self._schema_metadata_state
+
     @property
     def topic(self):
         return self._topic
@@ -210,15 +226,7 @@ class Message(object):
 
     @property
     def contains_pii(self):
-        if self._contains_pii is not None:
-            return self._contains_pii
-        self._set_contains_pii()
-        return self._contains_pii
-
-    def _set_contains_pii(self):
-        self._contains_pii = self._schematizer.get_schema_by_id(
-            self.schema_id
-        ).topic.contains_pii
+        return self._schema_metadata.contains_pii
 
     @property
     def encryption_type(self):
@@ -239,14 +247,13 @@ class Message(object):
 
     @property
     def _should_be_encrypted(self):
-        """Whether this message should be encrypted.  So far the criteria used
-        to determine if the message should be encrypted is the pii information.
-        Include additional criteria if necessary.
+        """Whether this message should be encrypted.  The criteria are
+        determined per schema, see :attr:`_SchemaMetadata.should_be_encrypted`.
         """
         if self._should_be_encrypted_state is not None:
             return self._should_be_encrypted_state
 
-        self._should_be_encrypted_state = self.contains_pii
+        self._should_be_encrypted_state = self._schema_metadata.should_be_encrypted
         return self._should_be_encrypted_state
 
     def _set_encryption_meta(self):
@@ -349,39 +356,18 @@ class Message(object):
         return self._keys
 
     def _set_keys(self):
-        avro_schema = self._schematizer.get_schema_by_id(self.schema_id)
-        self._keys = {
-            key: self.payload_data[key] for key in avro_schema.primary_keys
-        }
+        primary_keys = self._schema_metadata.primary_keys
+        if not primary_keys:
+            self._keys = {}
+            return
+        payload_data = self.payload_data
+        self._keys = {key: payload_data[key] for key in primary_keys}
 
     @property
     def encoded_keys(self):
-        writer = _AvroStringStore().get_writer(
-            id_key="{0}_{1}".format("keys", self.schema_id),
-            avro_schema=self._keys_avro_json
-        )
-        return writer.encode(message_avro_representation=self.keys)
-
-    def _extract_key_fields(self):
-        avro_schema = self._schematizer.get_schema_by_id(
-            self.schema_id
+        return self._schema_metadata.keys_writer.encode(
+            message_avro_representation=self.keys
         )
-        schema_json = avro_schema.schema_json
-
-        fields = schema_json.get('fields', [])
-        field_name_to_field = {f['name']: f for f in fields}
-        key_fields = [field_name_to_field[pkey] for pkey in avro_schema.primary_keys]
-        return key_fields
-
-    @property
-    def _keys_avro_json(self):
-        return {
-            "type": "record",
-            "namespace": "yelp.data_pipeline",
-            "name": "primary_keys",
-            "doc": "Represents primary keys present in Message payload.",
-            "fields": self._extract_key_fields()
-        }
 
     @property
     def payload(self):
@@ -411,7 +397,8 @@ class Message(object):
         kafka_position_info=None,
         keys=None,
         dry_run=False,
-        meta=None
+        meta=None,
+        payload_fields=None
     ):
         # The decision not to just pack the message, but to validate it, is
         # intentional here.  We want to perform more sanity checks than avro
@@ -436,11 +423,11 @@ class Message(object):
             reader_schema_id=reader_schema_id,
             payload=payload,
             payload_data=payload_data,
-            dry_run=dry_run
-        )
-        self._set_topic(
-            topic or str(self._schematizer.get_schema_by_id(schema_id).topic.name)
+            dry_run=dry_run,
+            payload_fields=payload_fields
         )
+        self._schema_metadata_state = None
+        self._set_topic(topic or self._schema_metadata.topic_name)
         self._set_uuid(uuid)
         self._set_timestamp(timestamp)
         self._set_upstream_position_info(upstream_position_info)
@@ -452,7 +439,6 @@ class Message(object):
         self._set_meta(meta, schema_id)
         self._should_be_encrypted_state = None
         self._encryption_type = None
-        self._contains_pii = None
 
     def _is_valid_optional_type(self, value, typ):
         return value is None or isinstance(value, typ)
@@ -484,7 +470,8 @@ class Message(object):
         cls,
         unpacked_message,
         reader_schema_id=None,
-        kafka_position_info=None
+        kafka_position_info=None,
+        payload_fields=None
     ):
         encryption_type = unpacked_message['encryption_type']
         meta = cls._get_unpacked_meta(unpacked_message)
@@ -506,7 +493,8 @@ class Message(object):
             'reader_schema_id': reader_schema_id,
             'timestamp': unpacked_message['timestamp'],
             'meta': meta,
-            'kafka_position_info': kafka_position_info
+            'kafka_position_info': kafka_position_info,
+            'payload_fields': payload_fields
         }
         message_params.update(payloads)
         message = cls(**message_params)
@@ -706,6 +694,7 @@ class UpdateMessage(Message):
         keys=None,
         dry_run=False,
         meta=None,
+        payload_fields=None,
     ):
         super(UpdateMessage, self).__init__(
             schema_id,
@@ -721,13 +710,15 @@ class UpdateMessage(Message):
             keys=keys,
             dry_run=dry_run,
             meta=meta,
+            payload_fields=payload_fields,
         )
         self._previous_avro_payload = _AvroPayload(
             schema_id=schema_id,
             reader_schema_id=reader_schema_id,
             payload=previous_payload,
             payload_data=previous_payload_data,
-            dry_run=dry_run
+            dry_run=dry_run,
+            payload_fields=payload_fields
         )
 
     @property
@@ -818,7 +809,8 @@ def create_from_kafka_message(
     kafka_message,
     envelope=None,
     force_payload_decoding=True,
-    reader_schema_id=None
+    reader_schema_id=None,
+    payload_fields=None
 ):
     """ Build a data_pipeline.message.Message from a yelp_kafka message. If no
     reader schema id is provided, the schema used for encoding will be used for
@@ -837,6 +829,9 @@ def create_from_kafka_message(
         reader_schema_id (Optional[int]): Schema id used to decode the
             kafka_message and build data_pipeline.message.Message message.
             Defaults to None.
+        payload_fields (Optional[iterable(str)]): Names of the payload fields
+            to decode, see :class:`data_pipeline.message.Message`.  Defaults
+            to None, which decodes all the fields.
 
 
     Returns (class:`data_pipeline.message.Message`):
@@ -852,7 +847,8 @@ def create_from_kafka_message(
         envelope=envelope or Envelope(),
         force_payload_decoding=force_payload_decoding,
         kafka_position_info=kafka_position_info,
-        reader_schema_id=reader_schema_id
+        reader_schema_id=reader_schema_id,
+        payload_fields=payload_fields
     )
 
 
@@ -860,7 +856,8 @@ def create_from_offset_and_message(
     offset_and_message,
     force_payload_decoding=True,
     reader_schema_id=None,
-    envelope=None
+    envelope=None,
+    payload_fields=None
 ):
     """
     Build a data_pipeline.message.Message from a kafka.common.OffsetAndMessage.
@@ -880,6 +877,9 @@ def create_from_offset_and_message(
             Defaults to None.
         envelope (Optional[:class:data_pipeline.envelope.Envelope]): Envelope
             instance that unpacks the data pipeline messages.
+        payload_fields (Optional[iterable(str)]): Names of the payload fields
+            to decode, see :class:`data_pipeline.message.Message`.  Defaults
+            to None, which decodes all the fields.
 
     Returns (data_pipeline.message.Message):
         The message object
@@ -888,7 +888,8 @@ def create_from_offset_and_message(
         packed_message=offset_and_message.message,
         envelope=envelope or Envelope(),
         force_payload_decoding=force_payload_decoding,
-        reader_schema_id=reader_schema_id
+        reader_schema_id=reader_schema_id,
+        payload_fields=payload_fields
     )
 
 
@@ -897,7 +898,8 @@ def _create_message_from_packed_message(
     envelope,
     force_payload_decoding,
     kafka_position_info=None,
-    reader_schema_id=None
+    reader_schema_id=None,
+    payload_fields=None
 ):
     """ Builds a data_pipeline.message.Message from packed_message. If no
     reader schema id is provided, the schema used for encoding will be used for
@@ -918,6 +920,9 @@ def _create_message_from_packed_message(
         reader_schema_id (Optional[int]): Schema id used to decode the incoming
             kafka message and build data_pipeline.message.Message message.
             Defaults to None.
+        payload_fields (Optional[iterable(str)]): Names of the payload fields
+            to decode, see :class:`data_pipeline.message.Message`.  Defaults
+            to None, which decodes all the fields.
 
     Returns (data_pipeline.message.Message):
         The message object
@@ -927,7 +932,8 @@ def _create_message_from_packed_message(
     message = message_class.create_from_unpacked_message(
         unpacked_message=unpacked_message,
         kafka_position_info=kafka_position_info,
-        reader_schema_id=reader_schema_id
+        reader_schema_id=reader_schema_id,
+        payload_fields=payload_fields
     )
     if force_payload_decoding:
         # Access the cached, but lazily-calculated, properties
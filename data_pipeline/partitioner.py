@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+This module contains the partitioners that decide which partition of its topic
+each published message goes to.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import zlib
+from collections import defaultdict
+
+
+class Partitioner(object):
+    """Base class of the partitioners.  A partitioner is only asked for the
+    partition of messages whose topic has more than one partition.
+    """
+
+    def partition(self, message, partitions):
+        """Returns the partition the message should be published to.
+
+        Args:
+            message (data_pipeline.message.Message): message to publish
+            partitions ([int]): sorted ids of the partitions of the topic of
+                the message.
+
+        Returns:
+            int: one of the given partition ids.
+        """
+        raise NotImplementedError
+
+
+class RoundRobinPartitioner(Partitioner):
+    """Spreads the messages of each topic evenly across its partitions, in
+    turn.
+    """
+
+    def __init__(self):
+        self._topic_to_next_index = defaultdict(int)
+
+    def partition(self, message, partitions):
+        index = self._topic_to_next_index[message.topic]
+        self._topic_to_next_index[message.topic] = index + 1
+        return partitions[index % len(partitions)]
+
+
+class KeyHashPartitioner(RoundRobinPartitioner):
+    """Publishes messages with the same primary keys to the same partition,
+    using a stable hash of :attr:`data_pipeline.message.Message.encoded_keys`,
+    so the messages of each key stay ordered.  Messages without primary keys
+    are spread across partitions in turn.
+
+    The hash doesn't depend on the process, so the partition of a message can
+    be worked out again when recovering with
+    :meth:`data_pipeline.producer.Producer.ensure_messages_published`.
+    """
+
+    def partition(self, message, partitions):
+        if not message.keys:
+            return super(KeyHashPartitioner, self).partition(message, partitions)
+        key_hash = zlib.crc32(message.encoded_keys) & 0xffffffff
+        return partitions[key_hash % len(partitions)]
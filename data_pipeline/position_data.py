@@ -23,7 +23,8 @@ class PositionData(namedtuple("PositionData", [
     "last_published_message_position_info",
     "topic_to_last_position_info_map",
     "topic_to_kafka_offset_map",
-    "merged_upstream_position_info_map"
+    "merged_upstream_position_info_map",
+    "topic_to_partition_offset_map"
 ])):
     """Contains information about the last messages successfully published into
     Kafka.
@@ -41,6 +42,8 @@ class PositionData(namedtuple("PositionData", [
         {}
         >>> position_data.topic_to_kafka_offset_map
         {}
+        >>> position_data.topic_to_partition_offset_map
+        {}
 
         :class:`PositionData` will be updated as data is actually published:
 
@@ -59,6 +62,8 @@ class PositionData(namedtuple("PositionData", [
         {'my-topic': {'upstream_offset': 'offset-info'}}
         >>> position_data.topic_to_kafka_offset_map   # doctest: +ELLIPSIS
         {'my-topic': ...}
+        >>> position_data.topic_to_partition_offset_map   # doctest: +ELLIPSIS
+        {'my-topic': {0: ...}}
         >>> position_data.merged_upstream_position_info_map
         {'upstream_offset': 'offset-info'}
 
@@ -107,9 +112,12 @@ class PositionData(namedtuple("PositionData", [
                     {'my-topic': {'gtid': 'UPSTREAM_GTID_INFO', 'offset': 'UPSTREAM_OFFSET_INFO'}}
 
         topic_to_kafka_offset_map (dict[str, int]): This maps from each kafka
-            topic to the offset following the last published message, which will
-            correspond to the offset of the next message published into the
-            topic.
+            topic to the offset following the last published message in
+            partition 0 of the topic, which will correspond to the offset of
+            the next message published into that partition.  Topics usually
+            have a single partition, in which case this is the offset of the
+            next message published into the topic.  For topics with several
+            partitions, use `topic_to_partition_offset_map` instead.
 
             **Example**:
 
@@ -139,6 +147,22 @@ class PositionData(namedtuple("PositionData", [
                 like::
 
                     {topic: {partition: offset}}
+
+        topic_to_partition_offset_map (dict[str, dict[int, int]]): This maps
+            from each kafka topic to the offset following the last published
+            message in each partition of the topic published to in this
+            session.  It's None in position data created without it, e.g. by
+            code written before it was added.
+
+            **Example**:
+
+                The dictionary will contain a Kafka offset for each partition
+                published to in this session::
+
+                    {'topic1': {0: offset1, 1: offset2}, 'topic2': {0: offset3}}
     """
     # This is a class instead of a namedtuple so the docstring can be
     # set.
+
+
+PositionData.__new__.__defaults__ = (None,)
@@ -19,6 +19,7 @@ from __future__ import unicode_literals
 import copy
 import multiprocessing
 import time
+from collections import Counter
 from collections import defaultdict
 
 import simplejson as json
@@ -26,8 +27,11 @@ from cached_property import cached_property
 
 from data_pipeline._kafka_producer import LoggingKafkaProducer
 from data_pipeline._kafka_util import get_actual_published_messages_count
+from data_pipeline._pipelined_kafka_producer import PipelinedKafkaProducer
 from data_pipeline._pooled_kafka_producer import PooledKafkaProducer
+from data_pipeline._spooling_kafka_producer import SpoolingKafkaProducer
 from data_pipeline.client import Client
+from data_pipeline.compression_codec import CompressionCodecEnum
 from data_pipeline.config import get_config
 
 
@@ -45,7 +49,7 @@ class Producer(Client):
 
     When messages are handed to a producer via the :meth:`publish` method, they
     aren't immediately published into Kafka.  Instead, they're buffered until
-    a number of messages are accumulated, or too much time has passed,
+    a number of messages or bytes are accumulated, or too much time has passed,
     then published all at once.  This process is designed to be largely
     transparent to the user.
 
@@ -100,7 +104,10 @@ class Producer(Client):
         `expected_frequency_seconds` in :class:`data_pipeline.client.Client`.
       use_work_pool (bool): If true, the process will use a multiprocessing
         pool to serialize messages in preparation for transport.  The work pool
-        can parallelize some expensive serialization.  Default is false.
+        can parallelize some expensive serialization.  Messages are handed to
+        the pool as they're published, and published into Kafka by a
+        background sender thread as with `use_pipelined_flush`.  Default is
+        false.
       position_data_callback (Optional[function]): If provided, the function
         will be called when the producer starts, and whenever messages are
         committed to Kafka, with updated position data.  The callback should
@@ -110,6 +117,30 @@ class Producer(Client):
         to kafka. Default is false.
       monitoring_enabled (Optional[bool]): If true, monitoring will be enabled
         to record client's activities. Default is true.
+      use_pipelined_flush (Optional[bool]): If true, buffered messages are
+        published into Kafka by a background sender thread, so :meth:`publish`
+        doesn't wait for Kafka while the previous buffer is being sent, and
+        the buffer is flushed on time without calling :meth:`wake`.  A
+        producer created with `use_work_pool` always publishes this way.
+        Default is false.
+      partitioner (Optional[data_pipeline.partitioner.Partitioner]): Decides
+        which partition each message of a topic with several partitions is
+        published to.  Default is
+        :class:`data_pipeline.partitioner.KeyHashPartitioner`.
+      compression_codec (Optional[data_pipeline.compression_codec.CompressionCodecEnum]):
+        How messages are compressed when they're published into Kafka.
+        Messages of each topic partition are compressed together, so
+        repetitive messages take much less bandwidth and broker disk, at the
+        cost of some CPU when flushing.  Default is
+        :attr:`data_pipeline.compression_codec.CompressionCodecEnum.none`.
+      spool_dir (Optional[str]): If provided, buffered messages are written
+        to a spool in this local directory before a background sender thread
+        publishes them into Kafka, so publishing carries on while Kafka is
+        unavailable, and the sender keeps retrying until it's available
+        again.  Messages left in the spool when the process stops are
+        published when a producer is created with the same directory.  See
+        :class:`data_pipeline._spooling_kafka_producer.SpoolingKafkaProducer`.
+        It can't be used with `use_work_pool`.  Default is None.
     """
 
     def __init__(
@@ -121,8 +152,14 @@ class Producer(Client):
         dry_run=False,
         position_data_callback=None,
         monitoring_enabled=True,
-        schema_id_list=None
+        schema_id_list=None,
+        use_pipelined_flush=False,
+        partitioner=None,
+        compression_codec=CompressionCodecEnum.none,
+        spool_dir=None
     ):
+        if use_work_pool and spool_dir is not None:
+            raise ValueError("A producer with a spool_dir can't use_work_pool.")
         super(Producer, self).__init__(
             producer_name,
             team_name,
@@ -131,6 +168,10 @@ class Producer(Client):
             dry_run=dry_run
         )
         self.use_work_pool = use_work_pool
+        self.use_pipelined_flush = use_pipelined_flush
+        self.partitioner = partitioner
+        self.compression_codec = compression_codec
+        self.spool_dir = spool_dir
         self.dry_run = dry_run
         self.position_data_callback = position_data_callback
         if schema_id_list is None:
@@ -147,15 +188,34 @@ class Producer(Client):
 
     @cached_property
     def _kafka_producer(self):
-        if self.use_work_pool:
+        if self.spool_dir is not None:
+            return SpoolingKafkaProducer(
+                self._set_kafka_producer_position,
+                self.spool_dir,
+                dry_run=self.dry_run,
+                partitioner=self.partitioner,
+                compression_codec=self.compression_codec
+            )
+        elif self.use_work_pool:
             return PooledKafkaProducer(
                 self._set_kafka_producer_position,
-                dry_run=self.dry_run
+                dry_run=self.dry_run,
+                partitioner=self.partitioner,
+                compression_codec=self.compression_codec
+            )
+        elif self.use_pipelined_flush:
+            return PipelinedKafkaProducer(
+                self._set_kafka_producer_position,
+                dry_run=self.dry_run,
+                partitioner=self.partitioner,
+                compression_codec=self.compression_codec
             )
         else:
             return LoggingKafkaProducer(
                 self._set_kafka_producer_position,
-                dry_run=self.dry_run
+                dry_run=self.dry_run,
+                partitioner=self.partitioner,
+                compression_codec=self.compression_codec
             )
 
     @property
@@ -256,11 +316,18 @@ class Producer(Client):
 
     def publish(self, message, timestamp=None):
         """Adds the message to the buffer to be published.  Messages are
-        published after a number of messages are accumulated or after a
-        slight time delay, whichever passes first.  Passing a message to
+        published after a number of messages or bytes are accumulated or after
+        a slight time delay, whichever passes first.  Passing a message to
         publish does not guarantee that it will be successfully published into
         Kafka.
 
+        Publishing blocks while the producers of the process hold
+        `kafka_producer_memory_budget_bytes` of messages that aren't published
+        yet, and raises
+        :class:`data_pipeline._producer_memory_budget.MemoryBudgetExceededError`
+        if there's still no room after
+        `kafka_producer_memory_budget_timeout_seconds`.
+
         **TODO(DATAPIPE-155|justinc)**:
 
         * Point to information about the message accumulation and time
@@ -272,7 +339,10 @@ class Producer(Client):
             message (data_pipeline.message.Message): message to publish
             timestamp (timezone aware timestamp): utc datetime of event
         """
-        self._kafka_producer.publish(message)
+        self._publish(message, timestamp)
+
+    def _publish(self, message, timestamp=None, topic_partition=None):
+        self._kafka_producer.publish(message, topic_partition=topic_partition)
 
         if self.enable_meteorite:
             self.monitors['meteorite'].process(message.topic)
@@ -288,28 +358,102 @@ class Producer(Client):
             timestamp_in_milliseconds=long(1000 * time.time())
         )
 
+    def publish_many(self, messages, timestamp=None):
+        """Adds the messages to the buffer to be published, in order, the same
+        as calling :meth:`publish` with each of them.  The monitoring and
+        bookkeeping of the producer is done once per topic and schema of the
+        messages rather than once per message, which makes it cheaper for
+        callers that already have a batch of messages at hand.
+
+        The messages aren't reordered, since the position data of the producer
+        depends on the order they're published in.  They're buffered by topic
+        partition either way.
+
+        Args:
+            messages (iterable of data_pipeline.message.Message): messages to
+                publish
+            timestamp (timezone aware timestamp): utc datetime of the latest
+                event of the messages
+        """
+        published_messages = []
+        try:
+            for message in messages:
+                self._kafka_producer.publish(message)
+                published_messages.append(message)
+        finally:
+            # Messages buffered before a failure are still accounted for.
+            self._update_monitors(published_messages, timestamp)
+
+    def _update_monitors(self, messages, timestamp):
+        if not messages:
+            return
+
+        self.monitor.record_messages(messages)
+        topic_to_message_count = defaultdict(int)
+        schema_ids = set()
+        for message in messages:
+            topic_to_message_count[message.topic] += 1
+            schema_ids.add(message.schema_id)
+
+        if self.enable_meteorite:
+            for topic, message_count in topic_to_message_count.iteritems():
+                self.monitors['meteorite'].increment(topic, message_count)
+
+        if self.enable_sensu and time.time() > self._next_sensu_update:
+            self._next_sensu_update = time.time() + self._sensu_window
+            self.monitors['sensu_ttl'].process()
+            self.monitors['sensu_delay'].process(timestamp)
+
+        timestamp_in_milliseconds = long(1000 * time.time())
+        for schema_id in schema_ids:
+            self.registrar.update_schema_last_used_timestamp(
+                schema_id,
+                timestamp_in_milliseconds=timestamp_in_milliseconds
+            )
+
     def ensure_messages_published(self, messages, topic_offsets):
         """This method should only be used when recovering after an unclean
         shutdown, and only if the upstream message source is persistent and can
         be rewound and replayed.  All messages produced since the last
-        successful checkpoint should be passed as a list into this method,
-        which will then ensure that each message has either already been
-        published into Kafka, or will publish each message into Kafka.
+        successful checkpoint should be passed into this method, which will
+        then ensure that each message has either already been published into
+        Kafka, or will publish each message into Kafka.
+
+        The messages are streamed through once, and only a counter per topic
+        partition is kept to tell the messages already published, so the
+        replay window doesn't have to fit in memory.  The messages that still
+        need to be published are published in chunks as they're seen, since
+        their topic partitions already have more messages than were published.
 
-        The call will block until all messages are published successfully.
+        Messages buffered before the call, and batches recovered from the
+        spool when a `spool_dir` is given, are published first.  The call will
+        block until all messages are published successfully.
 
         Immediately after calling this method, you should call
         :meth:`get_checkpoint_position_data` and persist the data.
 
         Args:
-            messages (list of :class:`data_pipeline.message.Message`): List of
-                messages to ensure are published.  The order of the messages
-                matters, this code assumes that the messages are in the order
-                they would have been published in.
-            topic_offsets (dict of str to int): The topic offsets should be a
-                dictionary containing the offset of the next message that would
-                be published in each topic.  This should be in the format of
-                :attr:`data_pipeline.position_data.PositionData.topic_to_kafka_offset_map`.
+            messages (iterable of :class:`data_pipeline.message.Message`):
+                Messages to ensure are published, e.g. a list or a generator.
+                The order of the messages matters, this code assumes that the
+                messages are in the order they would have been published in.
+                They're all read into memory only when
+                `force_recovery_from_publication_unensurable_error` is set.
+            topic_offsets (dict of str to dict of int to int): The topic
+                offsets should be a dictionary containing the offset of the
+                next message that would be published in each partition of
+                each topic.  This should be in the format of
+                :attr:`data_pipeline.position_data.PositionData.topic_to_partition_offset_map`.
+                Offsets in the format of
+                :attr:`data_pipeline.position_data.PositionData.topic_to_kafka_offset_map`
+                are also accepted, and are taken as the offsets of partition 0.
+
+        Note:
+            Each message is checked against the partition it would be
+            published to now.  Messages with primary keys always go to the same
+            partition, but messages without keys are spread across partitions
+            in turn, so recovery is only exact for them in topics with a single
+            partition.
 
         Raises:
             PublicationUnensurableError: If any topics already have more messages
@@ -318,108 +462,208 @@ class Producer(Client):
                 does, it means that there has either been another publisher
                 writing to the topic, which breaks the data pipeline contract,
                 or there weren't enough messages passed into this method.  In
-                either case, manual intervention will be required.  Note that
-                in the event of a failure, some messages may have been
-                published.
+                either case, manual intervention will be required.  None of
+                the messages of the topic partitions failing the check are
+                published when it's raised, but messages of other topic
+                partitions may already be.
         """
-        topic_messages_map = self._generate_topic_messages_map(messages)
-        # raise_on_error must be set to False, otherwise this call will raise
-        # an exception when any topic doesn't exist, preventing the topic from
-        # ever being created in the context of ensure_messages_published
-        topic_actual_published_count_map = (
-            get_actual_published_messages_count(
-                self._kafka_producer.kafka_client,
-                topics=topic_messages_map.keys(),
-                topic_tracked_offset_map=topic_offsets,
-                raise_on_error=False
-            )
+        # Batches still in flight, or recovered from the spool of a producer
+        # that crashed, are published before the high watermarks are looked
+        # up, so the messages in them are skipped as already published.
+        self.flush()
+
+        topic_to_partition_offset_map = self._get_topic_to_partition_offset_map(
+            topic_offsets
+        )
+        # The partition of each message is only picked once, since messages
+        # without keys may go to a different partition each time, and the
+        # message must be published to the partition it's counted against.
+        topic_partition_and_messages = (
+            (self._kafka_producer.get_topic_partition(message), message)
+            for message in messages
         )
+        topic_partition_message_counts = None
+        if get_config().force_recovery_from_publication_unensurable_error:
+            # Forcing recovery republishes all the messages of a partition with
+            # more messages published than passed in, which is only known
+            # once all the messages have been seen.
+            topic_partition_and_messages = list(topic_partition_and_messages)
+            topic_partition_message_counts = Counter(
+                topic_partition
+                for topic_partition, _ in topic_partition_and_messages
+            )
+
+        topic_actual_published_count_map = {}
+        topic_partition_to_skip_count = {}
+        topic_partition_to_message_count = defaultdict(int)
+
+        # Automatic flushing is disabled while we're recovering, so the buffer
+        # is only flushed synchronously, when the position data tracker is
+        # updated by this thread alone and holds every message recorded so
+        # far as published.  The state-saving callbacks are then only ever
+        # triggered with position data downstream applications can resume
+        # from.
+        with self._kafka_producer.disable_automatic_flushing():
+            position_tracker = self._kafka_producer.position_data_tracker
+            initial_position_tracker = copy.deepcopy(position_tracker)
+            initial_position_data = self.position_data
+            try:
+                for topic_partition, message in topic_partition_and_messages:
+                    message_index = topic_partition_to_message_count[topic_partition]
+                    topic_partition_to_message_count[topic_partition] = message_index + 1
+
+                    skip_count = topic_partition_to_skip_count.get(topic_partition)
+                    if skip_count is None:
+                        skip_count = self._get_recovery_skip_count(
+                            topic_partition,
+                            topic_to_partition_offset_map,
+                            topic_actual_published_count_map,
+                            topic_partition_message_counts
+                        )
+                        topic_partition_to_skip_count[topic_partition] = skip_count
+
+                    # The first messages of each topic partition, up to the number
+                    # of messages published after the saved offset, are the ones
+                    # already published.
+                    #
+                    # We're recording already published messages here so that if
+                    # there's any ordering dependency related to state saving, we're
+                    # able to capture that.
+                    #
+                    # Concretely, imagine the last message has already been
+                    # published, and that messages come from a serial source like
+                    # db replication.  If we don't record the last message, even
+                    # though we're not actually publishing it, the state in the
+                    # producer will indicate the last message hasn't been published,
+                    # when we know that it has.  This breaks things if the
+                    # application crashes after this procedure, but before saving
+                    # again.
+                    if message_index < skip_count:
+                        position_tracker.record_message(message)
+
+                        # This is required to update the high watermark for all the
+                        # messages individually on the position tracker in-order to
+                        # avoid offset in there from becoming stale.
+                        position_tracker.update_high_watermark(
+                            topic=topic_partition.topic_name,
+                            offset=self._get_partition_value(
+                                topic_to_partition_offset_map,
+                                topic_partition
+                            ),
+                            message_count=self._get_partition_value(
+                                topic_actual_published_count_map,
+                                topic_partition
+                            ),
+                            partition=topic_partition.partition
+                        )
+                    else:
+                        self._publish(message, topic_partition=topic_partition)
+                        if self._kafka_producer.is_buffer_full():
+                            self.flush()
+
+                # Only the messages of topic partitions with more messages than
+                # were published have been buffered, so the topic partitions
+                # failing the check have none of theirs published.
+                self._verify_recovered_message_counts(
+                    topic_partition_to_message_count,
+                    topic_to_partition_offset_map,
+                    topic_actual_published_count_map,
+                    is_forced=topic_partition_message_counts is not None
+                )
+            except PublicationUnensurableError:
+                # The messages still buffered are dropped, and the position
+                # data is rolled back to the last flush, so they aren't
+                # published when the producer is closed either.
+                self._kafka_producer.discard_buffered_messages()
+                if self.position_data is initial_position_data:
+                    self._kafka_producer.position_data_tracker = initial_position_tracker
+                else:
+                    position_tracker.reset_to_position_data(self.position_data)
+                raise
+            self.flush()
 
-        # TODO(justinc|DATAPIPE-995): This can't be a set at this time, because
-        # some data pipeline message fields aren't hashable - primarily the
-        # upstream_position_info, which is a dict.
-        already_published_messages = list()
-        for topic, topic_messages in topic_messages_map.iteritems():
-            # `get_actual_published_messages_count` only returns the message
-            # count for topics that exist, so for non-existent topics, here it
-            # sets the actual published message count to 0, i.e. high watermark
-            # is 0.
-            already_published_count = topic_actual_published_count_map.get(topic, 0)
-            saved_offset = topic_offsets.get(topic, 0)
+    def _get_recovery_skip_count(
+        self,
+        topic_partition,
+        topic_to_partition_offset_map,
+        topic_actual_published_count_map,
+        topic_partition_message_counts
+    ):
+        """Returns the number of messages of the topic partition to skip as
+        already published.  The high watermarks of each topic are only looked
+        up once, when its first message is seen.
+        """
+        topic = topic_partition.topic_name
+        if topic not in topic_actual_published_count_map:
+            # raise_on_error must be set to False, otherwise this call will
+            # raise an exception when the topic doesn't exist, preventing the
+            # topic from ever being created in the context of
+            # ensure_messages_published.  It only returns the message count
+            # for topics that exist, so for non-existent topics, the actual
+            # published message count is 0, i.e. high watermark is 0.
+            topic_actual_published_count_map[topic] = (
+                get_actual_published_messages_count(
+                    self._kafka_producer.kafka_client,
+                    topics=[topic],
+                    topic_to_partition_offset_map=topic_to_partition_offset_map,
+                    raise_on_error=False
+                ).get(topic, {})
+            )
+        already_published_count = self._get_partition_value(
+            topic_actual_published_count_map,
+            topic_partition
+        )
+        if already_published_count < 0 or (
+            topic_partition_message_counts is not None and
+            already_published_count > topic_partition_message_counts[topic_partition]
+        ):
+            self._handle_unensurable_publication()
+            return 0
+        return already_published_count
+
+    def _verify_recovered_message_counts(
+        self,
+        topic_partition_to_message_count,
+        topic_to_partition_offset_map,
+        topic_actual_published_count_map,
+        is_forced
+    ):
+        for topic_partition, message_count in topic_partition_to_message_count.iteritems():
+            already_published_count = self._get_partition_value(
+                topic_actual_published_count_map,
+                topic_partition
+            )
+            saved_offset = self._get_partition_value(
+                topic_to_partition_offset_map,
+                topic_partition
+            )
 
             info_to_log = dict(
                 message="Attempting to ensure messages published",
-                topic=topic,
+                topic=topic_partition.topic_name,
+                partition=topic_partition.partition,
                 saved_offset=saved_offset,
                 high_watermark=already_published_count + saved_offset,
-                message_count=len(topic_messages),
+                message_count=message_count,
                 already_published_count=already_published_count
             )
 
             logger.info(json.dumps(info_to_log))
 
-            if (
-                already_published_count < 0 or
-                already_published_count > len(topic_messages)
-            ):
-                # This is here primarily as a convenience to allow recovery
-                # after logical errors.  It will result in breaking the
-                # delivery guarantees.
-                if get_config().force_recovery_from_publication_unensurable_error:
-                    logger.critical(
-                        "Forcing recovery from PublicationUnensurableError - "
-                        "Intentionally Breaking Delivery Guarantees. "
-                        "Turn force_recovery_from_publication_unensurable_error "
-                        "off after recovery."
-                    )
-                    already_published_count = 0
-                else:
-                    raise PublicationUnensurableError()
-            already_published_messages.extend(
-                topic_messages[:already_published_count]
-            )
-
-        # Automatic flushing must be disabled while we're recovering, since
-        # any partial flushing will result in state-saving callbacks being
-        # triggered, which can cause downstream applications to update state
-        # that really shouldn't be updated until all messages are published
-        # successfully.
-        position_tracker = self._kafka_producer.position_data_tracker
-        with self._kafka_producer.disable_automatic_flushing():
-            for message in messages:
-                # We're recording already published messages here so that if
-                # there's any ordering dependency related to state saving, we're
-                # able to capture that.
-                #
-                # Concretely, imagine the last message has already been
-                # published, and that messages come from a serial source like
-                # db replication.  If we don't record the last message, even
-                # though we're not actually publishing it, the state in the
-                # producer will indicate the last message hasn't been published,
-                # when we know that it has.  This breaks things if the
-                # application crashes after this procedure, but before saving
-                # again.
-                if message in already_published_messages:
-                    position_tracker.record_message(message)
-
-                    topic_of_message = message.topic
-                    already_published_count = topic_actual_published_count_map.get(
-                        topic_of_message,
-                        0
-                    )
-                    saved_offset = topic_offsets.get(topic_of_message, 0)
-                    # This is required to update the high watermark for all the
-                    # messages individually on the position tracker in-order to
-                    # avoid offset in there from becoming stale.
-                    position_tracker.update_high_watermark(
-                        topic=message.topic,
-                        offset=saved_offset,
-                        message_count=already_published_count
-                    )
-                else:
-                    self.publish(message)
-
-            self.flush()
+            if not is_forced and already_published_count > message_count:
+                self._handle_unensurable_publication()
+
+    def _handle_unensurable_publication(self):
+        # This is here primarily as a convenience to allow recovery after
+        # logical errors.  It will result in breaking the delivery guarantees.
+        if not get_config().force_recovery_from_publication_unensurable_error:
+            raise PublicationUnensurableError()
+        logger.critical(
+            "Forcing recovery from PublicationUnensurableError - "
+            "Intentionally Breaking Delivery Guarantees. "
+            "Turn force_recovery_from_publication_unensurable_error "
+            "off after recovery."
+        )
 
     def flush(self):
         """Block until all data pipeline messages have been
@@ -459,7 +703,9 @@ class Producer(Client):
 
         If messages aren't published at least every 250ms, this method should
         be called about that often, to ensure that messages don't sit in the
-        buffer for longer than that.
+        buffer for longer than that.  A producer created with
+        `use_pipelined_flush` or `use_work_pool` flushes its buffer on time by
+        itself.
 
         Example::
 
@@ -493,8 +739,14 @@ class Producer(Client):
         if self.position_data_callback:
             self.position_data_callback(position_data)
 
-    def _generate_topic_messages_map(self, messages):
-        topic_messages_map = defaultdict(list)
-        for message in messages:
-            topic_messages_map[message.topic].append(message)
-        return topic_messages_map
+    def _get_topic_to_partition_offset_map(self, topic_offsets):
+        return {
+            topic: offsets if isinstance(offsets, dict) else {0: offsets}
+            for topic, offsets in topic_offsets.iteritems()
+        }
+
+    def _get_partition_value(self, topic_to_partition_value_map, topic_partition):
+        return topic_to_partition_value_map.get(
+            topic_partition.topic_name,
+            {}
+        ).get(topic_partition.partition, 0)
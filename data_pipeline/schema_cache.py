@@ -20,6 +20,7 @@ import warnings
 from collections import namedtuple
 
 import simplejson
+from cached_property import cached_property
 from data_pipeline_avro_util.util import get_avro_schema_object
 
 from data_pipeline.config import get_config
@@ -49,8 +50,9 @@ class SchematizerClient(object):
     service.  It has a built-in cache that maps schema_id's to their schemas
     and to their transformed schema_ids.
 
-        Currently this only holds an in-memory cache.
-        TODO(DATAPIPE-162|joshszep): Implement persistent caching
+        Currently this only holds an in-memory cache.  Use
+        :func:`data_pipeline.schematizer_clientlib.schematizer.get_schematizer`,
+        whose cache can be persisted on disk, instead.
     """
 
     def __init__(self):
@@ -62,7 +64,7 @@ class SchematizerClient(object):
         self.base_to_transformed_schema_id_map = {}
         self.schema_id_to_pii_map = {}
 
-    @property
+    @cached_property
     def schematizer_client(self):
         """TODO[DATAPIPE-396|clin]: change this to be private once this class
         is converted to the true schematizer client.
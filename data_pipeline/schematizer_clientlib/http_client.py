@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+
+from bravado.exception import HTTPError
+from bravado.http_future import HttpFuture
+from bravado.http_future import unmarshal_response
+from bravado.requests_client import RequestsClient
+from bravado.requests_client import RequestsFutureAdapter
+from bravado.requests_client import RequestsResponseAdapter
+from requests.adapters import HTTPAdapter
+
+
+swagger_spec_lock = threading.RLock()
+"""Lock to hold while marshalling a request or unmarshalling a response of
+a bravado client.  The ref resolver of a swagger spec keeps the scope of the
+ref being resolved on a stack shared by every thread using the spec, so
+concurrent calls through one client must not (un)marshal at the same time.
+"""
+
+
+class PooledRequestsClient(RequestsClient):
+    """Bravado http client used to talk to the Schematizer.  It keeps the
+    connections alive and pools them per host, so that requests reuse the
+    established connections instead of opening a new one each time.
+
+    The pool also bounds the number of requests in flight to each host.  A
+    request sent while all the connections of the host are busy waits for one
+    to be returned to the pool rather than opening an extra connection which
+    would be closed right after the request.
+
+    Args:
+        max_connections_per_host (Optional[int]): Maximum number of open
+            connections, and so of concurrent requests, to each host.
+        connect_timeout (Optional[float]): Number of seconds to wait for a
+            connection to be established.  `None` means no timeout.
+        read_timeout (Optional[float]): Number of seconds to wait for the
+            response once the request is sent.  `None` means no timeout.
+
+    Both timeouts are defaults, and are overridden by the `connect_timeout`
+    and `timeout` request options of an individual call.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host=10,
+        connect_timeout=None,
+        read_timeout=None
+    ):
+        super(PooledRequestsClient, self).__init__()
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        adapter = HTTPAdapter(
+            pool_maxsize=max_connections_per_host,
+            pool_block=True
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def separate_params(self, request_params):
+        sanitized_params, misc_options = super(
+            PooledRequestsClient,
+            self
+        ).separate_params(request_params)
+        if self.connect_timeout is not None:
+            misc_options.setdefault('connect_timeout', self.connect_timeout)
+        return sanitized_params, misc_options
+
+    def request(
+        self,
+        request_params,
+        operation=None,
+        response_callbacks=None,
+        also_return_response=False
+    ):
+        sanitized_params, misc_options = self.separate_params(request_params)
+        requests_future = _RequestsFutureAdapter(
+            self.session,
+            self.authenticated_request(sanitized_params),
+            misc_options,
+            self.read_timeout
+        )
+        return _HttpFuture(
+            requests_future,
+            RequestsResponseAdapter,
+            operation,
+            response_callbacks,
+            also_return_response
+        )
+
+
+class _RequestsFutureAdapter(RequestsFutureAdapter):
+    """Future adapter which falls back to the default read timeout of the
+    client when neither the call nor `result` specifies a timeout.  Passing
+    the default as a request option instead would make bravado warn about
+    two different timeouts on every `result` call without a timeout.
+    """
+
+    def __init__(self, session, request, misc_options, read_timeout):
+        super(_RequestsFutureAdapter, self).__init__(
+            session,
+            request,
+            misc_options
+        )
+        self.read_timeout = read_timeout
+
+    def build_timeout(self, result_timeout):
+        if result_timeout is None and 'timeout' not in self.misc_options:
+            result_timeout = self.read_timeout
+        return super(_RequestsFutureAdapter, self).build_timeout(result_timeout)
+
+
+class _HttpFuture(HttpFuture):
+    """Http future which waits for the response without holding any lock, so
+    that concurrent requests are in flight at the same time, and then
+    unmarshals it under :data:`swagger_spec_lock`.
+    """
+
+    def result(self, timeout=None):
+        inner_response = self.future.result(timeout=timeout)
+        with swagger_spec_lock:
+            incoming_response = self.response_adapter(inner_response)
+            if self.operation is None:
+                if 200 <= incoming_response.status_code < 300:
+                    return incoming_response
+                raise HTTPError(response=incoming_response)
+            unmarshal_response(
+                incoming_response,
+                self.operation,
+                self.response_callbacks
+            )
+        swagger_result = incoming_response.swagger_result
+        if self.also_return_response:
+            return swagger_result, incoming_response
+        return swagger_result
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import atexit
+import cPickle
+import os
+import sqlite3
+import threading
+import time
+
+import simplejson
+
+from data_pipeline.config import get_config
+
+
+logger = get_config().logger
+
+
+# Errors of a database file which can't be opened, locked by another process,
+# or in a directory which can't be created.  The store treats them as misses.
+_STORE_ERRORS = (sqlite3.Error, OSError)
+
+
+class PersistentCache(object):
+    """On-disk store that backs the in-memory cache of the schematizer client,
+    so that a restarted process can load the schematizer entities it has seen
+    before from a local file instead of the Schematizer service.
+
+    Entries are keyed by entity type name and entity key, and are stored in a
+    SQLite database.  Reads go straight to the database, while writes are
+    buffered and written in a single transaction once `flush_batch_size`
+    entries are pending or `flush_interval_seconds` have passed, and when the
+    process exits.
+
+    The store never raises on a bad file.  A database written with another
+    :attr:`VERSION`, or one that cannot be read, is discarded and recreated,
+    and an entry that cannot be unpickled is treated as a miss.  A database
+    that cannot be opened or is locked is treated as a miss on reads, and its
+    pending writes are retried on the next flush.
+
+    Args:
+        path (str): Path of the SQLite database file.  It is created if it
+            doesn't exist.
+        max_age_seconds (Optional[float]): Entries older than this are treated
+            as misses.  `None` means entries never expire.
+        flush_batch_size (Optional[int]): Number of pending writes which
+            triggers a flush.
+        flush_interval_seconds (Optional[float]): Maximum time pending writes
+            are held before they're flushed on the next write.
+    """
+
+    # Bump this whenever the table layout or the format of the cached values
+    # changes.  A database written with a different version is discarded.
+    VERSION = 1
+
+    def __init__(
+        self,
+        path,
+        max_age_seconds=None,
+        flush_batch_size=100,
+        flush_interval_seconds=1.0
+    ):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._last_flush_time = time.time()
+        self._connection = None
+        self._connection_pid = None
+        atexit.register(self.flush)
+
+    def get(self, entity_type_name, entity_key):
+        """Returns the cached value of given entity, or `None` if the entity
+        is not in the store or has expired.
+        """
+        key = self._encode_key(entity_key)
+        with self._lock:
+            pending = self._pending.get((entity_type_name, key))
+            if pending is not None:
+                return pending[0]
+            try:
+                row = self._execute_with_recovery(
+                    self._select_row,
+                    entity_type_name,
+                    key
+                )
+            except _STORE_ERRORS:
+                logger.warning(
+                    "Unable to read persistent cache {0}.".format(self.path),
+                    exc_info=True
+                )
+                return None
+        if row is None:
+            return None
+        try:
+            return cPickle.loads(bytes(row[0]))
+        except Exception:
+            logger.warning(
+                "Dropping unreadable persistent cache entry {0} {1}.".format(
+                    entity_type_name, key
+                )
+            )
+            self._delete(entity_type_name, key)
+            return None
+
+    def set(self, entity_type_name, entity_key, value):
+        """Schedules given value of the entity to be written to the store."""
+        key = self._encode_key(entity_key)
+        with self._lock:
+            self._pending[(entity_type_name, key)] = (value, time.time())
+            if self._should_flush():
+                self.flush()
+
+    def flush(self):
+        """Writes all the pending entries to the store."""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [
+                (
+                    entity_type_name,
+                    key,
+                    sqlite3.Binary(
+                        cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+                    ),
+                    cached_at
+                )
+                for (entity_type_name, key), (value, cached_at)
+                in self._pending.iteritems()
+            ]
+            try:
+                self._execute_with_recovery(self._insert_rows, rows)
+            except _STORE_ERRORS:
+                # Most likely another process holds the database lock; keep
+                # the entries and retry on the next flush.
+                logger.warning(
+                    "Unable to flush persistent cache {0}.".format(self.path),
+                    exc_info=True
+                )
+                return
+            self._pending = {}
+            self._last_flush_time = time.time()
+
+    def clear(self):
+        """Removes all the entries from the store."""
+        with self._lock:
+            self._pending = {}
+            self._close()
+            self._remove_database_file()
+
+    def _should_flush(self):
+        return (
+            len(self._pending) >= self.flush_batch_size or
+            time.time() - self._last_flush_time >= self.flush_interval_seconds
+        )
+
+    def _encode_key(self, entity_key):
+        # Some entities are cached by both id and name, so keep the key type
+        # to tell `1` and `'1'` apart.
+        return simplejson.dumps(entity_key)
+
+    def _select_row(self, connection, entity_type_name, key):
+        query = (
+            'SELECT value FROM cache '
+            'WHERE entity_type = ? AND entity_key = ? AND cached_at >= ?'
+        )
+        min_cached_at = (
+            time.time() - self.max_age_seconds
+            if self.max_age_seconds is not None else 0
+        )
+        return connection.execute(
+            query,
+            (entity_type_name, key, min_cached_at)
+        ).fetchone()
+
+    def _insert_rows(self, connection, rows):
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache '
+                '(entity_type, entity_key, value, cached_at) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+
+    def _delete_row(self, connection, entity_type_name, key):
+        with connection:
+            connection.execute(
+                'DELETE FROM cache WHERE entity_type = ? AND entity_key = ?',
+                (entity_type_name, key)
+            )
+
+    def _delete(self, entity_type_name, key):
+        with self._lock:
+            try:
+                self._execute_with_recovery(
+                    self._delete_row,
+                    entity_type_name,
+                    key
+                )
+            except _STORE_ERRORS:
+                pass
+
+    def _execute_with_recovery(self, func, *args):
+        """Runs `func` with an open connection.  If the database turns out to
+        be corrupted, it is discarded and `func` is run once more against a
+        new, empty database.
+        """
+        try:
+            return func(self._get_connection(), *args)
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError:
+            logger.warning(
+                "Discarding corrupted persistent cache {0}.".format(self.path),
+                exc_info=True
+            )
+            self._close()
+            self._remove_database_file()
+            return func(self._get_connection(), *args)
+
+    def _get_connection(self):
+        pid = os.getpid()
+        if self._connection is not None and self._connection_pid == pid:
+            return self._connection
+        # A connection inherited from the parent process must not be used or
+        # closed by a forked child, so just drop the reference.
+        self._connection = None
+        try:
+            connection = self._open_connection()
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError:
+            logger.warning(
+                "Discarding corrupted persistent cache {0}.".format(self.path),
+                exc_info=True
+            )
+            self._remove_database_file()
+            connection = self._open_connection()
+        self._connection = connection
+        self._connection_pid = pid
+        return connection
+
+    def _open_connection(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(
+            self.path,
+            timeout=5,
+            check_same_thread=False
+        )
+        try:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version != self.VERSION:
+                with connection:
+                    connection.execute('DROP TABLE IF EXISTS cache')
+                    connection.execute(
+                        'CREATE TABLE cache ('
+                        'entity_type TEXT NOT NULL, '
+                        'entity_key TEXT NOT NULL, '
+                        'value BLOB NOT NULL, '
+                        'cached_at REAL NOT NULL, '
+                        'PRIMARY KEY (entity_type, entity_key))'
+                    )
+                    connection.execute(
+                        'PRAGMA user_version = {0:d}'.format(self.VERSION)
+                    )
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def _close(self):
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._connection_pid = None
+
+    def _remove_database_file(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
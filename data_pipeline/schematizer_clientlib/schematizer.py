@@ -16,8 +16,19 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from collections import namedtuple
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+
 import simplejson
 from bravado.exception import HTTPError
+from bravado_core.response import IncomingResponse
 from requests.exceptions import RequestException
 from swagger_zipkin.zipkin_decorator import ZipkinClientDecorator
 
@@ -25,7 +36,8 @@ from data_pipeline._retry_util import ExpBackoffPolicy
 from data_pipeline._retry_util import retry_on_exception
 from data_pipeline._retry_util import RetryPolicy
 from data_pipeline.config import get_config
-from data_pipeline.helpers.singleton import Singleton
+from data_pipeline.helpers.single_flight import SingleFlight
+from data_pipeline.schematizer_clientlib.http_client import swagger_spec_lock
 from data_pipeline.schematizer_clientlib.models.avro_schema import _AvroSchema
 from data_pipeline.schematizer_clientlib.models.avro_schema_element import (
     _AvroSchemaElement
@@ -47,6 +59,68 @@ from data_pipeline.schematizer_clientlib.models.namespace import _Namespace
 from data_pipeline.schematizer_clientlib.models.refresh import _Refresh
 from data_pipeline.schematizer_clientlib.models.source import _Source
 from data_pipeline.schematizer_clientlib.models.topic import _Topic
+from data_pipeline.schematizer_clientlib.persistent_cache import PersistentCache
+
+
+logger = get_config().logger
+
+
+_CachePolicy = namedtuple('_CachePolicy', ['max_entries', 'ttl_seconds'])
+"""Eviction policy of one entity type in :class:`_Cache`.
+
+Args:
+    max_entries (Optional[int]): Maximum number of entities of the type kept in
+        the cache.  `None` means unbounded.
+    ttl_seconds (Optional[float]): Number of seconds after which a cached entity
+        is revalidated against the Schematizer.  `None` means it never expires.
+"""
+
+
+_UNBOUNDED_CACHE_POLICY = _CachePolicy(max_entries=None, ttl_seconds=None)
+
+
+class _CacheEntry(object):
+    """One cached entity, along with its result namedtuple if it has been
+    built.  `result_expires_at` is the earliest expiration time of the entity
+    and of all the entities embedded in the result.
+    """
+
+    __slots__ = (
+        'value',
+        'expires_at',
+        'result',
+        'result_expires_at',
+        'dependencies',
+        'referenced'
+    )
+
+    def __init__(self, value, expires_at):
+        self.value = value
+        self.expires_at = expires_at
+        self.result = None
+        self.result_expires_at = None
+        self.dependencies = ()
+        self.referenced = False
+
+
+# Key of the persistent cache values which record that the Schematizer
+# doesn't have an entity, instead of the cache value of the entity.
+_ERROR_CACHE_VALUE_KEY = '_schematizer_error'
+
+
+class _PersistedErrorResponse(IncomingResponse):
+    """Response of a failed lookup which is rebuilt from the persistent cache,
+    so that the error raised again has the same status code and text.
+    """
+
+    def __init__(self, status_code, reason, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        self.headers = {}
+
+    def json(self, **kwargs):
+        return simplejson.loads(self.text, **kwargs)
 
 
 class _Cache(object):
@@ -56,20 +130,364 @@ class _Cache(object):
     This cache is currently limited to used by SchematizerClient only.  The
     cached value is expected to have `to_cache_value` and `from_cache_value`
     functions.  This limitation could be relaxed later if necessary.
+
+    Besides the cache values, the cache also keeps the fully resolved result
+    namedtuples returned to the callers, so that a cache hit doesn't need to
+    rebuild them.  A result which embeds other entities (e.g. the topic of an
+    avro schema) is registered with those entities as dependencies, and it is
+    dropped whenever any of them is set to a different value or evicted.
+
+    Each entity type is bounded by its :class:`_CachePolicy`.  Once a type
+    holds more than `max_entries` entities, the least recently used ones are
+    evicted.  Recency is tracked with the second chance (clock) approximation
+    of LRU, so that a cache hit only flags the entry instead of reordering it.
+    An entity older than `ttl_seconds` is stale.  If the entity type has a
+    refresher, the stale entity keeps being served while a single background
+    thread fetches it again, and there is only one refresh of an entity in
+    flight at a time.  Otherwise the stale entity is treated as a miss.
+
+    The cache can also remember the entities which the Schematizer doesn't
+    have, along with the error of the failed lookup, for `error_ttl_seconds`.
+    Setting the entity drops its error right away.  The errors are also
+    written to the persistent cache in place of the entity, so that a
+    restarted process doesn't ask the Schematizer for them again either.
+
+    Args:
+        persistent_cache (Optional[data_pipeline.schematizer_clientlib.
+            persistent_cache.PersistentCache]): On-disk store the cache reads
+            through on a miss and writes behind on a fill.  The cache is only
+            in memory if it is not specified.
+        policies (Optional[dict]): Maps the entity type, such as `_AvroSchema`,
+            to its :class:`_CachePolicy`.  The types not specified are neither
+            bounded nor expired.
+        refreshers (Optional[dict]): Maps the entity type to a function which
+            takes an entity key, fetches the entity from the Schematizer, and
+            sets it back to this cache.
+        error_ttl_seconds (Optional[float]): Number of seconds the error of an
+            entity the Schematizer doesn't have is remembered.  Errors are not
+            cached if it is not specified.
     """
 
-    def __init__(self):
-        self._cache = {}
+    # Number of seconds to wait before retrying a failed background refresh.
+    REFRESH_RETRY_DELAY_SECONDS = 10
+
+    # Maximum number of entities the Schematizer doesn't have that the cache
+    # remembers at a time.
+    MAX_ERRORS = 10000
+
+    def __init__(
+        self,
+        persistent_cache=None,
+        policies=None,
+        refreshers=None,
+        error_ttl_seconds=None
+    ):
+        self._entries = {}
+        self._dependents = defaultdict(set)
+        self._persistent_cache = persistent_cache
+        self._policies = {
+            entity_type.__name__: policy
+            for entity_type, policy in (policies or {}).iteritems()
+        }
+        self._refreshers = {
+            entity_type.__name__: refresher
+            for entity_type, refresher in (refreshers or {}).iteritems()
+        }
+        self._lock = threading.RLock()
+        self._refresh_queue = Queue()
+        self._refreshing = set()
+        self._refresh_thread = None
+        self._errors = OrderedDict()
+        self._error_ttl_seconds = error_ttl_seconds
 
     def get_value(self, entity_type, entity_key):
-        cache_key = self._get_cache_key(entity_type.__name__, entity_key)
-        cache_value = self._cache.get(cache_key)
-        return entity_type.from_cache_value(cache_value) if cache_value else None
+        entity_type_name = entity_type.__name__
+        entry = self._get_entry(entity_type_name, entity_key)
+        if entry is not None and entry.value is not None:
+            entry.referenced = True
+            if (
+                self._is_expired(entry.expires_at) and
+                not self._revalidate(entity_type_name, entity_key)
+            ):
+                return None
+            return entity_type.from_cache_value(entry.value)
+
+        if self._persistent_cache is None:
+            return None
+        cache_value = self._persistent_cache.get(entity_type_name, entity_key)
+        if not cache_value or _ERROR_CACHE_VALUE_KEY in cache_value:
+            return None
+        with self._lock:
+            self._store_value(entity_type_name, entity_key, cache_value)
+        return entity_type.from_cache_value(cache_value)
 
     def set_value(self, entity_key, new_value):
         value_type_name = new_value.__class__.__name__
-        cache_key = self._get_cache_key(value_type_name, entity_key)
-        self._cache[cache_key] = new_value.to_cache_value()
+        cache_value = new_value.to_cache_value()
+        with self._lock:
+            entry = self._get_entry(value_type_name, entity_key)
+            if entry is not None and entry.value == cache_value:
+                entry.expires_at = self._get_expires_at(value_type_name)
+                self._update_result_expiration(
+                    self._get_cache_key(value_type_name, entity_key)
+                )
+                return
+            self._store_value(value_type_name, entity_key, cache_value)
+            self._errors.pop(
+                self._get_cache_key(value_type_name, entity_key),
+                None
+            )
+        if self._persistent_cache is not None:
+            self._persistent_cache.set(value_type_name, entity_key, cache_value)
+
+    def get_result(self, entity_type, entity_key):
+        entries = self._entries.get(entity_type.__name__)
+        entry = entries.get(entity_key) if entries is not None else None
+        if entry is None or entry.result is None:
+            return None
+        entry.referenced = True
+        if (
+            entry.result_expires_at is not None and
+            entry.result_expires_at <= time.time() and
+            not self._revalidate(entity_type.__name__, entity_key)
+        ):
+            return None
+        return entry.result
+
+    def set_result(self, entity_type, entity_key, result, dependencies=()):
+        """Caches the result namedtuple of given entity.
+
+        Args:
+            entity_type (type): The internal model class of the entity, such
+                as `_AvroSchema`.
+            entity_key: The key the entity is cached by.
+            result (namedtuple): The result returned to the callers.
+            dependencies (Optional[iterable of (type, key) tuples]): Entities
+                embedded in the result.  The result is invalidated when any of
+                them changes.
+        """
+        entity_type_name = entity_type.__name__
+        cache_key = self._get_cache_key(entity_type_name, entity_key)
+        with self._lock:
+            entry = self._get_entry(entity_type_name, entity_key)
+            if entry is None:
+                entry = self._add_entry(entity_type_name, entity_key, None)
+            self._drop_result(cache_key, entry)
+            entry.result = result
+            entry.dependencies = tuple(
+                self._get_cache_key(dependency_type.__name__, dependency_key)
+                for dependency_type, dependency_key in dependencies
+            )
+            for dependency_cache_key in entry.dependencies:
+                self._dependents[dependency_cache_key].add(cache_key)
+            entry.result_expires_at = self._get_result_expires_at(entry)
+
+    def get_error(self, entity_type, entity_key):
+        """Returns the error of the last lookup of given entity if the
+        Schematizer didn't have it, or `None` otherwise.
+        """
+        cache_key = self._get_cache_key(entity_type.__name__, entity_key)
+        error_entry = self._errors.get(cache_key)
+        if error_entry is None:
+            error_entry = self._get_persisted_error(
+                entity_type.__name__,
+                entity_key
+            )
+            if error_entry is None:
+                return None
+            with self._lock:
+                self._errors.setdefault(cache_key, error_entry)
+        error, expires_at = error_entry
+        if expires_at <= time.time():
+            with self._lock:
+                self._errors.pop(cache_key, None)
+            return None
+        return error
+
+    def set_error(self, entity_type, entity_key, error):
+        """Remembers that the Schematizer doesn't have given entity."""
+        if not self._error_ttl_seconds:
+            return
+        cache_key = self._get_cache_key(entity_type.__name__, entity_key)
+        expires_at = time.time() + self._error_ttl_seconds
+        with self._lock:
+            self._errors.pop(cache_key, None)
+            self._errors[cache_key] = (error, expires_at)
+            while len(self._errors) > self.MAX_ERRORS:
+                self._errors.popitem(last=False)
+        if self._persistent_cache is not None:
+            self._persistent_cache.set(
+                entity_type.__name__,
+                entity_key,
+                {_ERROR_CACHE_VALUE_KEY: {
+                    'status_code': error.response.status_code,
+                    'reason': error.response.reason,
+                    'text': error.response.text,
+                    'message': error.message,
+                    'expires_at': expires_at
+                }}
+            )
+
+    def _get_persisted_error(self, entity_type_name, entity_key):
+        if self._persistent_cache is None or not self._error_ttl_seconds:
+            return None
+        cache_value = self._persistent_cache.get(entity_type_name, entity_key)
+        if not cache_value or _ERROR_CACHE_VALUE_KEY not in cache_value:
+            return None
+        error_value = cache_value[_ERROR_CACHE_VALUE_KEY]
+        if error_value['expires_at'] <= time.time():
+            return None
+        error = HTTPError(
+            response=_PersistedErrorResponse(
+                status_code=error_value['status_code'],
+                reason=error_value['reason'],
+                text=error_value['text']
+            ),
+            message=error_value['message']
+        )
+        return error, error_value['expires_at']
+
+    def _get_entry(self, entity_type_name, entity_key):
+        entries = self._entries.get(entity_type_name)
+        return entries.get(entity_key) if entries is not None else None
+
+    def _store_value(self, entity_type_name, entity_key, cache_value):
+        cache_key = self._get_cache_key(entity_type_name, entity_key)
+        old_entry = self._entries.get(entity_type_name, {}).pop(entity_key, None)
+        if old_entry is not None:
+            self._drop_result(cache_key, old_entry)
+        self._invalidate_dependents(cache_key)
+        self._add_entry(entity_type_name, entity_key, cache_value)
+
+    def _add_entry(self, entity_type_name, entity_key, cache_value):
+        entries = self._entries.get(entity_type_name)
+        if entries is None:
+            entries = self._entries[entity_type_name] = OrderedDict()
+        entry = _CacheEntry(cache_value, self._get_expires_at(entity_type_name))
+        entries[entity_key] = entry
+        self._evict(entity_type_name, entries)
+        return entry
+
+    def _evict(self, entity_type_name, entries):
+        max_entries = self._get_policy(entity_type_name).max_entries
+        if max_entries is None:
+            return
+        while len(entries) > max_entries:
+            entity_key, entry = entries.popitem(last=False)
+            if entry.referenced:
+                # Second chance: a recently used entry goes back to the end.
+                entry.referenced = False
+                entries[entity_key] = entry
+                continue
+            cache_key = self._get_cache_key(entity_type_name, entity_key)
+            self._drop_result(cache_key, entry)
+            self._invalidate_dependents(cache_key)
+
+    def _drop_result(self, cache_key, entry):
+        for dependency_cache_key in entry.dependencies:
+            dependents = self._dependents.get(dependency_cache_key)
+            if dependents is not None:
+                dependents.discard(cache_key)
+                if not dependents:
+                    del self._dependents[dependency_cache_key]
+        entry.result = None
+        entry.result_expires_at = None
+        entry.dependencies = ()
+
+    def _invalidate_dependents(self, cache_key):
+        for dependent_cache_key in self._dependents.pop(cache_key, ()):
+            entry = self._get_entry(*dependent_cache_key)
+            if entry is not None:
+                self._drop_result(dependent_cache_key, entry)
+            self._invalidate_dependents(dependent_cache_key)
+
+    def _update_result_expiration(self, cache_key):
+        entry = self._get_entry(*cache_key)
+        if entry is not None and entry.result is not None:
+            entry.result_expires_at = self._get_result_expires_at(entry)
+        for dependent_cache_key in list(self._dependents.get(cache_key, ())):
+            self._update_result_expiration(dependent_cache_key)
+
+    def _get_result_expires_at(self, entry):
+        expiration_times = [entry.expires_at]
+        for dependency_cache_key in entry.dependencies:
+            dependency = self._get_entry(*dependency_cache_key)
+            if dependency is not None:
+                expiration_times.append(
+                    dependency.result_expires_at
+                    if dependency.result is not None else dependency.expires_at
+                )
+        expiration_times = [t for t in expiration_times if t is not None]
+        return min(expiration_times) if expiration_times else None
+
+    def _get_policy(self, entity_type_name):
+        return self._policies.get(entity_type_name, _UNBOUNDED_CACHE_POLICY)
+
+    def _get_expires_at(self, entity_type_name):
+        ttl_seconds = self._get_policy(entity_type_name).ttl_seconds
+        return time.time() + ttl_seconds if ttl_seconds is not None else None
+
+    def _is_expired(self, expires_at):
+        return expires_at is not None and expires_at <= time.time()
+
+    def _revalidate(self, entity_type_name, entity_key):
+        """Schedules a background refresh of given stale entity.  Returns
+        `False` if the entity type cannot be refreshed in the background.
+        """
+        if entity_type_name not in self._refreshers:
+            return False
+        cache_key = self._get_cache_key(entity_type_name, entity_key)
+        if cache_key in self._refreshing:
+            return True
+        with self._lock:
+            if cache_key not in self._refreshing:
+                self._refreshing.add(cache_key)
+                self._refresh_queue.put(cache_key)
+                self._start_refresh_thread()
+        return True
+
+    def _start_refresh_thread(self):
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_stale_entries,
+            name='schematizer-cache-refresh'
+        )
+        self._refresh_thread.daemon = True
+        self._refresh_thread.start()
+
+    def _refresh_stale_entries(self):
+        while True:
+            cache_key = self._refresh_queue.get()
+            self._refresh(cache_key)
+
+    def _refresh(self, cache_key):
+        entity_type_name, entity_key = cache_key
+        try:
+            self._refreshers[entity_type_name](entity_key)
+        except Exception:
+            logger.warning(
+                "Unable to refresh cached {0} {1}.".format(
+                    entity_type_name, entity_key
+                ),
+                exc_info=True
+            )
+            self._postpone_refresh(cache_key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(cache_key)
+
+    def _postpone_refresh(self, cache_key):
+        # Keep serving the stale entry, but don't retry on every single hit.
+        retry_at = time.time() + self.REFRESH_RETRY_DELAY_SECONDS
+        with self._lock:
+            entry = self._get_entry(*cache_key)
+            if entry is None:
+                return
+            if entry.expires_at is not None:
+                entry.expires_at = retry_at
+            if entry.result is not None:
+                entry.result_expires_at = retry_at
 
     def _get_cache_key(self, entity_type_name, entity_key):
         return entity_type_name, entity_key
@@ -77,8 +495,17 @@ class _Cache(object):
 
 class SchematizerClient(object):
     """A client that interacts with Schematizer APIs.  It has built-in caching
-    feature which caches avro schemas, topics, and etc.  Right now the cache is
-    only in memory (TODO(DATAPIPE-162|joshszep): Implement persistent caching).
+    feature which caches avro schemas, topics, and etc.  The cache is in memory
+    and can optionally be backed by an on-disk store, see
+    :meth:`data_pipeline.config.Config.schematizer_persistent_cache_path`.
+    The number of cached entities of each type and how long they're trusted
+    before being refreshed are configured by
+    :meth:`data_pipeline.config.Config.schematizer_cache_max_entries` and
+    :meth:`data_pipeline.config.Config.schematizer_cache_ttl_seconds`.
+
+    Use :func:`get_schematizer` to get the client shared by the whole process
+    instead of instantiating this class directly.  Each instance owns its own
+    bravado client, HTTP session, and cache, so a new instance starts cold.
 
     It caches schemas, topics, and sources separately instead of caching nested
     objects to avoid storing duplicate data repeatedly.
@@ -99,8 +526,6 @@ class SchematizerClient(object):
     # TODO[clin|DATAPIPE-1518] change the rest of the hidden variables to normal
     # variables.
 
-    __metaclass__ = Singleton
-
     # Default page size used for the pagination when calling bulk apis such as
     # `get_topics_by_criteria`. If a bulk api needs pagination, this should be
     # the page size by default. If the api needs custom page size, we should
@@ -108,10 +533,97 @@ class SchematizerClient(object):
     # bunch of such constants which clutter the code.
     DEFAULT_PAGE_SIZE = 20
 
+    # Prefixes of the read-only apis whose concurrent identical calls are
+    # coalesced into a single request.
+    _COALESCED_API_PREFIXES = ('get_', 'list_')
+
+    # Entity types of the cache, by the names used in the cache configuration,
+    # see :meth:`data_pipeline.config.Config.schematizer_cache_max_entries`.
+    _CACHED_ENTITY_TYPES = {
+        'schema': _AvroSchema,
+        'topic': _Topic,
+        'source': _Source,
+        'data_target': _DataTarget,
+        'consumer_group': _ConsumerGroup
+    }
+    _CACHED_ENTITY_NAMES = {
+        entity_type: entity_name
+        for entity_name, entity_type in _CACHED_ENTITY_TYPES.iteritems()
+    }
+
     def __init__(self):
         self._bravado_client = get_config().schematizer_client
         self._client = ZipkinClientDecorator(self._bravado_client)
-        self._cache = _Cache()
+        self._single_flight = SingleFlight()
+        self._cache = _Cache(
+            persistent_cache=self._get_persistent_cache(),
+            policies=self._get_cache_policies(),
+            refreshers={
+                _AvroSchema: self._fetch_schema_by_id,
+                _Topic: self._fetch_topic_by_name,
+                _Source: self._fetch_source_by_id
+            },
+            error_ttl_seconds=get_config().schematizer_negative_cache_ttl_seconds
+        )
+        self.negative_cache_hit_counts = defaultdict(int)
+        self._negative_cache_hit_counter = self._get_negative_cache_hit_counter()
+
+    def _get_persistent_cache(self):
+        config = get_config()
+        if not config.schematizer_persistent_cache_path:
+            return None
+        return PersistentCache(
+            path=config.schematizer_persistent_cache_path,
+            max_age_seconds=config.schematizer_persistent_cache_max_age_seconds
+        )
+
+    def _get_negative_cache_hit_counter(self):
+        if not get_config().enable_meteorite:
+            return None
+        try:
+            from data_pipeline.tools.meteorite_wrappers import StatsCounter
+        except ImportError:
+            return None
+        return StatsCounter(
+            'schematizer_client.negative_cache_hits',
+            counted_dimension='entity_type',
+            container_name=get_config().container_name,
+            container_env=get_config().container_env
+        )
+
+    def _raise_if_not_found_before(self, entity_type, entity_key):
+        """Raises the error of the last lookup of given entity again if the
+        Schematizer didn't have the entity then, see
+        :meth:`data_pipeline.config.Config.schematizer_negative_cache_ttl_seconds`.
+        """
+        error = self._cache.get_error(entity_type, entity_key)
+        if error is None:
+            return
+        entity_name = self._CACHED_ENTITY_NAMES[entity_type]
+        self.negative_cache_hit_counts[entity_name] += 1
+        if self._negative_cache_hit_counter is not None:
+            self._negative_cache_hit_counter.process(entity_name)
+        raise error
+
+    def _call_api_for_entity(self, entity_type, entity_key, api, params):
+        try:
+            return self._call_api(api=api, params=params)
+        except HTTPError as error:
+            if error.response.status_code == 404:
+                self._cache.set_error(entity_type, entity_key, error)
+            raise
+
+    def _get_cache_policies(self):
+        config = get_config()
+        max_entries = config.schematizer_cache_max_entries
+        ttl_seconds = config.schematizer_cache_ttl_seconds
+        return {
+            entity_type: _CachePolicy(
+                max_entries=max_entries[entity_name],
+                ttl_seconds=ttl_seconds[entity_name]
+            )
+            for entity_name, entity_type in self._CACHED_ENTITY_TYPES.iteritems()
+        }
 
     def get_schema_by_id(self, schema_id):
         """Get the avro schema of given schema id.
@@ -123,14 +635,75 @@ class SchematizerClient(object):
             (data_pipeline.schematizer_clientlib.models.avro_schema.AvroSchema):
                 The requested avro Schema.
         """
-        return self._get_schema_by_id(schema_id).to_result()
+        schema = self._cache.get_result(_AvroSchema, schema_id)
+        if schema is not None:
+            return schema
+        self._raise_if_not_found_before(_AvroSchema, schema_id)
+
+        _schema = self._get_schema_by_id(schema_id)
+        schema = _schema.to_result()._replace(
+            topic=self.get_topic_by_name(_schema.topic.name)
+        )
+        self._cache.set_result(
+            _AvroSchema,
+            schema_id,
+            schema,
+            dependencies=[(_Topic, schema.topic.name)]
+        )
+        return schema
+
+    def get_schemas_by_ids(self, schema_ids):
+        """Get the avro schemas of given schema ids.  The schemas which are not
+        cached are fetched from the Schematizer concurrently, at most
+        :meth:`data_pipeline.config.Config.
+        schematizer_client_max_concurrent_requests` at a time.
+
+        Args:
+            schema_ids (iterable of int): The ids of requested avro schemas.
+
+        Returns:
+            (List[data_pipeline.schematizer_clientlib.models.avro_schema.AvroSchema]):
+                The requested avro schemas, in the same order as `schema_ids`.
+        """
+        schema_ids = list(schema_ids)
+        schemas = {
+            schema_id: self._cache.get_result(_AvroSchema, schema_id)
+            for schema_id in schema_ids
+        }
+        missing_ids = [
+            schema_id for schema_id, schema in schemas.iteritems()
+            if schema is None
+        ]
+        schemas.update(
+            zip(missing_ids, self._map_concurrently(
+                self.get_schema_by_id,
+                missing_ids
+            ))
+        )
+        return [schemas[schema_id] for schema_id in schema_ids]
+
+    def _map_concurrently(self, func, items):
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        pool = ThreadPool(min(
+            len(items),
+            get_config().schematizer_client_max_concurrent_requests
+        ))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.terminate()
 
     def _get_schema_by_id(self, schema_id):
         _schema = self._get_cached_schema(schema_id)
         if _schema:
             return _schema
+        return self._fetch_schema_by_id(schema_id)
 
-        response = self._call_api(
+    def _fetch_schema_by_id(self, schema_id):
+        response = self._call_api_for_entity(
+            _AvroSchema,
+            schema_id,
             api=self._client.schemas.get_schema_by_id,
             params={'schema_id': schema_id}
         )
@@ -229,29 +802,101 @@ class SchematizerClient(object):
             self._set_cache_by_schema(_schema)
         return results
 
+    def iter_schemas_created_after_date(
+        self,
+        created_after,
+        min_id=0,
+        page_size=10,
+        max_page_size=100
+    ):
+        """ Lazily iterates the avro schemas (excluding disabled schemas)
+        created after the given datetime timestamp in ascending order of
+        schema id, so that the callers can start processing the first schemas
+        before all of them are fetched.  Limits the result to those with id
+        greater than or equal to the min_id.
+
+        The page size doubles after each full page, up to `max_page_size`, and
+        the next page is requested in the background while the schemas of the
+        current page are being cached and yielded.
+
+        Args:
+            created_after (long): get schemas created at or after the given
+                epoch timestamp.
+            min_id (Optional[int]): Limits the result to those schemas with an
+                id greater than or equal to given min_id (default: 0)
+            page_size (Optional[int]): Number of schemas to retrieve in the
+                first call (default: 10).
+            max_page_size (Optional[int]): Maximum number of schemas to
+                retrieve per call to avoid timeouts (default: 100).
+
+        Yields:
+            (data_pipeline.schematizer_clientlib.models.avro_schema.AvroSchema):
+                The avro schemas created after (inclusive) specified date.
+        """
+        return self._iter_schemas_created_after_date(
+            created_after,
+            min_id,
+            page_size,
+            max(page_size, max_page_size)
+        )
+
     def _get_schemas_created_after_date(self, created_after, min_id, page_size):
-        last_page_size = page_size
-        result = []
-        # Exit the loop when the number of schemas returned are not equal to
-        # page_size. Denoting there are no more schemas to fetch from the
-        # Schematizer.
-        while last_page_size == page_size:
-            response = self._call_api(
-                api=self._client.schemas.get_schemas_created_after,
-                params={
-                    'created_after': created_after,
-                    'count': page_size,
-                    'min_id': min_id
-                }
-            )
+        return list(self._iter_schemas_created_after_date(
+            created_after,
+            min_id,
+            page_size,
+            max_page_size=page_size
+        ))
 
-            for resp_item in response:
-                _schema = _AvroSchema.from_response(resp_item)
-                result.append(_schema.to_result())
-                self._set_cache_by_schema(_schema)
-                min_id = _schema.schema_id + 1
-            last_page_size = len(response)
-        return result
+    def _iter_schemas_created_after_date(
+        self,
+        created_after,
+        min_id,
+        page_size,
+        max_page_size
+    ):
+        api = self._client.schemas.get_schemas_created_after
+        pool = ThreadPool(1)
+        try:
+            next_page = pool.apply_async(
+                self._call_api,
+                (api, self._get_schemas_page_params(created_after, min_id, page_size))
+            )
+            while next_page is not None:
+                response = next_page.get()
+                next_page = None
+                # Stop when the number of schemas returned is less than the
+                # page_size, denoting there are no more schemas to fetch from
+                # the Schematizer.  Otherwise request the next page before
+                # processing this one.
+                if len(response) == page_size:
+                    min_id = response[-1].schema_id + 1
+                    page_size = min(page_size * 2, max_page_size)
+                    next_page = pool.apply_async(
+                        self._call_api,
+                        (
+                            api,
+                            self._get_schemas_page_params(
+                                created_after,
+                                min_id,
+                                page_size
+                            )
+                        )
+                    )
+
+                for resp_item in response:
+                    _schema = _AvroSchema.from_response(resp_item)
+                    self._set_cache_by_schema(_schema)
+                    yield _schema.to_result()
+        finally:
+            pool.terminate()
+
+    def _get_schemas_page_params(self, created_after, min_id, page_size):
+        return {
+            'created_after': created_after,
+            'count': page_size,
+            'min_id': min_id
+        }
 
     def get_schemas_by_topic(self, topic_name):
         """Get the list of schemas in the specified topic.
@@ -284,14 +929,33 @@ class SchematizerClient(object):
             (data_pipeline.schematizer_clientlib.models.topic.Topic):
                 The requested topic.
         """
-        return self._get_topic_by_name(topic_name).to_result()
+        topic = self._cache.get_result(_Topic, topic_name)
+        if topic is not None:
+            return topic
+        self._raise_if_not_found_before(_Topic, topic_name)
+
+        _topic = self._get_topic_by_name(topic_name)
+        topic = _topic.to_result()._replace(
+            source=self.get_source_by_id(_topic.source.source_id)
+        )
+        self._cache.set_result(
+            _Topic,
+            topic_name,
+            topic,
+            dependencies=[(_Source, topic.source.source_id)]
+        )
+        return topic
 
     def _get_topic_by_name(self, topic_name):
         _topic = self._get_cached_topic(topic_name)
         if _topic:
             return _topic
+        return self._fetch_topic_by_name(topic_name)
 
-        response = self._call_api(
+    def _fetch_topic_by_name(self, topic_name):
+        response = self._call_api_for_entity(
+            _Topic,
+            topic_name,
             api=self._client.topics.get_topic_by_topic_name,
             params={'topic_name': topic_name}
         )
@@ -309,14 +973,25 @@ class SchematizerClient(object):
             (data_pipeline.schematizer_clientlib.models.topic.Source):
                 The requested schema source.
         """
-        return self._get_source_by_id(source_id).to_result()
+        source = self._cache.get_result(_Source, source_id)
+        if source is not None:
+            return source
+        self._raise_if_not_found_before(_Source, source_id)
+
+        source = self._get_source_by_id(source_id).to_result()
+        self._cache.set_result(_Source, source_id, source)
+        return source
 
     def _get_source_by_id(self, source_id):
         _source = self._cache.get_value(_Source, source_id)
         if _source:
             return _source
+        return self._fetch_source_by_id(source_id)
 
-        response = self._call_api(
+    def _fetch_source_by_id(self, source_id):
+        response = self._call_api_for_entity(
+            _Source,
+            source_id,
             api=self._client.sources.get_source_by_id,
             params={'source_id': source_id}
         )
@@ -1272,10 +1947,31 @@ class SchematizerClient(object):
         return response
 
     def _call_api(self, api, params=None, request_body=None):
-        request_params = params or {}
+        api_name = self._get_api_name(api)
+        if request_body or not api_name.startswith(self._COALESCED_API_PREFIXES):
+            return self._send_api_request(api, params, request_body)
+        # Concurrent reads of the same entity, e.g. cache misses of a new
+        # schema id in many threads, share one request to the Schematizer.
+        return self._single_flight.do(
+            (api_name, simplejson.dumps(params, sort_keys=True)),
+            self._send_api_request,
+            api,
+            params
+        )
+
+    def _get_api_name(self, api):
+        # ZipkinClientDecorator wraps the operation in a new partial of the
+        # operation name on each access, so the name is taken from there.
+        if isinstance(api, functools.partial) and api.args:
+            return api.args[0]
+        return getattr(api, '__name__', '')
+
+    def _send_api_request(self, api, params=None, request_body=None):
+        request_params = dict(params or {})
         if request_body:
             request_params['body'] = request_body
-        request = api(**request_params)
+        with swagger_spec_lock:
+            request = api(**request_params)
         retry_policy = RetryPolicy(
             ExpBackoffPolicy(with_jitter=True),
             max_retry_count=get_config().schematizer_client_max_connection_retry
@@ -1340,5 +2036,45 @@ class SchematizerClient(object):
         return _refresh.to_result()
 
 
+_schematizer_lock = threading.Lock()
+_schematizer_client = None
+_schematizer_client_pid = None
+
+
 def get_schematizer():
-    return SchematizerClient()
+    """Returns the :class:`SchematizerClient` shared by the whole process.
+
+    The client is created on first use, so the process holds exactly one
+    bravado client, one HTTP session and one cache.  A forked child process
+    gets its own client on first use rather than reusing the connections of
+    its parent.  It is safe to call this function from multiple threads.
+    """
+    client = _schematizer_client
+    if client is not None and _schematizer_client_pid == os.getpid():
+        return client
+    return _create_schematizer()
+
+
+def _create_schematizer():
+    global _schematizer_client
+    global _schematizer_client_pid
+    with _schematizer_lock:
+        pid = os.getpid()
+        if _schematizer_client is None or _schematizer_client_pid != pid:
+            _schematizer_client = SchematizerClient()
+            _schematizer_client_pid = pid
+        return _schematizer_client
+
+
+def reset_schematizer():
+    """Discards the shared :class:`SchematizerClient`, so that the next
+    :func:`get_schematizer` call creates a new client with an empty cache.
+
+    This is mainly meant for tests, e.g. after the schematizer host has been
+    reconfigured.
+    """
+    global _schematizer_client
+    global _schematizer_client_pid
+    with _schematizer_lock:
+        _schematizer_client = None
+        _schematizer_client_pid = None
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import re
+import socket
+import sys
+import threading
+import time
+import urllib
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+
+import simplejson
+
+
+# Bound at import time, since the sys module may already be torn down when a
+# handler thread fails during interpreter shutdown.
+_exc_info = sys.exc_info
+
+_SWAGGER_SPEC = {
+    'swagger': '2.0',
+    'info': {'title': 'Fake Schematizer', 'version': '1.0'},
+    'basePath': '/v1',
+    'produces': ['application/json'],
+    'paths': {
+        '/schemas/{schema_id}': {
+            'get': {
+                'tags': ['schemas'],
+                'operationId': 'get_schema_by_id',
+                'parameters': [{
+                    'name': 'schema_id',
+                    'in': 'path',
+                    'required': True,
+                    'type': 'integer'
+                }],
+                'responses': {
+                    '200': {
+                        'description': 'The avro schema.',
+                        'schema': {'$ref': '#/definitions/AvroSchema'}
+                    },
+                    '404': {'description': 'Schema not found.'}
+                }
+            }
+        },
+        '/topics/{topic_name}': {
+            'get': {
+                'tags': ['topics'],
+                'operationId': 'get_topic_by_topic_name',
+                'parameters': [{
+                    'name': 'topic_name',
+                    'in': 'path',
+                    'required': True,
+                    'type': 'string'
+                }],
+                'responses': {
+                    '200': {
+                        'description': 'The topic.',
+                        'schema': {'$ref': '#/definitions/Topic'}
+                    },
+                    '404': {'description': 'Topic not found.'}
+                }
+            }
+        },
+        '/sources/{source_id}': {
+            'get': {
+                'tags': ['sources'],
+                'operationId': 'get_source_by_id',
+                'parameters': [{
+                    'name': 'source_id',
+                    'in': 'path',
+                    'required': True,
+                    'type': 'integer'
+                }],
+                'responses': {
+                    '200': {
+                        'description': 'The source.',
+                        'schema': {'$ref': '#/definitions/Source'}
+                    },
+                    '404': {'description': 'Source not found.'}
+                }
+            }
+        }
+    },
+    'definitions': {
+        'Namespace': {
+            'type': 'object',
+            'properties': {
+                'namespace_id': {'type': 'integer'},
+                'name': {'type': 'string'}
+            }
+        },
+        'Source': {
+            'type': 'object',
+            'properties': {
+                'source_id': {'type': 'integer'},
+                'name': {'type': 'string'},
+                'owner_email': {'type': 'string'},
+                'namespace': {'$ref': '#/definitions/Namespace'},
+                'category': {'type': 'string'}
+            }
+        },
+        'Topic': {
+            'type': 'object',
+            'properties': {
+                'topic_id': {'type': 'integer'},
+                'name': {'type': 'string'},
+                'source': {'$ref': '#/definitions/Source'},
+                'contains_pii': {'type': 'boolean'},
+                'cluster_type': {'type': 'string'},
+                'primary_keys': {'type': 'array', 'items': {'type': 'string'}},
+                'created_at': {'type': 'string'},
+                'updated_at': {'type': 'string'}
+            }
+        },
+        'AvroSchema': {
+            'type': 'object',
+            'properties': {
+                'schema_id': {'type': 'integer'},
+                'schema': {'type': 'string'},
+                'topic': {'$ref': '#/definitions/Topic'},
+                'base_schema_id': {'type': 'integer'},
+                'status': {'type': 'string'},
+                'primary_keys': {'type': 'array', 'items': {'type': 'string'}},
+                'note': {'type': 'object'},
+                'created_at': {'type': 'string'},
+                'updated_at': {'type': 'string'}
+            }
+        }
+    }
+}
+
+
+def _remove_nulls(body):
+    # The swagger spec doesn't mark any property nullable, so the properties
+    # without a value are left out, and the client sets them to `None`.
+    if isinstance(body, dict):
+        return {
+            key: _remove_nulls(value)
+            for key, value in body.iteritems() if value is not None
+        }
+    return body
+
+
+class _FakeSchematizerRequestHandler(BaseHTTPRequestHandler):
+
+    # HTTP/1.1 keeps the connection open between requests.  The response is
+    # buffered and sent right away, so that it isn't held back by Nagle's
+    # algorithm waiting on the delayed ack of the client.
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    _ROUTES = (
+        (re.compile(r'^/v1/schemas/(\d+)$'), 'get_schema', int),
+        (re.compile(r'^/v1/topics/([^/]+)$'), 'get_topic', urllib.unquote),
+        (re.compile(r'^/v1/sources/(\d+)$'), 'get_source', int),
+    )
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.fake_schematizer._on_connection()
+
+    def do_GET(self):
+        fake_schematizer = self.server.fake_schematizer
+        fake_schematizer._on_request()
+        path = self.path.split('?')[0]
+        if path == '/swagger.json':
+            return self._respond(200, _SWAGGER_SPEC)
+        for pattern, getter_name, key_type in self._ROUTES:
+            match = pattern.match(path)
+            if match:
+                entity = getattr(fake_schematizer, getter_name)(
+                    key_type(match.group(1))
+                )
+                if entity is None:
+                    return self._respond(404, {'message': 'Not found.'})
+                return self._respond(200, entity)
+        return self._respond(404, {'message': 'Unknown path.'})
+
+    def _respond(self, status_code, body):
+        content = simplejson.dumps(_remove_nulls(body))
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Threading HTTP server which keeps track of the threads handling the
+    open connections, so they can be closed and joined when it's stopped.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self._request_threads_lock = threading.Lock()
+        self._thread_to_request = {}
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(
+            target=self.process_request_thread,
+            args=(request, client_address)
+        )
+        thread.daemon = self.daemon_threads
+        with self._request_threads_lock:
+            self._thread_to_request[thread] = request
+        thread.start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            with self._request_threads_lock:
+                self._thread_to_request.pop(threading.current_thread(), None)
+
+    def close_requests(self):
+        """Closes the connections still open, e.g. kept alive by clients, and
+        waits for the threads handling them to finish.
+        """
+        with self._request_threads_lock:
+            thread_to_request = dict(self._thread_to_request)
+        for request in thread_to_request.itervalues():
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for thread in thread_to_request:
+            thread.join()
+
+    def handle_error(self, request, client_address):
+        # Clients closing the connection early, e.g. on a read timeout, are
+        # expected and not worth a traceback.
+        if not isinstance(_exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class FakeSchematizer(object):
+    """Stand-in for the Schematizer service which runs a local HTTP server
+    in a background thread.  It serves a minimal swagger spec and the
+    `get_schema_by_id`, `get_topic_by_topic_name`, and `get_source_by_id`
+    apis from entities kept in memory, so that the schematizer client, and
+    its http transport, can be tested and benchmarked without the docker
+    containers.
+
+    Example::
+
+        with FakeSchematizer(latency_seconds=0.01) as fake_schematizer:
+            schema_id = fake_schematizer.add_schema(schema_json)
+            with reconfigure(
+                schematizer_host_and_port=fake_schematizer.host_and_port
+            ):
+                reset_schematizer()
+                get_schematizer().get_schema_by_id(schema_id)
+
+    Args:
+        latency_seconds (Optional[float]): Number of seconds the server waits
+            before responding to an api request, to simulate the network and
+            service latency of a real Schematizer.
+    """
+
+    def __init__(self, latency_seconds=0):
+        self.latency_seconds = latency_seconds
+        self.connection_count = 0
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self._topics = {}
+        self._sources = {}
+        self._server = None
+        self._thread = None
+
+    @property
+    def host_and_port(self):
+        """Host and port of the running server, in the format `host:port`."""
+        host, port = self._server.server_address
+        return '{0}:{1}'.format(host, port)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            _FakeSchematizerRequestHandler
+        )
+        self._server.fake_schematizer = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+        self._server.close_requests()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def add_schema(
+        self,
+        schema_json,
+        topic_name='fake_topic',
+        source_name='fake_source',
+        namespace_name='fake_namespace',
+        contains_pii=False
+    ):
+        """Adds an avro schema, along with its topic and source if they don't
+        exist yet, and returns the id of the new schema.
+        """
+        with self._lock:
+            source = self._add_source(source_name, namespace_name)
+            topic = self._topics.get(topic_name)
+            if topic is None:
+                topic = {
+                    'topic_id': len(self._topics) + 1,
+                    'name': topic_name,
+                    'source': source,
+                    'contains_pii': contains_pii,
+                    'cluster_type': 'datapipe',
+                    'primary_keys': [],
+                    'created_at': None,
+                    'updated_at': None
+                }
+                self._topics[topic_name] = topic
+            schema_id = len(self._schemas) + 1
+            self._schemas[schema_id] = {
+                'schema_id': schema_id,
+                'schema': simplejson.dumps(schema_json),
+                'topic': topic,
+                'base_schema_id': None,
+                'status': 'RW',
+                'primary_keys': [],
+                'note': None,
+                'created_at': None,
+                'updated_at': None
+            }
+            return schema_id
+
+    def _add_source(self, source_name, namespace_name):
+        for source in self._sources.itervalues():
+            if (
+                source['name'] == source_name and
+                source['namespace']['name'] == namespace_name
+            ):
+                return source
+        source_id = len(self._sources) + 1
+        source = {
+            'source_id': source_id,
+            'name': source_name,
+            'owner_email': 'fake@yelp.com',
+            'namespace': {'namespace_id': source_id, 'name': namespace_name},
+            'category': None
+        }
+        self._sources[source_id] = source
+        return source
+
+    def get_schema(self, schema_id):
+        return self._get_entity(self._schemas, schema_id)
+
+    def get_topic(self, topic_name):
+        return self._get_entity(self._topics, topic_name)
+
+    def get_source(self, source_id):
+        return self._get_entity(self._sources, source_id)
+
+    def _get_entity(self, entities, key):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            return entities.get(key)
+
+    def _on_connection(self):
+        with self._lock:
+            self.connection_count += 1
+
+    def _on_request(self):
+        with self._lock:
+            self.request_count += 1
@@ -23,10 +23,10 @@ from contextlib import contextmanager
 
 from bravado.exception import HTTPError
 from cached_property import cached_property
-from kafka import KafkaClient
 from kafka_utils.util import offsets
 from kafka_utils.util.zookeeper import ZK
 
+from data_pipeline._kafka_client_pool import get_kafka_client
 from data_pipeline.config import get_config
 from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
 from data_pipeline.servlib.config_util import load_package_config
@@ -118,7 +118,7 @@ class IntrospectorCommand(object):
 
     @contextmanager
     def _kafka_client(self):
-        kafka_client = KafkaClient(self.config.cluster_config.broker_list)
+        kafka_client = get_kafka_client(self.config.cluster_config.broker_list)
         try:
             yield kafka_client
         finally:
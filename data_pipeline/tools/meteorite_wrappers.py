@@ -34,11 +34,20 @@ class StatsCounter(StatsBase):
     Args:
       stats_counter_name(str): the name of this stat.
       message_counte_timer(float): the time interval between batch flushes.
+      counted_dimension(str): the dimension the counts are broken down by,
+        default to `topic`.
       kwargs(dict): the stat dimensions
     """
 
-    def __init__(self, stat_counter_name, message_count_timer=0.25, **kwargs):
+    def __init__(
+        self,
+        stat_counter_name,
+        message_count_timer=0.25,
+        counted_dimension='topic',
+        **kwargs
+    ):
         self.dimensions = kwargs
+        self.counted_dimension = counted_dimension
 
         self.message_count_timer = message_count_timer
         self._meteorite_counter = yelp_meteorite.create_counter(
@@ -51,9 +60,9 @@ class StatsCounter(StatsBase):
         self.counts = defaultdict(int)
         self.flush_time = time.time() + self.message_count_timer
 
-    def increment(self, topic):
-        """Increments the counter for the given topic"""
-        self.counts[topic] += 1
+    def increment(self, topic, count=1):
+        """Increments the counter for the given topic by count, default to 1"""
+        self.counts[topic] += count
         self.wake()
 
     def wake(self):
@@ -65,7 +74,7 @@ class StatsCounter(StatsBase):
     def flush(self):
         """Causes all of the existing counts to be sent to meteorite"""
         for topic, count in self.counts.iteritems():
-            self._meteorite_counter.count(count, {'topic': topic})
+            self._meteorite_counter.count(count, {self.counted_dimension: topic})
         self._reset()
 
     def process(self, topic):
@@ -24,7 +24,6 @@ from optparse import OptionGroup
 from uuid import UUID
 
 import simplejson
-from kafka import KafkaClient
 from kafka_utils.util import offsets
 from yelp_batch.batch import Batch
 from yelp_batch.batch import batch_command_line_options
@@ -32,6 +31,7 @@ from yelp_batch.batch import batch_configure
 
 from data_pipeline import __version__
 from data_pipeline._fast_uuid import FastUUID
+from data_pipeline._kafka_client_pool import get_kafka_client
 from data_pipeline.base_consumer import ConsumerTopicState
 from data_pipeline.config import get_config
 from data_pipeline.consumer import Consumer
@@ -256,7 +256,7 @@ class Tailer(Batch):
         # We setup logging 'early' since we want it available for setup_topics
         self._setup_logging()
 
-        self.kafka_client = KafkaClient(get_config().cluster_config.broker_list)
+        self.kafka_client = get_kafka_client(get_config().cluster_config.broker_list)
 
         self._setup_topics()
         if len(self.topic_to_offsets_map) == 0:
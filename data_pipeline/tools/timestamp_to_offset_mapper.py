@@ -25,6 +25,10 @@ from data_pipeline.envelope import Envelope
 
 logger = get_config().logger
 
+# Only the timestamps of the probed messages are peeked, so a single envelope
+# is shared by all of them.
+_envelope = Envelope()
+
 # TODO (joshszep|DATAPIPE-2119) We could use some tests for this stuff.. :)
 
 
@@ -189,8 +193,8 @@ def _get_update_info_from_simple_consumer_response(response):
     (partition, (offset, raw_message)) = response
     # message is of type kafka.common.Message
     raw_message_bytes = raw_message.value
-    unpacked_message = Envelope().unpack(packed_message=raw_message_bytes)
-    timestamp = unpacked_message['timestamp']
+    peeked_message = _envelope.peek(raw_message_bytes, fields=['timestamp'])
+    timestamp = peeked_message['timestamp']
     return offset, partition, timestamp
 
 
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import random
+
+import avro.io
+import avro.schema
+import pytest
+from data_pipeline_avro_util.avro_string_reader import AvroStringReader
+from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
+
+from data_pipeline._compiled_avro_reader import compile_decoder
+from data_pipeline._compiled_avro_reader import CompiledAvroStringReader
+from data_pipeline._compiled_avro_writer import UnsupportedSchemaError
+
+
+class TestCompiledAvroStringReader(object):
+
+    @property
+    def writer_schema(self):
+        return {
+            'type': 'record',
+            'name': 'business',
+            'namespace': 'yelp',
+            'fields': [
+                {'name': 'id', 'type': 'int'},
+                {'name': 'counter', 'type': 'int'},
+                {'name': 'rating', 'type': 'float'},
+                {'name': 'name', 'type': 'string'},
+                {'name': 'is_open', 'type': 'boolean'},
+                {'name': 'photo', 'type': ['null', 'bytes']},
+                {
+                    'name': 'category',
+                    'type': {
+                        'type': 'enum',
+                        'name': 'category',
+                        'symbols': ['food', 'shopping']
+                    }
+                },
+                {
+                    'name': 'removed_owner',
+                    'type': ['null', {
+                        'type': 'record',
+                        'name': 'owner',
+                        'fields': [
+                            {'name': 'name', 'type': 'string'},
+                            {'name': 'score', 'type': 'double'},
+                            {'name': 'checksum', 'type': {
+                                'type': 'fixed', 'name': 'md5', 'size': 16
+                            }},
+                            {'name': 'kind', 'type': 'category'}
+                        ]
+                    }]
+                },
+                {
+                    'name': 'removed_hours',
+                    'type': {'type': 'map', 'values': ['int', 'string']}
+                },
+                {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}},
+                {'name': 'visits', 'type': ['null', 'int']},
+                {'name': 'nothing', 'type': 'null'}
+            ]
+        }
+
+    @property
+    def reader_schema(self):
+        return {
+            'type': 'record',
+            'name': 'business',
+            'namespace': 'yelp',
+            'fields': [
+                {'name': 'is_open', 'type': 'boolean'},
+                {'name': 'id', 'type': 'int'},
+                {'name': 'counter', 'type': 'double'},
+                {'name': 'rating', 'type': 'double'},
+                {'name': 'name', 'type': ['null', 'string']},
+                {'name': 'photo', 'type': ['null', 'bytes']},
+                {
+                    'name': 'category',
+                    'type': {
+                        'type': 'enum',
+                        'name': 'category',
+                        'symbols': ['nightlife', 'shopping', 'food']
+                    }
+                },
+                {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}},
+                {'name': 'visits', 'type': ['null', 'long']},
+                {'name': 'nothing', 'type': 'null'},
+                {'name': 'added_count', 'type': 'long', 'default': 7},
+                {'name': 'added_name', 'type': 'string', 'default': 'unknown'},
+                {
+                    'name': 'added_aliases',
+                    'type': {'type': 'array', 'items': 'string'},
+                    'default': ['a', 'b']
+                },
+                {
+                    'name': 'added_location',
+                    'type': {
+                        'type': 'record',
+                        'name': 'location',
+                        'fields': [
+                            {'name': 'city', 'type': 'string'},
+                            {'name': 'zip', 'type': 'int', 'default': 0}
+                        ]
+                    },
+                    'default': {'city': 'SF'}
+                },
+                {'name': 'added_note', 'type': ['null', 'string'], 'default': None}
+            ]
+        }
+
+    def _create_random_string(self, rng):
+        return ''.join(
+            rng.choice('abc\xe9中') for _ in range(rng.randint(0, 20))
+        )
+
+    def _create_random_bytes(self, rng, size):
+        return bytes(bytearray(rng.randint(0, 255) for _ in range(size)))
+
+    def _create_random_int(self, rng):
+        return rng.choice([
+            0,
+            -1,
+            64,
+            -(1 << 31),
+            (1 << 31) - 1,
+            rng.randint(-(1 << 31), (1 << 31) - 1)
+        ])
+
+    def _create_random_datum(self, rng):
+        return {
+            'id': self._create_random_int(rng),
+            'counter': self._create_random_int(rng),
+            'rating': rng.choice([0, 1.5, rng.random()]),
+            'name': self._create_random_string(rng),
+            'is_open': rng.choice([True, False]),
+            'photo': rng.choice([
+                None,
+                self._create_random_bytes(rng, rng.randint(0, 200))
+            ]),
+            'category': rng.choice(['food', 'shopping']),
+            'removed_owner': rng.choice([None, {
+                'name': self._create_random_string(rng),
+                'score': rng.random(),
+                'checksum': self._create_random_bytes(rng, 16),
+                'kind': 'food'
+            }]),
+            'removed_hours': {
+                self._create_random_string(rng): rng.choice([
+                    self._create_random_int(rng),
+                    self._create_random_string(rng)
+                ])
+                for _ in range(rng.randint(0, 3))
+            },
+            'tags': [
+                self._create_random_string(rng)
+                for _ in range(rng.randint(0, 3))
+            ],
+            'visits': rng.choice([None, self._create_random_int(rng)]),
+            'nothing': None
+        }
+
+    def _assert_same_data(self, actual, expected):
+        assert type(actual) == type(expected)
+        if isinstance(expected, dict):
+            assert sorted(actual.keys()) == sorted(expected.keys())
+            for key, value in expected.iteritems():
+                self._assert_same_data(actual[key], value)
+        elif isinstance(expected, list):
+            assert len(actual) == len(expected)
+            for actual_item, expected_item in zip(actual, expected):
+                self._assert_same_data(actual_item, expected_item)
+        else:
+            assert actual == expected
+
+    def _decode_with_generic_reader(self, writer_schema, reader_schema, encoded):
+        return AvroStringReader(
+            reader_schema=reader_schema,
+            writer_schema=writer_schema
+        ).decode(encoded)
+
+    def _compile_decoder(self, writer_schema, reader_schema):
+        return compile_decoder(
+            avro.schema.make_avsc_object(writer_schema),
+            avro.schema.make_avsc_object(reader_schema)
+        )
+
+    @pytest.mark.parametrize('seed', range(50))
+    def test_same_data_as_avro(self, seed):
+        datum = self._create_random_datum(random.Random(seed))
+        encoded = AvroStringWriter(self.writer_schema).encode(datum)
+        expected = self._decode_with_generic_reader(
+            self.writer_schema,
+            self.reader_schema,
+            encoded
+        )
+        decode = self._compile_decoder(self.writer_schema, self.reader_schema)
+        self._assert_same_data(decode(encoded), expected)
+        reader = CompiledAvroStringReader(self.reader_schema, self.writer_schema)
+        self._assert_same_data(reader.decode(encoded), expected)
+
+    @pytest.mark.parametrize('seed', range(10))
+    def test_same_data_as_avro_with_same_schema(self, seed):
+        datum = self._create_random_datum(random.Random(seed))
+        encoded = AvroStringWriter(self.writer_schema).encode(datum)
+        decode = self._compile_decoder(self.writer_schema, self.writer_schema)
+        self._assert_same_data(decode(encoded), self._decode_with_generic_reader(
+            self.writer_schema,
+            self.writer_schema,
+            encoded
+        ))
+
+    def test_defaults_are_not_shared(self):
+        encoded = AvroStringWriter(self.writer_schema).encode(
+            self._create_random_datum(random.Random(0))
+        )
+        decode = self._compile_decoder(self.writer_schema, self.reader_schema)
+        decoded = decode(encoded)
+        decoded['added_aliases'].append('c')
+        decoded['added_location']['city'] = 'NYC'
+        decoded = decode(encoded)
+        assert decoded['added_aliases'] == ['a', 'b']
+        assert decoded['added_location'] == {'city': 'SF', 'zip': 0}
+
+    def test_array_blocks_with_size(self):
+        writer_schema = {
+            'type': 'record',
+            'name': 'blocks',
+            'fields': [
+                {'name': 'removed', 'type': {'type': 'array', 'items': 'int'}},
+                {'name': 'kept', 'type': {'type': 'array', 'items': 'int'}}
+            ]
+        }
+        reader_schema = dict(writer_schema, fields=writer_schema['fields'][1:])
+        # Both arrays are [1, 2], as a block of -2 items of 2 bytes.
+        encoded = b'\x03\x04\x02\x04\x00' * 2
+        decode = self._compile_decoder(writer_schema, reader_schema)
+        assert decode(encoded) == self._decode_with_generic_reader(
+            writer_schema,
+            reader_schema,
+            encoded
+        ) == {'kept': [1, 2]}
+
+    @pytest.mark.parametrize('seed', range(10))
+    def test_projected_fields_are_the_same_as_avro(self, seed):
+        fields = {'id', 'name', 'tags', 'added_count', 'not_a_field'}
+        encoded = AvroStringWriter(self.writer_schema).encode(
+            self._create_random_datum(random.Random(seed))
+        )
+        expected = {
+            name: value for name, value in self._decode_with_generic_reader(
+                self.writer_schema,
+                self.reader_schema,
+                encoded
+            ).iteritems() if name in fields
+        }
+        assert sorted(expected.keys()) == ['added_count', 'id', 'name', 'tags']
+        decode = compile_decoder(
+            avro.schema.make_avsc_object(self.writer_schema),
+            avro.schema.make_avsc_object(self.reader_schema),
+            fields
+        )
+        self._assert_same_data(decode(encoded), expected)
+        reader = CompiledAvroStringReader(
+            self.reader_schema,
+            self.writer_schema,
+            fields
+        )
+        self._assert_same_data(reader.decode(encoded), expected)
+
+    def test_projected_fields_of_unsupported_schema(self):
+        schema = {
+            'type': 'record',
+            'name': 'linked_list',
+            'fields': [
+                {'name': 'value', 'type': 'int'},
+                {'name': 'next', 'type': ['null', 'linked_list']}
+            ]
+        }
+        encoded = AvroStringWriter(schema).encode(
+            {'value': 1, 'next': {'value': 2, 'next': None}}
+        )
+        reader = CompiledAvroStringReader(schema, schema, fields=['value'])
+        assert reader._compiled_decode is None
+        assert reader.decode(encoded) == {'value': 1}
+
+    @pytest.mark.parametrize('reader_schema_update', [
+        {'added_count': 'long'},
+        {'id': 'string'}
+    ])
+    def test_unprojected_unresolvable_fields_fail_like_avro(
+        self,
+        reader_schema_update
+    ):
+        reader_schema = self.reader_schema
+        reader_schema['fields'] = [
+            {'name': field['name'], 'type': reader_schema_update[field['name']]}
+            if field['name'] in reader_schema_update else field
+            for field in reader_schema['fields']
+        ]
+        encoded = AvroStringWriter(self.writer_schema).encode(
+            self._create_random_datum(random.Random(0))
+        )
+        reader = CompiledAvroStringReader(
+            reader_schema,
+            self.writer_schema,
+            fields=['name']
+        )
+        with pytest.raises(avro.io.SchemaResolutionException):
+            reader.decode(encoded)
+
+    @pytest.mark.parametrize('reader_schema_update', [
+        # The reader doesn't have the symbol of the datum.
+        {'category': {'type': 'enum', 'name': 'category', 'symbols': ['other']}},
+        # The reader has a field without default the writer doesn't have.
+        {'added_count': 'long'},
+        # The schemas don't match.
+        {'id': 'string'}
+    ])
+    def test_unresolvable_data_fails_like_avro(self, reader_schema_update):
+        reader_schema = self.reader_schema
+        # The updated fields don't have defaults.
+        reader_schema['fields'] = [
+            {'name': field['name'], 'type': reader_schema_update[field['name']]}
+            if field['name'] in reader_schema_update else field
+            for field in reader_schema['fields']
+        ]
+        encoded = AvroStringWriter(self.writer_schema).encode(
+            self._create_random_datum(random.Random(0))
+        )
+        reader = CompiledAvroStringReader(reader_schema, self.writer_schema)
+        assert reader._compiled_decode is not None
+        with pytest.raises(avro.io.SchemaResolutionException):
+            reader.decode(encoded)
+
+    def test_truncated_data_fails_like_avro(self):
+        encoded = AvroStringWriter(self.writer_schema).encode(
+            self._create_random_datum(random.Random(0))
+        )
+        with pytest.raises(Exception) as generic_error:
+            self._decode_with_generic_reader(
+                self.writer_schema,
+                self.reader_schema,
+                encoded[:-2]
+            )
+        reader = CompiledAvroStringReader(self.reader_schema, self.writer_schema)
+        with pytest.raises(generic_error.type):
+            reader.decode(encoded[:-2])
+
+    @pytest.mark.parametrize('schema', [
+        {'type': 'bytes', 'logicalType': 'decimal', 'precision': 4, 'scale': 2},
+        {
+            'type': 'record',
+            'name': 'linked_list',
+            'fields': [
+                {'name': 'value', 'type': 'int'},
+                {'name': 'next', 'type': ['null', 'linked_list']}
+            ]
+        }
+    ])
+    def test_unsupported_schema(self, schema):
+        with pytest.raises(UnsupportedSchemaError):
+            self._compile_decoder(schema, schema)
+        reader = CompiledAvroStringReader(schema, schema)
+        assert reader._compiled_decode is None
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import random
+
+import avro.io
+import avro.schema
+import pytest
+from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
+
+from data_pipeline._compiled_avro_writer import compile_encoder
+from data_pipeline._compiled_avro_writer import CompiledAvroStringWriter
+from data_pipeline._compiled_avro_writer import UnsupportedSchemaError
+
+
+class TestCompiledAvroStringWriter(object):
+
+    @property
+    def record_schema(self):
+        return {
+            'type': 'record',
+            'name': 'business',
+            'namespace': 'yelp',
+            'fields': [
+                {'name': 'id', 'type': 'int'},
+                {'name': 'counter', 'type': 'long'},
+                {'name': 'name', 'type': 'string'},
+                {'name': 'nickname', 'type': ['null', 'string']},
+                {'name': 'is_open', 'type': 'boolean'},
+                {'name': 'rating', 'type': 'float'},
+                {'name': 'score', 'type': 'double'},
+                {'name': 'photo', 'type': 'bytes'},
+                {'name': 'nothing', 'type': 'null'},
+                {
+                    'name': 'checksum',
+                    'type': {'type': 'fixed', 'name': 'md5', 'size': 16}
+                },
+                {
+                    'name': 'category',
+                    'type': {
+                        'type': 'enum',
+                        'name': 'category',
+                        'symbols': ['food', 'shopping', 'nightlife']
+                    }
+                },
+                {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}},
+                {'name': 'hours', 'type': {'type': 'map', 'values': 'int'}},
+                {
+                    'name': 'owner',
+                    'type': [
+                        'null',
+                        {
+                            'type': 'record',
+                            'name': 'owner',
+                            'fields': [
+                                {'name': 'name', 'type': 'string'},
+                                {'name': 'ids', 'type': {
+                                    'type': 'array',
+                                    'items': ['int', 'string']
+                                }}
+                            ]
+                        }
+                    ]
+                },
+                {'name': 'previous_owner', 'type': ['null', 'owner']}
+            ]
+        }
+
+    def _create_random_int(self, rng, bits):
+        return rng.choice([
+            0,
+            -1,
+            63,
+            -64,
+            64,
+            -(1 << (bits - 1)),
+            (1 << (bits - 1)) - 1,
+            rng.randint(-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+        ])
+
+    def _create_random_bytes(self, rng, size=None):
+        if size is None:
+            size = rng.choice([0, 1, 127, 128, rng.randint(0, 1000)])
+        return bytes(bytearray(rng.randint(0, 255) for _ in range(size)))
+
+    def _create_random_string(self, rng):
+        return ''.join(
+            rng.choice('abc\xe9中') for _ in range(rng.randint(0, 20))
+        )
+
+    def _create_random_owner(self, rng):
+        return rng.choice([
+            None,
+            {
+                'name': self._create_random_string(rng),
+                'ids': [
+                    rng.choice([
+                        self._create_random_int(rng, 32),
+                        self._create_random_string(rng)
+                    ])
+                    for _ in range(rng.randint(0, 3))
+                ]
+            }
+        ])
+
+    def _create_random_datum(self, rng):
+        return {
+            'id': self._create_random_int(rng, 32),
+            'counter': self._create_random_int(rng, 64),
+            'name': self._create_random_string(rng),
+            'nickname': rng.choice([None, self._create_random_string(rng)]),
+            'is_open': rng.choice([True, False]),
+            'rating': rng.choice([0, 1.5, -2.25, rng.random()]),
+            'score': rng.choice([0, 1 << 70, -1e300, rng.random()]),
+            'photo': self._create_random_bytes(rng),
+            'nothing': None,
+            'checksum': self._create_random_bytes(rng, size=16),
+            'category': rng.choice(['food', 'shopping', 'nightlife']),
+            'tags': [
+                self._create_random_string(rng) for _ in range(rng.randint(0, 3))
+            ],
+            'hours': {
+                self._create_random_string(rng): self._create_random_int(rng, 32)
+                for _ in range(rng.randint(0, 3))
+            },
+            'owner': self._create_random_owner(rng),
+            'previous_owner': self._create_random_owner(rng)
+        }
+
+    @pytest.mark.parametrize('seed', range(50))
+    def test_same_encoding_as_avro(self, seed):
+        datum = self._create_random_datum(random.Random(seed))
+        expected = AvroStringWriter(self.record_schema).encode(datum)
+        encode = compile_encoder(avro.schema.make_avsc_object(self.record_schema))
+        assert encode(datum) == expected
+        assert CompiledAvroStringWriter(self.record_schema).encode(datum) == expected
+
+    @pytest.mark.parametrize('schema, datum', [
+        # The generic writer picks the last branch that matches the datum.
+        (['int', 'long'], 5),
+        (['long', 'int'], 5),
+        (['float', 'double'], 1.5),
+        (['string', 'bytes'], str('abc')),
+        (['bytes', 'string'], str('abc')),
+        (['int', 'boolean'], True),
+        (['boolean', 'int'], True),
+        (['null', 'int', 'long'], 1 << 40),
+        ({'type': 'map', 'values': 'long'}, {str('a'): 1, 'b': 2}),
+        ({'type': 'array', 'items': 'double'}, [1, 2.5, 1 << 40])
+    ])
+    def test_same_encoding_as_avro_for_ambiguous_data(self, schema, datum):
+        encode = compile_encoder(avro.schema.make_avsc_object(schema))
+        assert encode(datum) == AvroStringWriter(schema).encode(datum)
+
+    @pytest.mark.parametrize('field, value', [
+        ('id', 1 << 31),
+        ('id', 1.5),
+        ('counter', 1 << 63),
+        ('name', None),
+        ('nickname', 1),
+        ('is_open', 1),
+        ('rating', '1'),
+        ('rating', 1e300),
+        ('photo', 'unicode photo'),
+        ('checksum', str('too short')),
+        ('category', 'unknown'),
+        ('category', ['food']),
+        ('tags', ('a',)),
+        ('tags', [b'\xe9']),
+        ('hours', {1: 1}),
+        ('owner', {'name': 'owner', 'ids': [1.5]})
+    ])
+    def test_invalid_datum_fails_like_avro(self, field, value):
+        datum = self._create_random_datum(random.Random(0))
+        datum[field] = value
+        with pytest.raises(Exception) as generic_error:
+            AvroStringWriter(self.record_schema).encode(datum)
+        with pytest.raises(generic_error.type):
+            CompiledAvroStringWriter(self.record_schema).encode(datum)
+
+    def test_datum_of_wrong_type_fails_like_avro(self):
+        with pytest.raises(avro.io.AvroTypeException):
+            CompiledAvroStringWriter(self.record_schema).encode([])
+
+    @pytest.mark.parametrize('schema', [
+        {'type': 'bytes', 'logicalType': 'decimal', 'precision': 4, 'scale': 2},
+        {
+            'type': 'record',
+            'name': 'linked_list',
+            'fields': [
+                {'name': 'value', 'type': 'int'},
+                {'name': 'next', 'type': ['null', 'linked_list']}
+            ]
+        }
+    ])
+    def test_unsupported_schema(self, schema):
+        with pytest.raises(UnsupportedSchemaError):
+            compile_encoder(avro.schema.make_avsc_object(schema))
+        writer = CompiledAvroStringWriter(schema)
+        assert writer._compiled_encode is None
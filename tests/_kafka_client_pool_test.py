@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from data_pipeline._kafka_client_pool import get_kafka_client
+from data_pipeline._kafka_client_pool import SharedKafkaClient
+from tests.helpers.config import reconfigure
+
+
+class TestGetKafkaClient(object):
+
+    @pytest.yield_fixture(autouse=True)
+    def share_kafka_clients(self):
+        with reconfigure(share_kafka_clients=True):
+            yield
+
+    @pytest.yield_fixture
+    def mock_kafka_client_class(self):
+        with mock.patch(
+            'data_pipeline._kafka_client_pool.KafkaClient'
+        ) as mock_kafka_client_class:
+            mock_kafka_client_class.side_effect = lambda broker_list: mock.Mock()
+            yield mock_kafka_client_class
+
+    def test_same_client_for_same_brokers(self, mock_kafka_client_class):
+        client = get_kafka_client(['broker_1', 'broker_2'])
+        other_client = get_kafka_client(['broker_2', 'broker_1'])
+        try:
+            assert isinstance(client, SharedKafkaClient)
+            assert mock_kafka_client_class.call_count == 1
+            client.load_metadata_for_topics('topic')
+            kafka_client = other_client._pooled_client.kafka_client
+            kafka_client.load_metadata_for_topics.assert_called_once_with('topic')
+        finally:
+            client.close()
+            other_client.close()
+
+    def test_different_clients_for_different_brokers(self, mock_kafka_client_class):
+        client = get_kafka_client(['broker_1'])
+        other_client = get_kafka_client(['broker_2'])
+        try:
+            assert mock_kafka_client_class.call_count == 2
+            assert client.topics_to_brokers is not other_client.topics_to_brokers
+        finally:
+            client.close()
+            other_client.close()
+
+    def test_client_closed_with_last_reference(self, mock_kafka_client_class):
+        client = get_kafka_client(['broker_1'])
+        other_client = get_kafka_client(['broker_1'])
+        kafka_client = client._pooled_client.kafka_client
+
+        client.close()
+        client.close()
+        assert not kafka_client.close.called
+
+        other_client.close()
+        kafka_client.close.assert_called_once_with()
+
+    def test_new_client_after_close(self, mock_kafka_client_class):
+        get_kafka_client(['broker_1']).close()
+        client = get_kafka_client(['broker_1'])
+        client.close()
+        assert mock_kafka_client_class.call_count == 2
+
+    def test_sharing_disabled(self, mock_kafka_client_class):
+        with reconfigure(share_kafka_clients=False):
+            client = get_kafka_client(['broker_1'])
+            other_client = get_kafka_client(['broker_1'])
+        assert not isinstance(client, SharedKafkaClient)
+        assert client is not other_client
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import mock
+import pytest
+from kafka.common import ProduceResponse
+
+from data_pipeline._kafka_producer import KafkaProducer
+from data_pipeline._producer_memory_budget import get_producer_memory_budget
+from data_pipeline._retry_util import ExpBackoffPolicy
+from data_pipeline._retry_util import MaxRetryError
+from data_pipeline._retry_util import RetryPolicy
+from data_pipeline.message import CreateMessage
+from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
+from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
+from tests.helpers.config import reconfigure
+
+
+class TestKafkaProducer(object):
+
+    @property
+    def topic(self):
+        return str('my-topic')
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_schematizer(self):
+        mock_date = '2015-01-01'
+        mock_topic = Topic(
+            1, self.topic, None, False, 'datapipe', [], mock_date, mock_date
+        )
+        mock_schema = AvroSchema(
+            1, 'schema', mock_topic, None, 'RW', None, None, mock_date, mock_date
+        )
+        mock_schematizer_client = mock.Mock(spec=SchematizerClient)
+        mock_schematizer_client.get_schema_by_id.return_value = mock_schema
+        reset_schematizer()
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.SchematizerClient',
+            return_value=mock_schematizer_client
+        ):
+            yield
+        reset_schematizer()
+
+    @pytest.yield_fixture
+    def kafka_client(self):
+        # Not sharing clients keeps the mocked client out of the pool.
+        with reconfigure(share_kafka_clients=False), mock.patch(
+            'data_pipeline._kafka_client_pool.KafkaClient'
+        ) as mock_kafka_client_class:
+            kafka_client = mock_kafka_client_class.return_value
+            kafka_client.get_partition_ids_for_topic.return_value = [0]
+            yield kafka_client
+
+    @pytest.fixture
+    def producer(self, kafka_client):
+        producer = KafkaProducer(mock.Mock())
+        producer._publish_retry_policy = RetryPolicy(
+            ExpBackoffPolicy(initial_delay_secs=0.01, max_delay_secs=0.01),
+            max_retry_count=1
+        )
+        return producer
+
+    def test_memory_released_when_close_fails(self, producer, kafka_client):
+        kafka_client.send_produce_request.side_effect = Exception
+        kafka_client.send_offset_request.side_effect = Exception
+        memory_budget = get_producer_memory_budget()
+        reserved_bytes = memory_budget.reserved_bytes
+        producer.publish(CreateMessage(schema_id=1, payload=bytes(10)))
+        assert memory_budget.reserved_bytes > reserved_bytes
+        with pytest.raises(MaxRetryError):
+            producer.close()
+        assert memory_budget.reserved_bytes == reserved_bytes
+
+    def test_split_requests_by_max_request_bytes(self, producer, kafka_client):
+        kafka_client.send_produce_request.side_effect = lambda payloads, **kwargs: [
+            ProduceResponse(request.topic, request.partition, 0, 0)
+            for request in payloads
+        ]
+        # The buffer is only split when it's flushed.
+        with reconfigure(
+            kafka_producer_max_request_bytes=1
+        ), producer.disable_automatic_flushing():
+            for _ in range(3):
+                producer.publish(CreateMessage(schema_id=1, payload=bytes(10)))
+            producer.flush_buffered_messages()
+
+        assert [
+            [request.message_count for request in call[1]['payloads']]
+            for call in kafka_client.send_produce_request.call_args_list
+        ] == [[1], [1], [1]]
+        assert producer.message_buffer_size == 0
+        assert producer.position_data_tracker.unpublished_messages == 0
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import mock
+import pytest
+from kafka.common import FailedPayloadsError
+from kafka.common import LeaderNotAvailableError
+from kafka.common import OffsetResponse
+from kafka.common import TopicAndPartition
+
+from data_pipeline._kafka_util import get_high_watermarks
+from data_pipeline._kafka_util import get_topic_partitions
+
+
+class TestGetTopicPartitions(object):
+
+    @pytest.fixture
+    def kafka_client(self):
+        kafka_client = mock.Mock()
+        kafka_client.has_metadata_for_topic.return_value = False
+        return kafka_client
+
+    def test_get_topic_partitions(self, kafka_client):
+        kafka_client.get_partition_ids_for_topic.return_value = [0, 1]
+        assert get_topic_partitions(kafka_client, 'topic_a') == [0, 1]
+        kafka_client.load_metadata_for_topics.assert_called_once_with('topic_a')
+
+    def test_metadata_error(self, kafka_client):
+        kafka_client.load_metadata_for_topics.side_effect = (
+            LeaderNotAvailableError()
+        )
+        assert get_topic_partitions(kafka_client, 'topic_a') == []
+
+
+class TestGetHighWatermarks(object):
+
+    @pytest.fixture
+    def kafka_client(self):
+        kafka_client = mock.Mock()
+        kafka_client.topics_to_brokers = {
+            TopicAndPartition(str('topic_a'), 0): mock.sentinel.broker_1,
+            TopicAndPartition(str('topic_a'), 1): None,
+            TopicAndPartition(str('topic_b'), 0): mock.sentinel.broker_2,
+            TopicAndPartition(str('topic_c'), 0): mock.sentinel.broker_2,
+        }
+        return kafka_client
+
+    def _send_offset_request(self, payloads, fail_on_error):
+        responses = {
+            (str('topic_a'), 0): OffsetResponse(str('topic_a'), 0, 0, (10,)),
+            (str('topic_b'), 0): FailedPayloadsError(payloads[1]),
+            (str('topic_c'), 0): OffsetResponse(str('topic_c'), 0, 6, (-1,)),
+        }
+        return [
+            responses[(payload.topic, payload.partition)] for payload in payloads
+        ]
+
+    def test_errors_are_isolated(self, kafka_client):
+        kafka_client.send_offset_request.side_effect = self._send_offset_request
+        high_watermarks = get_high_watermarks(kafka_client, [
+            ('topic_a', 0),
+            ('topic_b', 0),
+            ('topic_c', 0),
+            ('topic_a', 1),
+        ])
+
+        assert kafka_client.load_metadata_for_topics.call_count == 1
+        assert kafka_client.send_offset_request.call_count == 1
+        assert high_watermarks[('topic_a', 0)] == 10
+        assert isinstance(high_watermarks[('topic_a', 1)], LeaderNotAvailableError)
+        assert isinstance(high_watermarks[('topic_b', 0)], FailedPayloadsError)
+        assert isinstance(high_watermarks[('topic_c', 0)], Exception)
+
+    def test_topic_metadata_errors_are_isolated(self, kafka_client):
+        def load_metadata_for_topics(*topics):
+            if 'topic_b' in topics:
+                raise LeaderNotAvailableError()
+
+        kafka_client.load_metadata_for_topics.side_effect = load_metadata_for_topics
+        kafka_client.send_offset_request.return_value = [
+            OffsetResponse(str('topic_a'), 0, 0, (10,))
+        ]
+        high_watermarks = get_high_watermarks(
+            kafka_client,
+            [('topic_a', 0), ('topic_b', 0)]
+        )
+
+        assert high_watermarks[('topic_a', 0)] == 10
+        assert isinstance(high_watermarks[('topic_b', 0)], LeaderNotAvailableError)
+
+    def test_send_error(self, kafka_client):
+        kafka_client.send_offset_request.side_effect = Exception
+        high_watermarks = get_high_watermarks(kafka_client, [('topic_a', 0)])
+        assert isinstance(high_watermarks[('topic_a', 0)], Exception)
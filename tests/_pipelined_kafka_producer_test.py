@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import defaultdict
+
+import mock
+import pytest
+from kafka.codec import gzip_decode
+from kafka.common import ProduceResponse
+from kafka.protocol import KafkaProtocol
+
+from data_pipeline._pipelined_kafka_producer import PipelinedKafkaProducer
+from data_pipeline._producer_memory_budget import get_producer_memory_budget
+from data_pipeline._retry_util import ExpBackoffPolicy
+from data_pipeline._retry_util import MaxRetryError
+from data_pipeline._retry_util import RetryPolicy
+from data_pipeline.compression_codec import CompressionCodecEnum
+from data_pipeline.message import CreateMessage
+from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
+from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
+from tests.helpers.config import reconfigure
+
+
+class TestPipelinedKafkaProducer(object):
+
+    @property
+    def topic(self):
+        return str('my-topic')
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_schematizer(self):
+        mock_date = '2015-01-01'
+        mock_topic = Topic(
+            1, self.topic, None, False, 'datapipe', [], mock_date, mock_date
+        )
+        mock_schema = AvroSchema(
+            1, 'schema', mock_topic, None, 'RW', None, None, mock_date, mock_date
+        )
+        mock_schematizer_client = mock.Mock(spec=SchematizerClient)
+        mock_schematizer_client.get_schema_by_id.return_value = mock_schema
+        reset_schematizer()
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.SchematizerClient',
+            return_value=mock_schematizer_client
+        ):
+            yield
+        reset_schematizer()
+
+    @pytest.yield_fixture(autouse=True)
+    def small_buffer(self):
+        with reconfigure(
+            kafka_producer_buffer_size=2,
+            kafka_producer_flush_time_limit_seconds=10
+        ):
+            yield
+
+    @pytest.yield_fixture
+    def kafka_client(self):
+        # Not sharing clients keeps the mocked client out of the pool.
+        with reconfigure(share_kafka_clients=False), mock.patch(
+            'data_pipeline._kafka_client_pool.KafkaClient'
+        ) as mock_kafka_client_class:
+            kafka_client = mock_kafka_client_class.return_value
+            kafka_client.get_partition_ids_for_topic.return_value = [0]
+            kafka_client.send_produce_request.side_effect = self._send_produce_request
+            yield kafka_client
+
+    @pytest.fixture
+    def position_data_callback(self):
+        return mock.Mock()
+
+    @pytest.yield_fixture
+    def producer(self, kafka_client, position_data_callback):
+        producer = PipelinedKafkaProducer(position_data_callback)
+        producer._publish_retry_policy = RetryPolicy(
+            ExpBackoffPolicy(initial_delay_secs=0.01, max_delay_secs=0.01),
+            max_retry_count=2
+        )
+        yield producer
+        producer._is_closed = True
+        with producer._condition:
+            producer._condition.notify_all()
+        producer._sender.join()
+        producer._release_unpublished_memory()
+
+    def _send_produce_request(self, payloads, acks, fail_on_error):
+        offset = self._next_offset
+        self._next_offset += sum(request.message_count for request in payloads)
+        return [
+            ProduceResponse(request.topic, request.partition, 0, offset)
+            for request in payloads
+        ]
+
+    @pytest.fixture(autouse=True)
+    def reset_offset(self):
+        self._next_offset = 0
+
+    def _create_message(self, position):
+        return CreateMessage(
+            schema_id=1,
+            payload=bytes(10),
+            upstream_position_info={'position': position}
+        )
+
+    def _get_published_positions(self, position_data_callback):
+        # The first call is made when the producer is created.
+        return [
+            (
+                call[0][0].last_published_message_position_info,
+                call[0][0].topic_to_kafka_offset_map
+            )
+            for call in position_data_callback.call_args_list[1:]
+        ]
+
+    def test_publish_does_not_wait_for_sender(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        sending = threading.Event()
+        release = threading.Event()
+
+        def block_send(*args, **kwargs):
+            sending.set()
+            release.wait()
+            return self._send_produce_request(*args, **kwargs)
+
+        kafka_client.send_produce_request.side_effect = block_send
+        producer.publish(self._create_message(1))
+        producer.publish(self._create_message(2))
+        assert sending.wait(1)
+
+        # The next buffer is filled while the previous one is being sent.
+        producer.publish(self._create_message(3))
+        assert producer._in_flight_batch_count == 1
+        assert producer.message_buffer_size == 1
+        assert self._get_published_positions(position_data_callback) == []
+
+        release.set()
+        producer.publish(self._create_message(4))
+        producer.flush_buffered_messages()
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 2}, {self.topic: 2}),
+            ({'position': 4}, {self.topic: 4})
+        ]
+
+    def test_flush_publishes_partial_buffer(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        producer.publish(self._create_message(1))
+        producer.flush_buffered_messages()
+        assert kafka_client.send_produce_request.call_count == 1
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 1}, {self.topic: 1})
+        ]
+
+    def test_publish_to_multiple_partitions(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        with mock.patch.object(producer, '_load_partitions', return_value=[0, 1]):
+            producer.publish(self._create_message(1))
+            producer.publish(self._create_message(2))
+            producer.flush_buffered_messages()
+
+        requests = kafka_client.send_produce_request.call_args[1]['payloads']
+        assert sorted(request.partition for request in requests) == [0, 1]
+        position_data = position_data_callback.call_args[0][0]
+        assert position_data.topic_to_partition_offset_map == {
+            self.topic: {0: 1, 1: 1}
+        }
+
+    def test_partitions_are_looked_up_again_after_error(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        with mock.patch.object(
+            producer,
+            '_load_partitions',
+            side_effect=[[], [0, 1]]
+        ) as mock_load_partitions:
+            producer.publish(self._create_message(1))
+            producer.publish(self._create_message(2))
+            producer.publish(self._create_message(3))
+            producer.flush_buffered_messages()
+
+        assert mock_load_partitions.call_count == 2
+        partition_message_counts = defaultdict(int)
+        for call in kafka_client.send_produce_request.call_args_list:
+            for request in call[1]['payloads']:
+                partition_message_counts[request.partition] += (
+                    request.message_count
+                )
+        assert partition_message_counts == {0: 2, 1: 1}
+
+    def test_publish_compressed(self, kafka_client, position_data_callback):
+        producer = PipelinedKafkaProducer(
+            position_data_callback,
+            compression_codec=CompressionCodecEnum.gzip
+        )
+        messages = [self._create_message(1), self._create_message(2)]
+        for message in messages:
+            producer.publish(message)
+        producer.close()
+
+        request, = kafka_client.send_produce_request.call_args[1]['payloads']
+        assert request.message_count == 2
+        compressed_message, = request.messages
+        assert [
+            kafka_message.value
+            for _, kafka_message in KafkaProtocol._decode_message_set_iter(
+                gzip_decode(compressed_message.value)
+            )
+        ] == [producer.envelope.pack(message) for message in messages]
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 2}, {self.topic: 2})
+        ]
+
+    def test_hand_off_on_buffer_bytes(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        with reconfigure(kafka_producer_buffer_bytes=1):
+            producer.publish(self._create_message(1))
+            producer.flush_buffered_messages()
+        assert kafka_client.send_produce_request.call_count == 1
+        assert producer.message_buffer_bytes == 0
+
+    def test_split_requests_by_max_request_bytes(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        with reconfigure(kafka_producer_max_request_bytes=1):
+            producer.publish(self._create_message(1))
+            producer.publish(self._create_message(2))
+            producer.flush_buffered_messages()
+        assert [
+            len(call[1]['payloads'][0].messages)
+            for call in kafka_client.send_produce_request.call_args_list
+        ] == [1, 1]
+
+    def test_memory_released_once_published(self, producer):
+        memory_budget = get_producer_memory_budget()
+        reserved_bytes = memory_budget.reserved_bytes
+        producer.publish(self._create_message(1))
+        assert memory_budget.reserved_bytes > reserved_bytes
+        producer.flush_buffered_messages()
+        assert memory_budget.reserved_bytes == reserved_bytes
+
+    def test_publish_hands_off_buffer_for_memory(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        with reconfigure(
+            kafka_producer_memory_budget_bytes=1,
+            kafka_producer_memory_budget_timeout_seconds=5
+        ):
+            producer.publish(self._create_message(1))
+            producer.publish(self._create_message(2))
+            producer.flush_buffered_messages()
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 1}, {self.topic: 1}),
+            ({'position': 2}, {self.topic: 2})
+        ]
+
+    def test_flush_on_time_limit(self, kafka_client, position_data_callback):
+        with reconfigure(kafka_producer_flush_time_limit_seconds=0.01):
+            producer = PipelinedKafkaProducer(position_data_callback)
+            producer.publish(self._create_message(1))
+            deadline = time.time() + 5
+            while (
+                position_data_callback.call_count < 2 and
+                time.time() < deadline
+            ):
+                time.sleep(0.01)
+            producer.close()
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 1}, {self.topic: 1})
+        ]
+
+    def test_failed_batch_raises_from_flush(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        kafka_client.send_produce_request.side_effect = Exception
+        kafka_client.load_metadata_for_topics.side_effect = Exception
+        producer.publish(self._create_message(1))
+        with pytest.raises(MaxRetryError):
+            producer.flush_buffered_messages()
+        with pytest.raises(MaxRetryError):
+            producer.publish(self._create_message(2))
+        assert self._get_published_positions(position_data_callback) == []
+
+    def test_close(self, kafka_client, position_data_callback):
+        producer = PipelinedKafkaProducer(position_data_callback)
+        producer.publish(self._create_message(1))
+        producer.close()
+        assert not producer._sender.is_alive()
+        # Both the producer and the metadata clients are closed.
+        assert kafka_client.close.call_count == 2
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 1}, {self.topic: 1})
+        ]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import mock
+import pytest
+from kafka.common import ProduceResponse
+
+from data_pipeline._pooled_kafka_producer import PooledKafkaProducer
+from data_pipeline._pooled_kafka_producer import StageStats
+from data_pipeline.message import CreateMessage
+from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
+from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
+from tests.helpers.config import reconfigure
+
+
+class TestPooledKafkaProducer(object):
+
+    @property
+    def topic(self):
+        return str('my-topic')
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_schematizer(self):
+        mock_date = '2015-01-01'
+        mock_topic = Topic(
+            1, self.topic, None, False, 'datapipe', [], mock_date, mock_date
+        )
+        mock_schema = AvroSchema(
+            1, 'schema', mock_topic, None, 'RW', None, None, mock_date, mock_date
+        )
+        mock_schematizer_client = mock.Mock(spec=SchematizerClient)
+        mock_schematizer_client.get_schema_by_id.return_value = mock_schema
+        reset_schematizer()
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.SchematizerClient',
+            return_value=mock_schematizer_client
+        ):
+            yield
+        reset_schematizer()
+
+    @pytest.yield_fixture(autouse=True)
+    def small_buffer(self):
+        with reconfigure(
+            kafka_producer_buffer_size=4,
+            kafka_producer_flush_time_limit_seconds=10,
+            kafka_producer_prepare_worker_count=2,
+            kafka_producer_prepare_chunk_size=2,
+            kafka_producer_max_pending_prepare_chunks=1
+        ):
+            yield
+
+    @pytest.yield_fixture
+    def kafka_client(self):
+        # Not sharing clients keeps the mocked client out of the pool.
+        with reconfigure(share_kafka_clients=False), mock.patch(
+            'data_pipeline._kafka_client_pool.KafkaClient'
+        ) as mock_kafka_client_class:
+            kafka_client = mock_kafka_client_class.return_value
+            kafka_client.get_partition_ids_for_topic.return_value = [0]
+            kafka_client.send_produce_request.side_effect = self._send_produce_request
+            yield kafka_client
+
+    @pytest.fixture
+    def position_data_callback(self):
+        return mock.Mock()
+
+    @pytest.yield_fixture
+    def producer(self, kafka_client, position_data_callback):
+        producer = PooledKafkaProducer(position_data_callback)
+        yield producer
+        producer.close()
+
+    def _send_produce_request(self, payloads, acks, fail_on_error):
+        self.sent_messages.extend(
+            message for request in payloads for message in request.messages
+        )
+        offset = self._next_offset
+        self._next_offset += sum(request.message_count for request in payloads)
+        return [
+            ProduceResponse(request.topic, request.partition, 0, offset)
+            for request in payloads
+        ]
+
+    @pytest.fixture(autouse=True)
+    def reset_offset(self):
+        self._next_offset = 0
+        self.sent_messages = []
+
+    def _create_message(self, position):
+        return CreateMessage(
+            schema_id=1,
+            payload=bytes(position),
+            upstream_position_info={'position': position}
+        )
+
+    def _get_published_positions(self, position_data_callback):
+        # The first call is made when the producer is created.
+        return [
+            call[0][0].last_published_message_position_info
+            for call in position_data_callback.call_args_list[1:]
+        ]
+
+    def test_publish_in_order(self, producer, position_data_callback):
+        messages = [self._create_message(position) for position in range(1, 8)]
+        for message in messages:
+            producer.publish(message)
+        producer.flush_buffered_messages()
+
+        assert self._get_published_positions(position_data_callback) == [
+            {'position': 4},
+            {'position': 7}
+        ]
+        assert [
+            message.value for message in self.sent_messages
+        ] == [
+            producer.envelope.pack(message) for message in messages
+        ]
+
+    def test_get_stage_stats(self, producer):
+        assert producer.get_stage_stats() == StageStats(
+            prepare_queue_depth=0,
+            send_queue_depth=0,
+            prepared_message_count=0,
+            published_message_count=0
+        )
+        producer.publish(self._create_message(1))
+        assert producer.get_stage_stats().prepare_queue_depth == 1
+
+        producer.publish(self._create_message(2))
+        producer.publish(self._create_message(3))
+        producer.flush_buffered_messages()
+        assert producer.get_stage_stats() == StageStats(
+            prepare_queue_depth=0,
+            send_queue_depth=0,
+            prepared_message_count=3,
+            published_message_count=3
+        )
@@ -25,6 +25,7 @@ from data_pipeline._position_data_tracker import PositionDataTracker
 from data_pipeline.message import CreateMessage
 from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
 from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
 from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
 from tests.helpers.config import reconfigure
 
@@ -41,6 +42,7 @@ class BasePositionDataTrackerTest(object):
             1, 'schema', mock_topic, None, 'RW', None, None, mock_date, mock_date
         )
         mock_schematizer_client = mock.Mock(spec=SchematizerClient)
+        reset_schematizer()
         with mock.patch(
             'data_pipeline.schematizer_clientlib.schematizer.SchematizerClient',
             return_value=mock_schematizer_client
@@ -54,6 +56,7 @@ class BasePositionDataTrackerTest(object):
             return_value=[]
         ):
             yield
+        reset_schematizer()
 
     @property
     def valid_message_data(self):
@@ -83,6 +86,37 @@ class BasePositionDataTrackerTest(object):
         }
         assert position_data == expected_position_data
 
+    def test_topic_to_partition_offset_map(self, tracker):
+        other_topic = str('other-topic')
+        tracker.update_high_watermark(self.topic, 10, 2)
+        tracker.update_high_watermark(self.topic, 5, 3, partition=1)
+        tracker.update_high_watermark(other_topic, 7, 1, partition=2)
+        position_data = tracker.get_position_data()
+        assert position_data.topic_to_partition_offset_map == {
+            self.topic: {0: 12, 1: 8},
+            other_topic: {2: 8}
+        }
+        assert position_data.topic_to_kafka_offset_map == {self.topic: 12}
+
+    def test_reset_to_position_data(self, tracker):
+        self._publish_messages(tracker, [
+            self._create_message_with_offsets({0: 10})
+        ])
+        tracker.update_high_watermark(self.topic, 10, 2, partition=1)
+        position_data = tracker.get_position_data()
+
+        tracker.record_message_buffered(self._create_message_with_offsets({0: 18}))
+        tracker.update_high_watermark(self.topic, 12, 3, partition=1)
+        tracker.reset_to_position_data(position_data)
+
+        assert tracker.get_position_data() == position_data
+        self._publish_messages(tracker, [
+            self._create_message_with_offsets({1: 14})
+        ])
+        assert tracker.get_position_data().merged_upstream_position_info_map == {
+            self.topic: {0: 10, 1: 14}
+        }
+
     def _publish_messages(self, tracker, messages):
         messages_published = defaultdict(int)
         for message in messages:
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+
+import pytest
+
+from data_pipeline._producer_memory_budget import MemoryBudgetExceededError
+from data_pipeline._producer_memory_budget import ProducerMemoryBudget
+from tests.helpers.config import reconfigure
+
+
+class TestProducerMemoryBudget(object):
+
+    @pytest.fixture
+    def memory_budget(self):
+        return ProducerMemoryBudget()
+
+    @pytest.yield_fixture(autouse=True)
+    def budget_bytes(self):
+        with reconfigure(kafka_producer_memory_budget_bytes=100):
+            yield
+
+    def test_try_reserve(self, memory_budget):
+        assert memory_budget.try_reserve(60)
+        assert not memory_budget.try_reserve(60)
+        assert memory_budget.try_reserve(40)
+        assert memory_budget.reserved_bytes == 100
+
+    def test_first_reservation_always_fits(self, memory_budget):
+        assert memory_budget.try_reserve(150)
+        assert not memory_budget.try_reserve(1)
+
+    def test_no_limit(self, memory_budget):
+        with reconfigure(kafka_producer_memory_budget_bytes=0):
+            assert memory_budget.try_reserve(150)
+            assert memory_budget.try_reserve(150)
+
+    def test_reserve_fails_fast(self, memory_budget):
+        memory_budget.try_reserve(100)
+        with pytest.raises(MemoryBudgetExceededError):
+            memory_budget.reserve(1, timeout=0)
+        assert memory_budget.reserved_bytes == 100
+
+    def test_reserve_waits_for_release(self, memory_budget):
+        memory_budget.try_reserve(100)
+        timer = threading.Timer(0.01, memory_budget.release, args=(60,))
+        timer.start()
+        memory_budget.reserve(50, timeout=5)
+        timer.join()
+        assert memory_budget.reserved_bytes == 90
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+
+import pytest
+from kafka import create_message
+
+from data_pipeline._producer_retry import _TopicPartition
+from data_pipeline._producer_spool import ProducerSpool
+from data_pipeline._producer_spool import SpoolLockedError
+from tests.helpers.config import reconfigure
+
+
+class TestProducerSpool(object):
+
+    @pytest.fixture
+    def spool_dir(self, tmpdir):
+        return str(tmpdir.join('spool'))
+
+    @pytest.yield_fixture
+    def spool(self, spool_dir):
+        spool = ProducerSpool(spool_dir)
+        yield spool
+        spool.close()
+
+    def _create_message_buffer(self, *values):
+        return {
+            _TopicPartition(str('topic'), 0): [
+                create_message(value) for value in values
+            ],
+            _TopicPartition(str('keyed_topic'), 1): [
+                create_message(value, key=str('key')) for value in values
+            ]
+        }
+
+    def _reopen(self, spool):
+        spool.close()
+        return ProducerSpool(spool.spool_dir)
+
+    def test_read_appended_record(self, spool):
+        message_buffer = self._create_message_buffer(str('a'), str('b'))
+        record = spool.append(message_buffer)
+        assert record.message_count == 4
+        assert spool.pending_bytes == record.byte_count
+        assert spool.read(record) == message_buffer
+
+    def test_commit(self, spool):
+        record = spool.append(self._create_message_buffer(str('a')))
+        spool.commit(record)
+        assert spool.pending_bytes == 0
+
+    def test_recover_uncommitted_records(self, spool):
+        first_record = spool.append(self._create_message_buffer(str('a')))
+        second_record = spool.append(self._create_message_buffer(str('b')))
+        third_record = spool.append(self._create_message_buffer(str('c')))
+        spool.commit(first_record)
+
+        spool = self._reopen(spool)
+        try:
+            assert spool.get_recovered_records() == [second_record, third_record]
+            assert spool.pending_bytes == (
+                second_record.byte_count + third_record.byte_count
+            )
+            assert spool.read(third_record) == self._create_message_buffer(
+                str('c')
+            )
+        finally:
+            spool.close()
+
+    def test_drop_incomplete_record(self, spool):
+        record = spool.append(self._create_message_buffer(str('a')))
+        spool.append(self._create_message_buffer(str('b')))
+        segment_path = spool._get_segment_path(record.segment_id)
+        spool.close()
+        with open(segment_path, 'r+b') as segment:
+            segment.truncate(os.path.getsize(segment_path) - 1)
+
+        spool = ProducerSpool(spool.spool_dir)
+        try:
+            assert spool.get_recovered_records() == [record]
+            assert os.path.getsize(segment_path) == record.byte_count
+        finally:
+            spool.close()
+
+    def test_segments_deleted_once_committed(self, spool):
+        with reconfigure(kafka_producer_spool_segment_bytes=1):
+            records = [
+                spool.append(self._create_message_buffer(str(value)))
+                for value in range(3)
+            ]
+        assert len(set(record.segment_id for record in records)) == 3
+        spool.commit(records[1])
+        assert not os.path.exists(spool._get_segment_path(records[0].segment_id))
+        assert os.path.exists(spool._get_segment_path(records[1].segment_id))
+
+        spool = self._reopen(spool)
+        try:
+            assert spool.get_recovered_records() == [records[2]]
+        finally:
+            spool.close()
+
+    def test_spool_dir_used_once(self, spool, spool_dir):
+        with pytest.raises(SpoolLockedError):
+            ProducerSpool(spool_dir)
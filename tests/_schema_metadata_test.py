@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import cPickle
+
+import mock
+import pytest
+from data_pipeline_avro_util.avro_string_reader import AvroStringReader
+
+from data_pipeline import _schema_metadata
+from data_pipeline._schema_metadata import _SchemaMetadata
+from data_pipeline._schema_metadata import _SchemaMetadataStore
+from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
+from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
+
+
+class TestSchemaMetadata(object):
+
+    @pytest.fixture
+    def avro_schema(self):
+        mock_date = '2015-01-01'
+        topic = Topic(
+            1, 'pii_topic', None, True, 'datapipe', [], mock_date, mock_date
+        )
+        schema_json = {
+            'type': 'record',
+            'name': 'foo',
+            'namespace': 'bar',
+            'fields': [
+                {'type': 'int', 'name': 'id', 'pkey': 2},
+                {'type': 'string', 'name': 'name'},
+                {'type': 'string', 'name': 'code', 'pkey': 1}
+            ]
+        }
+        return AvroSchema(
+            10, schema_json, topic, None, 'RW', ['code', 'id'], None,
+            mock_date, mock_date
+        )
+
+    @pytest.fixture
+    def metadata(self, avro_schema):
+        return _SchemaMetadata.from_avro_schema(avro_schema)
+
+    def test_from_avro_schema(self, metadata):
+        assert metadata.schema_id == 10
+        assert metadata.topic_name == str('pii_topic')
+        assert isinstance(metadata.topic_name, str)
+        assert metadata.contains_pii is True
+        assert metadata.should_be_encrypted is True
+        assert metadata.primary_keys == ('code', 'id')
+        assert [f['name'] for f in metadata.key_fields] == ['code', 'id']
+
+    def test_schema_without_primary_keys(self, avro_schema):
+        metadata = _SchemaMetadata.from_avro_schema(
+            avro_schema._replace(primary_keys=[])
+        )
+        assert metadata.primary_keys == ()
+        assert metadata.key_fields == ()
+
+    def test_keys_writer(self, metadata):
+        keys = {'code': 'abc', 'id': 1}
+        encoded_keys = metadata.keys_writer.encode(
+            message_avro_representation=keys
+        )
+        reader = AvroStringReader(
+            reader_schema=metadata.keys_avro_json,
+            writer_schema=metadata.keys_avro_json
+        )
+        assert reader.decode(encoded_message=encoded_keys) == keys
+        assert metadata.keys_writer is metadata.keys_writer
+
+    def test_pickle(self, metadata):
+        metadata.keys_writer
+        unpickled = cPickle.loads(
+            cPickle.dumps(metadata, cPickle.HIGHEST_PROTOCOL)
+        )
+        assert unpickled.topic_name == metadata.topic_name
+        assert unpickled.primary_keys == metadata.primary_keys
+        assert unpickled.keys_avro_json == metadata.keys_avro_json
+        assert unpickled.keys_writer is not None
+
+
+class TestSchemaMetadataStore(object):
+
+    @pytest.fixture
+    def avro_schema(self):
+        mock_date = '2015-01-01'
+        topic = Topic(
+            1, 'my_topic', None, False, 'datapipe', [], mock_date, mock_date
+        )
+        return AvroSchema(
+            10, 'schema', topic, None, 'RW', None, None, mock_date, mock_date
+        )
+
+    def _patch_schematizer(self, avro_schema):
+        client = mock.Mock(spec=SchematizerClient)
+        client.get_schema_by_id.return_value = avro_schema
+        return client, mock.patch(
+            'data_pipeline._schema_metadata.get_schematizer',
+            return_value=client
+        )
+
+    def test_metadata_resolved_once(self, avro_schema):
+        client, patch = self._patch_schematizer(avro_schema)
+        with patch:
+            store = _SchemaMetadataStore()
+            metadata = store.get_metadata(10)
+            assert store.get_metadata(10) is metadata
+        assert metadata.topic_name == str('my_topic')
+        assert client.get_schema_by_id.call_count == 1
+
+    def test_metadata_resolved_again_with_refreshed_schema(self, avro_schema):
+        client, patch = self._patch_schematizer(avro_schema)
+        with patch, mock.patch.object(
+            _schema_metadata.time,
+            'time',
+            return_value=0
+        ) as mock_time:
+            store = _SchemaMetadataStore()
+            metadata = store.get_metadata(10)
+            assert metadata.contains_pii is False
+            client.get_schema_by_id.return_value = avro_schema._replace(
+                topic=avro_schema.topic._replace(contains_pii=True)
+            )
+            # The schema isn't looked up again until its topic may be stale.
+            assert store.get_metadata(10) is metadata
+            mock_time.return_value = 600
+            metadata = store.get_metadata(10)
+            assert metadata.contains_pii is True
+            assert store.get_metadata(10) is metadata
+        assert client.get_schema_by_id.call_count == 2
+
+    def test_unchanged_metadata_reused(self, avro_schema):
+        client, patch = self._patch_schematizer(avro_schema)
+        with patch, mock.patch.object(
+            _schema_metadata.time,
+            'time',
+            return_value=0
+        ) as mock_time:
+            store = _SchemaMetadataStore()
+            metadata = store.get_metadata(10)
+            mock_time.return_value = 600
+            assert store.get_metadata(10) is metadata
+            assert store.get_metadata(10) is metadata
+        assert client.get_schema_by_id.call_count == 2
+
+    def test_bounded_metadata(self, avro_schema):
+        _, patch = self._patch_schematizer(avro_schema)
+        with patch, mock.patch(
+            'data_pipeline._schema_metadata.get_config'
+        ) as mock_get_config:
+            mock_get_config.return_value.schematizer_cache_max_entries = {
+                'schema': 2
+            }
+            mock_get_config.return_value.schematizer_cache_ttl_seconds = {
+                'schema': None,
+                'topic': 600
+            }
+            store = _SchemaMetadataStore()
+            for schema_id in range(3):
+                store.get_metadata(schema_id)
+            assert list(store._metadata_cache.keys()) == [1, 2]
+
+    def test_metadata_dropped_with_schematizer(self, avro_schema):
+        _, patch = self._patch_schematizer(avro_schema)
+        with patch:
+            _SchemaMetadataStore().get_metadata(10)
+        other_client, other_patch = self._patch_schematizer(
+            avro_schema._replace(topic=avro_schema.topic._replace(name='new'))
+        )
+        with other_patch:
+            metadata = _SchemaMetadataStore().get_metadata(10)
+        assert metadata.topic_name == str('new')
+        other_client.get_schema_by_id.assert_called_once_with(10)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+
+import mock
+import pytest
+from kafka.common import OffsetResponse
+from kafka.common import ProduceResponse
+
+from data_pipeline._producer_memory_budget import get_producer_memory_budget
+from data_pipeline._retry_util import ExpBackoffPolicy
+from data_pipeline._retry_util import RetryPolicy
+from data_pipeline._spooling_kafka_producer import SpoolingKafkaProducer
+from data_pipeline.message import CreateMessage
+from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
+from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
+from tests.helpers.config import reconfigure
+
+
+class TestSpoolingKafkaProducer(object):
+
+    @property
+    def topic(self):
+        return str('my-topic')
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_schematizer(self):
+        mock_date = '2015-01-01'
+        mock_topic = Topic(
+            1, self.topic, None, False, 'datapipe', [], mock_date, mock_date
+        )
+        mock_schema = AvroSchema(
+            1, 'schema', mock_topic, None, 'RW', None, None, mock_date, mock_date
+        )
+        mock_schematizer_client = mock.Mock(spec=SchematizerClient)
+        mock_schematizer_client.get_schema_by_id.return_value = mock_schema
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.SchematizerClient',
+            return_value=mock_schematizer_client
+        ):
+            yield
+        reset_schematizer()
+
+    @pytest.yield_fixture(autouse=True)
+    def small_buffer(self):
+        with reconfigure(
+            kafka_producer_buffer_size=2,
+            kafka_producer_flush_time_limit_seconds=10,
+            kafka_producer_spool_retry_interval_seconds=0.01
+        ):
+            yield
+
+    @pytest.yield_fixture
+    def kafka_client(self):
+        # Not sharing clients keeps the mocked client out of the pool.
+        with reconfigure(share_kafka_clients=False), mock.patch(
+            'data_pipeline._kafka_client_pool.KafkaClient'
+        ) as mock_kafka_client_class:
+            kafka_client = mock_kafka_client_class.return_value
+            kafka_client.get_partition_ids_for_topic.return_value = [0]
+            kafka_client.send_produce_request.side_effect = self._send_produce_request
+            kafka_client.send_offset_request.side_effect = self._send_offset_request
+            yield kafka_client
+
+    @pytest.fixture
+    def position_data_callback(self):
+        return mock.Mock()
+
+    @pytest.fixture
+    def spool_dir(self, tmpdir):
+        return str(tmpdir.join('spool'))
+
+    @pytest.yield_fixture
+    def producer(self, kafka_client, position_data_callback, spool_dir):
+        producer = self._create_producer(position_data_callback, spool_dir)
+        yield producer
+        self._end_outage(kafka_client)
+        producer.close()
+
+    def _create_producer(self, position_data_callback, spool_dir):
+        producer = SpoolingKafkaProducer(position_data_callback, spool_dir)
+        producer._publish_retry_policy = RetryPolicy(
+            ExpBackoffPolicy(initial_delay_secs=0.01, max_delay_secs=0.01),
+            max_retry_count=1
+        )
+        return producer
+
+    def _send_produce_request(self, payloads, acks, fail_on_error):
+        offset = self._next_offset
+        self._next_offset += sum(request.message_count for request in payloads)
+        self.published_values.extend(
+            message.value for request in payloads for message in request.messages
+        )
+        return [
+            ProduceResponse(request.topic, request.partition, 0, offset)
+            for request in payloads
+        ]
+
+    def _send_offset_request(self, payloads, fail_on_error):
+        # Failed produce requests are verified against the high watermarks
+        # when the outage ends while they're sent.
+        return [
+            OffsetResponse(request.topic, request.partition, 0, (self._next_offset,))
+            for request in payloads
+        ]
+
+    def _start_outage(self, kafka_client):
+        kafka_client.send_produce_request.side_effect = Exception
+        kafka_client.load_metadata_for_topics.side_effect = Exception
+
+    def _end_outage(self, kafka_client):
+        kafka_client.send_produce_request.side_effect = self._send_produce_request
+        kafka_client.load_metadata_for_topics.side_effect = None
+
+    @pytest.fixture(autouse=True)
+    def reset_offset(self):
+        self._next_offset = 0
+        self.published_values = []
+
+    def _create_message(self, position):
+        return CreateMessage(
+            schema_id=1,
+            payload=bytes(10),
+            upstream_position_info={'position': position}
+        )
+
+    def _get_published_positions(self, position_data_callback):
+        # The first call is made when the producer is created.
+        return [
+            (
+                call[0][0].last_published_message_position_info,
+                call[0][0].topic_to_kafka_offset_map
+            )
+            for call in position_data_callback.call_args_list[1:]
+        ]
+
+    def _publish(self, producer, positions):
+        messages = [self._create_message(position) for position in positions]
+        for message in messages:
+            producer.publish(message)
+        return [producer.envelope.pack(message) for message in messages]
+
+    def test_publish_while_kafka_unavailable(
+        self,
+        producer,
+        kafka_client,
+        position_data_callback
+    ):
+        self._start_outage(kafka_client)
+        values = self._publish(producer, range(1, 6))
+
+        assert producer.get_spool_stats().pending_batch_count == 2
+        assert self._get_published_positions(position_data_callback) == []
+
+        self._end_outage(kafka_client)
+        producer.flush_buffered_messages()
+        assert self.published_values == values
+        assert self._get_published_positions(position_data_callback) == [
+            ({'position': 2}, {self.topic: 2}),
+            ({'position': 4}, {self.topic: 4}),
+            ({'position': 5}, {self.topic: 5})
+        ]
+        stats = producer.get_spool_stats()
+        assert stats.pending_batch_count == 0
+        assert stats.pending_bytes == 0
+        assert stats.replayed_message_count == 5
+        assert stats.replayed_bytes > 0
+
+    def test_memory_released_once_spooled(self, producer, kafka_client):
+        memory_budget = get_producer_memory_budget()
+        reserved_bytes = memory_budget.reserved_bytes
+        self._start_outage(kafka_client)
+        self._publish(producer, [1, 2])
+        assert memory_budget.reserved_bytes == reserved_bytes
+
+    def test_lock_released_while_spooling(self, producer):
+        is_spooling = threading.Event()
+        release = threading.Event()
+        append = producer._spool.append
+
+        def append_slowly(message_buffer):
+            is_spooling.set()
+            release.wait(5)
+            return append(message_buffer)
+
+        with mock.patch.object(
+            producer._spool,
+            'append',
+            side_effect=append_slowly
+        ):
+            publisher = threading.Thread(
+                target=self._publish,
+                args=(producer, [1, 2])
+            )
+            publisher.start()
+            assert is_spooling.wait(5)
+            is_lock_free = producer._condition.acquire(False)
+            if is_lock_free:
+                producer._condition.release()
+            release.set()
+            publisher.join(5)
+        assert is_lock_free
+        producer.flush_buffered_messages()
+        assert len(self.published_values) == 2
+
+    def test_publish_blocks_when_spool_full(self, producer, kafka_client):
+        self._start_outage(kafka_client)
+        with reconfigure(kafka_producer_spool_max_bytes=1):
+            values = self._publish(producer, [1, 2])
+            publisher = threading.Thread(
+                target=self._publish,
+                args=(producer, [3, 4])
+            )
+            publisher.start()
+            publisher.join(0.1)
+            assert publisher.is_alive()
+            assert producer.get_spool_stats().pending_batch_count == 1
+
+            self._end_outage(kafka_client)
+            publisher.join(5)
+            assert not publisher.is_alive()
+            producer.flush_buffered_messages()
+        assert self.published_values[:2] == values
+        assert len(self.published_values) == 4
+
+    def test_close_leaves_batches_in_spool(
+        self,
+        kafka_client,
+        position_data_callback,
+        spool_dir
+    ):
+        producer = self._create_producer(position_data_callback, spool_dir)
+        self._start_outage(kafka_client)
+        values = self._publish(producer, [1, 2, 3])
+        producer.close()
+        assert self._get_published_positions(position_data_callback) == []
+
+        self._end_outage(kafka_client)
+        next_position_data_callback = mock.Mock()
+        producer = self._create_producer(next_position_data_callback, spool_dir)
+        values += self._publish(producer, [4])
+        producer.close()
+        assert self.published_values == values
+        # Batches recovered from the spool don't carry position info.
+        assert self._get_published_positions(next_position_data_callback) == [
+            ({'position': 4}, {self.topic: 4})
+        ]
+
+    def test_recover_after_crash(
+        self,
+        kafka_client,
+        position_data_callback,
+        spool_dir
+    ):
+        producer = self._create_producer(position_data_callback, spool_dir)
+        self._start_outage(kafka_client)
+        values = self._publish(producer, [1, 2])
+        # The producer stops without publishing nor closing the spool.
+        producer._is_closed = True
+        with producer._condition:
+            producer._condition.notify_all()
+        producer._sender.join()
+        producer._spool._lock_file.close()
+
+        self._end_outage(kafka_client)
+        producer = self._create_producer(position_data_callback, spool_dir)
+        producer.flush_buffered_messages()
+        assert self.published_values == values
+        assert producer.get_spool_stats().replayed_message_count == 2
+        # The recovered messages were never buffered by this producer.
+        position_tracker = producer.position_data_tracker
+        assert position_tracker.unpublished_messages == 0
+        assert position_tracker.topic_to_kafka_offset_map == {self.topic: 2}
+        producer.close()
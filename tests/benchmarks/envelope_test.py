@@ -45,3 +45,39 @@ class TestBenchEnvelope(object):
             return [envelope.pack(MessageFactory.create_message_with_payload_data())], {}
 
         benchmark.pedantic(envelope.unpack, setup=setup, rounds=1000)
+
+    def test_peek_timestamp(self, benchmark, envelope):
+
+        def setup():
+            packed_message = envelope.pack(
+                MessageFactory.create_message_with_payload_data()
+            )
+            return [packed_message, ['timestamp']], {}
+
+        benchmark.pedantic(envelope.peek, setup=setup, rounds=1000)
+
+    def test_generic_avro_pack(self, benchmark, envelope):
+
+        def setup():
+            message = MessageFactory.create_message_with_payload_data()
+            return [message.avro_repr], {}
+
+        benchmark.pedantic(
+            envelope._avro_string_writer.encode,
+            setup=setup,
+            rounds=1000
+        )
+
+    def test_generic_avro_unpack(self, benchmark, envelope):
+
+        def setup():
+            packed_message = envelope.pack(
+                MessageFactory.create_message_with_payload_data()
+            )
+            return [packed_message[1:]], {}
+
+        benchmark.pedantic(
+            envelope._avro_string_reader.decode,
+            setup=setup,
+            rounds=1000
+        )
@@ -17,6 +17,8 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import pytest
+from data_pipeline_avro_util.avro_string_reader import AvroStringReader
+from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
 
 from data_pipeline.helpers.yelp_avro_store import _AvroStringStore
 from data_pipeline.message import CreateMessage
@@ -58,6 +60,18 @@ class TestBenchMessage(object):
 
         benchmark.pedantic(encode_message, setup=setup, rounds=1000)
 
+    def test_encode_message_with_generic_writer(self, benchmark):
+
+        def setup():
+            schema_json = SchemaFactory.get_schema_json()
+            payload_data = SchemaFactory.get_payload_data()
+            return [AvroStringWriter(schema_json.schema_json), payload_data], {}
+
+        def encode_message(avro_string_writer, payload_data):
+            avro_string_writer.encode(message_avro_representation=payload_data)
+
+        benchmark.pedantic(encode_message, setup=setup, rounds=1000)
+
     def test_decode_message(self, benchmark):
 
         def setup():
@@ -78,3 +92,21 @@ class TestBenchMessage(object):
             )
 
         benchmark.pedantic(decode_message, setup=setup, rounds=1000)
+
+    def test_decode_message_with_generic_reader(self, benchmark):
+
+        def setup():
+            schema_json = SchemaFactory.get_schema_json().schema_json
+            payload = AvroStringWriter(schema_json).encode(
+                message_avro_representation=SchemaFactory.get_payload_data()
+            )
+            avro_string_reader = AvroStringReader(
+                reader_schema=schema_json,
+                writer_schema=schema_json
+            )
+            return [avro_string_reader, payload], {}
+
+        def decode_message(avro_string_reader, payload):
+            avro_string_reader.decode(encoded_message=payload)
+
+        benchmark.pedantic(decode_message, setup=setup, rounds=1000)
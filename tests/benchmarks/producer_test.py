@@ -20,7 +20,9 @@ import time
 
 import mock
 import pytest
+from kafka.codec import has_snappy
 
+from data_pipeline.compression_codec import CompressionCodecEnum
 from data_pipeline.expected_frequency import ExpectedFrequency
 from data_pipeline.producer import Producer
 from tests.factories.base_factory import MessageFactory
@@ -62,3 +64,60 @@ class TestBenchProducer(object):
         #
         # Perform 2000 rounds to ensure 20 flushes.
         benchmark.pedantic(dp_producer.publish, setup=setup, rounds=2000)
+
+    def test_publish_batch(self, benchmark, dp_producer):
+
+        def publish_batch(messages):
+            for message in messages:
+                dp_producer.publish(message)
+
+        def setup():
+            return [[
+                MessageFactory.create_message_with_payload_data()
+                for _ in range(100)
+            ]], {}
+
+        benchmark.pedantic(publish_batch, setup=setup, rounds=100)
+
+    def test_publish_many(self, benchmark, dp_producer):
+        # Compare with test_publish_batch for the per-message overhead saved
+        # by publish_many.
+
+        def setup():
+            return [[
+                MessageFactory.create_message_with_payload_data()
+                for _ in range(100)
+            ]], {}
+
+        benchmark.pedantic(dp_producer.publish_many, setup=setup, rounds=100)
+
+    @pytest.mark.parametrize('compression_codec', list(CompressionCodecEnum))
+    def test_publish_and_flush_compressed(
+        self,
+        benchmark,
+        team_name,
+        compression_codec
+    ):
+        if compression_codec == CompressionCodecEnum.snappy and not has_snappy():
+            pytest.skip("python-snappy isn't installed")
+
+        with Producer(
+            producer_name='producer_1',
+            team_name=team_name,
+            expected_frequency_seconds=ExpectedFrequency.constantly,
+            use_work_pool=False,
+            compression_codec=compression_codec
+        ) as producer:
+
+            def publish_and_flush(messages):
+                for message in messages:
+                    producer.publish(message)
+                producer.flush()
+
+            def setup():
+                return [[
+                    MessageFactory.create_message_with_payload_data()
+                    for _ in range(100)
+                ]], {}
+
+            benchmark.pedantic(publish_and_flush, setup=setup, rounds=100)
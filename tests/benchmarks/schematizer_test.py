@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.testing_helpers.fake_schematizer import FakeSchematizer
+from tests.factories.base_factory import SchemaFactory
+from tests.helpers.config import reconfigure
+
+
+@pytest.mark.usefixtures(
+    "config_benchmark_containers_connections"
+)
+@pytest.mark.benchmark
+class TestBenchSchematizer(object):
+
+    @pytest.fixture
+    def schema_id(self):
+        return SchemaFactory.get_schema_json().schema_id
+
+    def test_get_schematizer(self, benchmark):
+
+        @benchmark
+        def get():
+            get_schematizer()
+
+    def test_get_cached_schema_by_id(self, benchmark, schema_id):
+        # Warm up the cache so that every round is a cache hit.
+        get_schematizer().get_schema_by_id(schema_id)
+
+        @benchmark
+        def get():
+            get_schematizer().get_schema_by_id(schema_id)
+
+
+@pytest.mark.benchmark
+class TestBenchSchematizerTransport(object):
+    """Benchmarks the round trips to a local stand-in of the Schematizer, so
+    that the cost of the http transport can be measured without the real
+    service.
+    """
+
+    @pytest.yield_fixture
+    def fake_schematizer(self):
+        with FakeSchematizer() as fake_schematizer, reconfigure(
+            schematizer_host_and_port=fake_schematizer.host_and_port
+        ):
+            reset_schematizer()
+            yield fake_schematizer
+        reset_schematizer()
+
+    def test_get_non_cached_schema_by_id(self, benchmark, fake_schematizer):
+        schema_ids = iter([
+            fake_schematizer.add_schema({
+                'type': 'record',
+                'name': 'foo_{}'.format(i),
+                'namespace': 'bar',
+                'fields': []
+            })
+            for i in range(1000)
+        ])
+
+        def get():
+            get_schematizer().get_schema_by_id(next(schema_ids))
+
+        benchmark.pedantic(get, rounds=1000)
@@ -19,7 +19,9 @@ from __future__ import unicode_literals
 import mock
 import pytest
 
+from data_pipeline.client import _Monitor
 from data_pipeline.client import Client
+from data_pipeline.config import get_config
 from data_pipeline.expected_frequency import ExpectedFrequency
 
 
@@ -98,3 +100,46 @@ class TestClient(object):
         with mock.patch.object(client.monitor, skipped_method) as uncalled_method:
             getattr(client.monitor, method)(**kwargs)
             assert uncalled_method.called == 0
+
+
+class TestMonitor(object):
+
+    @pytest.fixture
+    def create_monitor(self):
+        def _create_monitor():
+            with mock.patch('data_pipeline.client.LoggingKafkaProducer'):
+                monitor = _Monitor('test_client', 'producer', start_time=0)
+            monitor._publish = mock.Mock()
+            return monitor
+        return _create_monitor
+
+    @pytest.fixture
+    def messages(self):
+        window = get_config().monitoring_window_in_sec
+        return [
+            mock.Mock(topic=topic, timestamp=timestamp)
+            for topic, timestamp in [
+                ('topic_1', 0),
+                ('topic_1', 1),
+                ('topic_2', 1),
+                ('topic_1', window),
+                ('topic_1', window * 3 + 1),
+                ('topic_2', window * 3 + 2),
+            ]
+        ]
+
+    def test_record_messages_same_as_record_message(
+        self,
+        create_monitor,
+        messages
+    ):
+        monitor = create_monitor()
+        for message in messages:
+            monitor.record_message(message)
+        batch_monitor = create_monitor()
+        batch_monitor.record_messages(messages)
+
+        assert monitor._publish.call_count == 6
+        assert batch_monitor._publish.call_args_list == monitor._publish.call_args_list
+        assert batch_monitor.topic_to_tracking_info_map == monitor.topic_to_tracking_info_map
+        assert batch_monitor._last_msg_timestamp == monitor._last_msg_timestamp
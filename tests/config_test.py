@@ -93,6 +93,9 @@ class TestConfigDefaults(TestConfigBase):
     def test_kafka_client_ack_count(self, config):
         assert config.kafka_client_ack_count == -1
 
+    def test_share_kafka_clients(self, config):
+        assert config.share_kafka_clients is False
+
     def test_producer_max_publish_retry_count(self, config):
         assert config.producer_max_publish_retry_count == 5
 
@@ -105,6 +108,39 @@ class TestConfigDefaults(TestConfigBase):
     def test_kafka_producer_flush_time_limit_seconds(self, config):
         assert config.kafka_producer_flush_time_limit_seconds == 0.1
 
+    def test_kafka_producer_buffer_bytes(self, config):
+        assert config.kafka_producer_buffer_bytes == 5 * 1024 * 1024
+
+    def test_kafka_producer_max_request_bytes(self, config):
+        assert config.kafka_producer_max_request_bytes == 100 * 1024 * 1024
+
+    def test_kafka_producer_memory_budget_bytes(self, config):
+        assert config.kafka_producer_memory_budget_bytes == 0
+
+    def test_kafka_producer_memory_budget_timeout_seconds(self, config):
+        assert config.kafka_producer_memory_budget_timeout_seconds == 10
+
+    def test_kafka_producer_spool_max_bytes(self, config):
+        assert config.kafka_producer_spool_max_bytes == 1024 * 1024 * 1024
+
+    def test_kafka_producer_spool_segment_bytes(self, config):
+        assert config.kafka_producer_spool_segment_bytes == 64 * 1024 * 1024
+
+    def test_kafka_producer_spool_retry_interval_seconds(self, config):
+        assert config.kafka_producer_spool_retry_interval_seconds == 5
+
+    def test_kafka_producer_max_in_flight_batches(self, config):
+        assert config.kafka_producer_max_in_flight_batches == 1
+
+    def test_kafka_producer_prepare_worker_count(self, config):
+        assert config.kafka_producer_prepare_worker_count == 0
+
+    def test_kafka_producer_prepare_chunk_size(self, config):
+        assert config.kafka_producer_prepare_chunk_size == 100
+
+    def test_kafka_producer_max_pending_prepare_chunks(self, config):
+        assert config.kafka_producer_max_pending_prepare_chunks == 16
+
     def test_skip_position_info_update_when_not_set(self, config):
         assert not config.skip_position_info_update_when_not_set
 
@@ -117,6 +153,45 @@ class TestConfigDefaults(TestConfigBase):
     def test_should_use_testing_containers(self, config):
         assert not config.should_use_testing_containers
 
+    def test_schematizer_client_max_connections_per_host(self, config):
+        assert config.schematizer_client_max_connections_per_host == 10
+
+    def test_schematizer_client_connect_timeout_seconds(self, config):
+        assert config.schematizer_client_connect_timeout_seconds == 5
+
+    def test_schematizer_client_read_timeout_seconds(self, config):
+        assert config.schematizer_client_read_timeout_seconds == 30
+
+    def test_schematizer_client_max_concurrent_requests(self, config):
+        assert config.schematizer_client_max_concurrent_requests == 10
+
+    def test_schematizer_persistent_cache_path(self, config):
+        assert config.schematizer_persistent_cache_path is None
+
+    def test_schematizer_persistent_cache_max_age_seconds(self, config):
+        assert config.schematizer_persistent_cache_max_age_seconds == 86400
+
+    def test_schematizer_negative_cache_ttl_seconds(self, config):
+        assert config.schematizer_negative_cache_ttl_seconds == 0
+
+    def test_schematizer_cache_max_entries(self, config):
+        assert config.schematizer_cache_max_entries == {
+            'schema': 5000,
+            'topic': 5000,
+            'source': 5000,
+            'data_target': 1000,
+            'consumer_group': 1000
+        }
+
+    def test_schematizer_cache_ttl_seconds(self, config):
+        assert config.schematizer_cache_ttl_seconds == {
+            'schema': None,
+            'topic': 600,
+            'source': 600,
+            'data_target': None,
+            'consumer_group': None
+        }
+
 
 class TestConfigurationOverrides(TestConfigBase):
     @classmethod
@@ -235,6 +310,12 @@ class TestConfigurationOverrides(TestConfigBase):
         with reconfigure(kafka_producer_buffer_size=10):
             assert config.kafka_producer_buffer_size == 10
 
+    def test_schematizer_cache_max_entries(self, config):
+        with reconfigure(**{'schematizer_cache_max_entries.schema': 10}):
+            max_entries = config.schematizer_cache_max_entries
+            assert max_entries['schema'] == 10
+            assert max_entries['topic'] == 5000
+
     def test_kafka_producer_flush_time_limit_seconds(self, config):
         with reconfigure(kafka_producer_flush_time_limit_seconds=3.2):
             assert config.kafka_producer_flush_time_limit_seconds == 3.2
@@ -29,6 +29,7 @@ from data_pipeline_avro_util.util import get_avro_schema_object
 from data_pipeline.message import CreateMessage
 from data_pipeline.message import LogMessage
 from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
 from data_pipeline.testing_helpers.containers import Containers
 from data_pipeline.tools.schema_ref import SchemaRef
 from tests.helpers.config import reconfigure
@@ -332,7 +333,9 @@ def config_benchmark_containers_connections():
         kafka_broker_list=['kafka:9092'],
         should_use_testing_containers=True
     ):
+        reset_schematizer()
         yield
+    reset_schematizer()
 
 
 @pytest.fixture(scope='session')
@@ -16,9 +16,19 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import base64
+import random
+
+import avro.io
 import pytest
 
 from data_pipeline import message as dp_message
+from data_pipeline._envelope_codec import decode_envelope
+from data_pipeline._envelope_codec import encode_envelope
+from data_pipeline._envelope_codec import ENVELOPE_FIELD_NAMES
+from data_pipeline._envelope_codec import MESSAGE_TYPE_SYMBOLS
+from data_pipeline._envelope_codec import peek_envelope
+from data_pipeline._envelope_codec import UnsupportedEnvelopeError
 from data_pipeline.envelope import Envelope
 from data_pipeline.meta_attribute import MetaAttribute
 
@@ -102,3 +112,135 @@ class TestEnvelope(object):
     def test_pack_unpack_ascii(self, message, envelope, expected_unpacked_message):
         unpacked = envelope.unpack(envelope.pack(message, ascii_encoded=True))
         assert unpacked == expected_unpacked_message
+
+
+class TestEnvelopeCodec(object):
+
+    @pytest.fixture
+    def envelope(self):
+        return Envelope()
+
+    def _create_random_bytes(self, rng, max_size):
+        size = rng.choice([0, 1, 127, 128, rng.randint(0, max_size)])
+        return bytes(bytearray(rng.randint(0, 255) for _ in range(size)))
+
+    def _create_random_int(self, rng):
+        return rng.choice([
+            0,
+            -1,
+            63,
+            64,
+            -(1 << 31),
+            (1 << 31) - 1,
+            rng.randint(-(1 << 31), (1 << 31) - 1)
+        ])
+
+    def _create_random_datum(self, rng):
+        meta = rng.choice([
+            None,
+            [],
+            [
+                {
+                    'schema_id': self._create_random_int(rng),
+                    'payload': self._create_random_bytes(rng, 100)
+                }
+                for _ in range(rng.randint(1, 3))
+            ]
+        ])
+        return {
+            'uuid': bytes(bytearray(rng.randint(0, 255) for _ in range(16))),
+            'message_type': rng.choice(MESSAGE_TYPE_SYMBOLS),
+            'schema_id': self._create_random_int(rng),
+            'payload': self._create_random_bytes(rng, 20000),
+            'previous_payload': rng.choice([
+                None,
+                self._create_random_bytes(rng, 200)
+            ]),
+            'meta': meta,
+            'encryption_type': rng.choice([None, '', 'AES_MODE_CBC-1', '\xe9t\xe9']),
+            'timestamp': self._create_random_int(rng)
+        }
+
+    @pytest.mark.parametrize('seed', range(50))
+    def test_same_encoding_as_avro(self, envelope, seed):
+        datum = self._create_random_datum(random.Random(seed))
+        encoded = encode_envelope(datum)
+        assert encoded == envelope._avro_string_writer.encode(datum)
+        assert decode_envelope(encoded) == datum
+        assert envelope._avro_string_reader.decode(encoded) == datum
+
+    def test_message_types_match_schema(self, envelope):
+        message_type_schema = envelope._schema.fields_dict['message_type'].type
+        assert tuple(message_type_schema.symbols) == MESSAGE_TYPE_SYMBOLS
+
+    def test_field_names_match_schema(self, envelope):
+        assert ENVELOPE_FIELD_NAMES == tuple(
+            field.name for field in envelope._schema.fields
+        )
+
+    @pytest.mark.parametrize('seed', range(20))
+    @pytest.mark.parametrize('fields', [
+        ['uuid'],
+        ['schema_id', 'message_type'],
+        ['timestamp'],
+        ['meta', 'timestamp'],
+        list(ENVELOPE_FIELD_NAMES)
+    ])
+    def test_peek(self, envelope, seed, fields):
+        datum = self._create_random_datum(random.Random(seed))
+        packed_message = bytes(0) + encode_envelope(datum)
+        expected = {field: datum[field] for field in fields}
+        assert peek_envelope(packed_message, set(fields)) == expected
+        assert envelope.peek(packed_message, fields) == expected
+        ascii_message = envelope.ASCII_MAGIC_BYTE + base64.urlsafe_b64encode(
+            packed_message
+        )
+        assert envelope.peek(ascii_message, fields) == expected
+
+    def test_peek_skips_array_blocks_by_size(self, envelope):
+        datum = self._create_random_datum(random.Random(0))
+        datum['meta'] = [{'schema_id': 1, 'payload': bytes('meta')}]
+        encoded = encode_envelope(datum)
+        # Writers may also write array blocks as a negative count followed by
+        # the size of the block, which lets readers skip it as a whole.
+        meta_block = bytes('\x02\x02\x08meta')
+        meta_start = encoded.index(meta_block)
+        packed_message = b''.join([
+            bytes(0),
+            encoded[:meta_start],
+            bytes('\x01\x0c\x02\x08meta'),
+            encoded[meta_start + len(meta_block):]
+        ])
+        assert envelope.unpack(packed_message) == datum
+        assert peek_envelope(packed_message, {'timestamp'}) == {
+            'timestamp': datum['timestamp']
+        }
+
+    def test_peek_unknown_field(self, envelope):
+        packed_message = bytes(0) + encode_envelope(
+            self._create_random_datum(random.Random(0))
+        )
+        with pytest.raises(ValueError):
+            envelope.peek(packed_message, ['timestamp', 'unknown'])
+
+    def test_truncated_envelope_peek_fails_like_avro(self, envelope):
+        packed_message = bytes(0) + encode_envelope(
+            self._create_random_datum(random.Random(0))
+        )
+        with pytest.raises(Exception) as unpack_error:
+            envelope.unpack(packed_message[:-1])
+        with pytest.raises(unpack_error.type):
+            envelope.peek(packed_message[:-1], ['timestamp'])
+
+    def test_invalid_datum_fails_like_avro(self, envelope):
+        datum = self._create_random_datum(random.Random(0))
+        datum['payload'] = 'unicode payload'
+        with pytest.raises(UnsupportedEnvelopeError):
+            encode_envelope(datum)
+        with pytest.raises(avro.io.AvroTypeException):
+            envelope._encode(datum)
+
+    def test_truncated_envelope_unsupported(self):
+        encoded = encode_envelope(self._create_random_datum(random.Random(0)))
+        with pytest.raises(UnsupportedEnvelopeError):
+            decode_envelope(encoded[:-1])
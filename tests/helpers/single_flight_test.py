@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+import time
+
+import pytest
+
+from data_pipeline.helpers.single_flight import SingleFlight
+
+
+class TestSingleFlight(object):
+
+    @pytest.fixture
+    def single_flight(self):
+        return SingleFlight()
+
+    def _run_concurrently(self, single_flight, key, func, thread_count):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(single_flight.do(key, func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def _join(self, threads):
+        for thread in threads:
+            thread.join(5)
+
+    def test_call(self, single_flight):
+        assert single_flight.do('key', lambda x: x + 1, 1) == 2
+
+    def test_coalesce_concurrent_calls(self, single_flight):
+        started = threading.Event()
+        release = threading.Event()
+        call_count = []
+
+        def slow_call():
+            call_count.append(1)
+            started.set()
+            release.wait()
+            return 'result'
+
+        leader, leader_results, _ = self._run_concurrently(
+            single_flight, 'key', slow_call, 1
+        )
+        started.wait(5)
+        followers, follower_results, _ = self._run_concurrently(
+            single_flight, 'key', slow_call, 4
+        )
+        # Give the followers time to start waiting on the in-flight call.
+        time.sleep(0.1)
+        release.set()
+        self._join(leader + followers)
+
+        assert len(call_count) == 1
+        assert leader_results + follower_results == ['result'] * 5
+
+    def test_share_exception(self, single_flight):
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing_call():
+            started.set()
+            release.wait()
+            raise ValueError()
+
+        leader, _, leader_errors = self._run_concurrently(
+            single_flight, 'key', failing_call, 1
+        )
+        started.wait(5)
+        followers, _, follower_errors = self._run_concurrently(
+            single_flight, 'key', failing_call, 2
+        )
+        # Give the followers time to start waiting on the in-flight call.
+        time.sleep(0.1)
+        release.set()
+        self._join(leader + followers)
+
+        assert len(leader_errors + follower_errors) == 3
+        assert all(isinstance(e, ValueError) for e in follower_errors)
+
+    def test_calls_of_different_keys_run_separately(self, single_flight):
+        assert single_flight.do('foo', lambda: 1) == 1
+        assert single_flight.do('bar', lambda: 2) == 2
+
+    def test_call_again_after_completion(self, single_flight):
+        call_count = []
+        single_flight.do('key', call_count.append, 1)
+        single_flight.do('key', call_count.append, 1)
+        assert len(call_count) == 2
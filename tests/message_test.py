@@ -354,13 +354,17 @@ class SharedMessageTest(object):
             actual_encrypted_payload
         ) == expected_decrypted_payload
 
-    def test_setup_contains_pii_from_schematizer_once(self, message):
+    def test_schema_metadata_resolved_once_per_schema(
+        self,
+        message,
+        valid_message_data
+    ):
         schematizer_client = get_schematizer()
         with attach_spy_on_func(schematizer_client, 'get_schema_by_id') as spy:
             message.contains_pii
-            assert spy.call_count == 1
-        with attach_spy_on_func(schematizer_client, 'get_schema_by_id') as spy:
-            message.contains_pii
+            other_message = self.message_class(**valid_message_data)
+            other_message.contains_pii
+            other_message.keys
             assert spy.call_count == 0
 
     def test_setup_encryption_type_from_config_once(self, pii_message):
@@ -431,6 +435,33 @@ class PayloadOnlyMessageTest(SharedMessageTest):
             )
             assert message.keys == expected_keys
 
+    def test_keys_with_payload_fields(
+        self,
+        registered_schema_with_pkey,
+        example_payload_data_with_pkeys,
+        example_payload_with_pkeys
+    ):
+        # The primary key fields are decoded even if they aren't asked for.
+        message = self.message_class(
+            schema_id=registered_schema_with_pkey.schema_id,
+            payload=example_payload_with_pkeys,
+            payload_fields=['field4']
+        )
+        assert message.payload_data == example_payload_data_with_pkeys
+        assert message.keys == {
+            "field2": example_payload_data_with_pkeys["field2"],
+            "field1": example_payload_data_with_pkeys["field1"],
+            "field3": example_payload_data_with_pkeys["field3"],
+        }
+
+    def test_keys_without_primary_keys(self, registered_schema):
+        # The payload isn't valid avro, so it must not be decoded for keys.
+        message = self.message_class(
+            schema_id=registered_schema.schema_id,
+            payload=bytes(10)
+        )
+        assert message.keys == {}
+
 
 class TestCreateMessage(PayloadOnlyMessageTest):
 
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from data_pipeline.partitioner import KeyHashPartitioner
+from data_pipeline.partitioner import RoundRobinPartitioner
+
+
+class TestRoundRobinPartitioner(object):
+
+    @pytest.fixture
+    def partitioner(self):
+        return RoundRobinPartitioner()
+
+    def _create_message(self, topic=str('my-topic'), encoded_keys=None):
+        return mock.Mock(
+            topic=topic,
+            keys={'id': encoded_keys} if encoded_keys else {},
+            encoded_keys=encoded_keys
+        )
+
+    def test_spreads_messages_across_partitions(self, partitioner):
+        message = self._create_message()
+        assert [
+            partitioner.partition(message, [0, 1, 2]) for _ in xrange(4)
+        ] == [0, 1, 2, 0]
+
+    def test_each_topic_takes_turns_separately(self, partitioner):
+        message = self._create_message()
+        other_message = self._create_message(topic=str('other-topic'))
+        assert partitioner.partition(message, [0, 1]) == 0
+        assert partitioner.partition(other_message, [0, 1]) == 0
+        assert partitioner.partition(message, [0, 1]) == 1
+
+
+class TestKeyHashPartitioner(TestRoundRobinPartitioner):
+
+    @pytest.fixture
+    def partitioner(self):
+        return KeyHashPartitioner()
+
+    def test_same_keys_go_to_same_partition(self, partitioner):
+        partitions = range(16)
+        message = self._create_message(encoded_keys=b'\x02\x0a')
+        partition = partitioner.partition(message, partitions)
+        assert partition in partitions
+        assert all(
+            partitioner.partition(message, partitions) == partition
+            for _ in xrange(10)
+        )
+        assert KeyHashPartitioner().partition(message, partitions) == partition
+
+    def test_keys_are_spread_across_partitions(self, partitioner):
+        partitions = range(4)
+        assert {
+            partitioner.partition(
+                self._create_message(encoded_keys=bytes(key)),
+                partitions
+            )
+            for key in xrange(100)
+        } == set(partitions)
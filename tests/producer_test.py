@@ -19,6 +19,7 @@ from __future__ import unicode_literals
 import multiprocessing
 import random
 import time
+from collections import defaultdict
 
 import clog
 import mock
@@ -27,7 +28,6 @@ import simplejson as json
 from data_pipeline_avro_util.avro_string_reader import AvroStringReader
 from data_pipeline_avro_util.avro_string_writer import AvroStringWriter
 from kafka.common import FailedPayloadsError
-from kafka.common import ProduceRequest
 from kafka.common import ProduceResponse
 from kafka_utils.util.offsets import get_topics_watermarks
 
@@ -37,6 +37,9 @@ from data_pipeline._clog_writer import ClogWriter
 from data_pipeline._encryption_helper import EncryptionHelper
 from data_pipeline._kafka_producer import _EnvelopeAndMessage
 from data_pipeline._kafka_producer import _prepare
+from data_pipeline._producer_retry import _ProduceRequest
+from data_pipeline._producer_retry import _TopicPartition
+from data_pipeline._producer_spool import ProducerSpool
 from data_pipeline._retry_util import ExpBackoffPolicy
 from data_pipeline._retry_util import MaxRetryError
 from data_pipeline._retry_util import RetryPolicy
@@ -51,6 +54,10 @@ from data_pipeline.message_type import _ProtectedMessageType
 from data_pipeline.meta_attribute import MetaAttribute
 from data_pipeline.producer import Producer
 from data_pipeline.producer import PublicationUnensurableError
+from data_pipeline.schematizer_clientlib.models.avro_schema import AvroSchema
+from data_pipeline.schematizer_clientlib.models.topic import Topic
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
 from data_pipeline.testing_helpers.kafka_docker import capture_new_data_pipeline_messages
 from data_pipeline.testing_helpers.kafka_docker import capture_new_messages
 from data_pipeline.testing_helpers.kafka_docker import setup_capture_new_messages_consumer
@@ -257,6 +264,40 @@ class TestProducer(TestProducerBase):
             producer.flush()
             return get_messages()
 
+    def test_publish_many(self, create_message, producer):
+        messages = [
+            create_message(upstream_position_info={'position': position})
+            for position in range(3)
+        ]
+        with capture_new_data_pipeline_messages(
+            messages[0].topic
+        ) as get_messages:
+            producer.publish_many(messages)
+            producer.flush()
+            published_messages = get_messages()
+
+        assert [message.payload for message in published_messages] == [
+            message.payload for message in messages
+        ]
+        position_data = producer.get_checkpoint_position_data()
+        assert position_data.last_published_message_position_info == {
+            'position': 2
+        }
+
+    def test_publish_many_updates_schema_last_used_timestamp(
+        self,
+        create_message,
+        producer
+    ):
+        messages = [create_message(), create_message()]
+        with mock.patch.object(
+            producer.registrar,
+            'update_schema_last_used_timestamp'
+        ) as mock_update_timestamp:
+            producer.publish_many(messages)
+        assert mock_update_timestamp.call_count == 1
+        assert mock_update_timestamp.call_args[0][0] == messages[0].schema_id
+
     def test_messages_not_duplicated(self, message, producer_instance):
         with capture_new_messages(
             message.topic
@@ -860,8 +901,26 @@ class TestEnsureMessagesPublished(TestProducerBase):
             unpublished_count=0
         )
 
+    def test_ensure_messages_published_from_generator(
+        self, topic, messages, producer, topic_offsets
+    ):
+        self._test_success_ensure_messages_published(
+            topic,
+            messages,
+            producer,
+            topic_offsets,
+            unpublished_count=2,
+            pass_generator=True
+        )
+
     def _test_success_ensure_messages_published(
-        self, topic, messages, producer, topic_offsets, unpublished_count
+        self,
+        topic,
+        messages,
+        producer,
+        topic_offsets,
+        unpublished_count,
+        pass_generator=False
     ):
         messages_to_publish = len(messages) - unpublished_count
         messages_published_first = messages[:messages_to_publish]
@@ -877,7 +936,10 @@ class TestEnsureMessagesPublished(TestProducerBase):
             producer.flush()
             producer.position_data_callback = mock.Mock()
 
-            producer.ensure_messages_published(messages, topic_offsets)
+            producer.ensure_messages_published(
+                (message for message in messages) if pass_generator else messages,
+                topic_offsets
+            )
 
             if unpublished_count > 0:
                 assert producer.position_data_callback.call_count == 1
@@ -1235,8 +1297,9 @@ class TestPublishMessagesWithRetry(TestProducerBase):
             producer._kafka_producer.kafka_client,
             'send_produce_request',
             side_effect=[FailedPayloadsError]
-        ) as mock_send_request, mock.patch(
-            'data_pipeline._kafka_util.get_topics_watermarks',
+        ) as mock_send_request, mock.patch.object(
+            producer._kafka_producer.kafka_client,
+            'send_offset_request',
             side_effect=Exception
         ), capture_new_messages(
             message.topic
@@ -1280,10 +1343,11 @@ class TestPublishMessagesWithRetry(TestProducerBase):
     def assert_last_retry_result(
         self, last_retry_result, message, expected_published_msgs_count
     ):
-        expected_requests = [ProduceRequest(
+        expected_requests = [_ProduceRequest(
             topic=message.topic,
             partition=0,
-            messages=[_prepare(_EnvelopeAndMessage(Envelope(), message))]
+            messages=[_prepare(_EnvelopeAndMessage(Envelope(), message))],
+            message_count=1
         )]
         assert last_retry_result.unpublished_requests == expected_requests
         assert last_retry_result.total_published_message_count == expected_published_msgs_count
@@ -1304,3 +1368,217 @@ class TestPublishMessagesWithRetry(TestProducerBase):
         expected_map[topic] = original_offset + published_message_count
         new_pos_data = producer.get_checkpoint_position_data()
         assert new_pos_data.topic_to_kafka_offset_map == expected_map
+
+
+class TestEnsureMessagesPublishedWithMockedKafka(object):
+    """Covers the recovery logic which doesn't need a running Kafka, against a
+    mocked kafka client.
+    """
+
+    @property
+    def topic(self):
+        return str('my-topic')
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_schematizer(self):
+        mock_date = '2015-01-01'
+        mock_topic = Topic(
+            1, self.topic, None, False, 'datapipe', [], mock_date, mock_date
+        )
+        mock_schema = AvroSchema(
+            1, 'schema', mock_topic, None, 'RW', None, None, mock_date, mock_date
+        )
+        mock_schematizer_client = mock.Mock(spec=SchematizerClient)
+        mock_schematizer_client.get_schema_by_id.return_value = mock_schema
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.SchematizerClient',
+            return_value=mock_schematizer_client
+        ):
+            yield
+        reset_schematizer()
+
+    @pytest.yield_fixture
+    def kafka_client(self):
+        # Not sharing clients keeps the mocked client out of the pool.
+        with reconfigure(share_kafka_clients=False), mock.patch(
+            'data_pipeline._kafka_client_pool.KafkaClient'
+        ) as mock_kafka_client_class:
+            kafka_client = mock_kafka_client_class.return_value
+            kafka_client.get_partition_ids_for_topic.return_value = [0, 1]
+            kafka_client.send_produce_request.side_effect = self._send_produce_request
+            yield kafka_client
+
+    @pytest.fixture(autouse=True)
+    def reset_published_counts(self):
+        self.partition_to_published_count = defaultdict(int)
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_published_messages_count(self):
+        # The saved offsets are all 0 in these tests, so the messages counted
+        # as published are all the ones after them.
+        with mock.patch.object(
+            data_pipeline.producer,
+            'get_actual_published_messages_count',
+            side_effect=lambda *args, **kwargs: {
+                self.topic: dict(self.partition_to_published_count)
+            }
+        ):
+            yield
+
+    @pytest.fixture(params=[False, True])
+    def use_pipelined_flush(self, request):
+        return request.param
+
+    @pytest.yield_fixture
+    def producer(self, kafka_client, use_pipelined_flush):
+        # The registration messages would be published to the mocked schema.
+        with mock.patch(
+            'data_pipeline.client.Registrar'
+        ), Producer(
+            producer_name='producer_1',
+            team_name='bam',
+            expected_frequency_seconds=ExpectedFrequency.constantly,
+            monitoring_enabled=False,
+            use_pipelined_flush=use_pipelined_flush
+        ) as producer:
+            yield producer
+
+    @pytest.fixture
+    def messages(self):
+        return [
+            CreateMessage(
+                schema_id=1,
+                payload=bytes(i),
+                upstream_position_info={'position': i + 1}
+            )
+            for i in range(4)
+        ]
+
+    def _send_produce_request(self, payloads, acks, fail_on_error):
+        responses = []
+        for request in payloads:
+            offset = self.partition_to_published_count[request.partition]
+            self.partition_to_published_count[request.partition] += request.message_count
+            responses.append(
+                ProduceResponse(request.topic, request.partition, 0, offset)
+            )
+        return responses
+
+    def _send_produce_request_slowly(self, payloads, acks, fail_on_error):
+        # Gives the recovery a chance to look up the high watermarks before
+        # the batches recovered from the spool are published.
+        time.sleep(0.1)
+        return self._send_produce_request(payloads, acks, fail_on_error)
+
+    def test_messages_without_keys_published_to_partition_counted_against(
+        self, messages, producer
+    ):
+        producer.ensure_messages_published(
+            messages,
+            {self.topic: {0: 0, 1: 0}}
+        )
+
+        # The messages without keys are spread across both partitions in turn.
+        assert self.partition_to_published_count == {0: 2, 1: 2}
+
+    def test_nothing_published_when_overpublished(
+        self, messages, producer, kafka_client
+    ):
+        # Partition 0 has more messages published than passed in, while the
+        # messages of partition 1 still need to be published.
+        self.partition_to_published_count[0] = 3
+        position_data = producer.get_checkpoint_position_data()
+
+        with pytest.raises(PublicationUnensurableError):
+            producer.ensure_messages_published(
+                messages,
+                {self.topic: {0: 0, 1: 0}}
+            )
+        producer.close()
+
+        assert kafka_client.send_produce_request.call_count == 0
+        assert producer.get_checkpoint_position_data() == position_data
+
+    def test_messages_published_in_chunks(
+        self, messages, producer, kafka_client
+    ):
+        with reconfigure(kafka_producer_buffer_size=1):
+            producer.ensure_messages_published(
+                messages,
+                {self.topic: {0: 0, 1: 0}}
+            )
+
+        assert kafka_client.send_produce_request.call_count == len(messages)
+        assert self.partition_to_published_count == {0: 2, 1: 2}
+        position_data = producer.get_checkpoint_position_data()
+        assert position_data.last_published_message_position_info == {
+            'position': 4
+        }
+
+    def test_recovery_flushes_to_stay_within_memory_budget(
+        self, messages, producer
+    ):
+        # Only a single message fits in the budget at a time.
+        with reconfigure(
+            kafka_producer_memory_budget_bytes=1,
+            kafka_producer_memory_budget_timeout_seconds=0.1
+        ):
+            producer.ensure_messages_published(
+                messages,
+                {self.topic: {0: 0, 1: 0}}
+            )
+
+        assert self.partition_to_published_count == {0: 2, 1: 2}
+
+    def test_position_rolled_back_to_last_flush_when_overpublished(
+        self, messages, producer, kafka_client
+    ):
+        self.partition_to_published_count[0] = 3
+
+        with reconfigure(kafka_producer_buffer_size=1), pytest.raises(
+            PublicationUnensurableError
+        ):
+            producer.ensure_messages_published(
+                messages[:3],
+                {self.topic: {0: 0, 1: 0}}
+            )
+        producer.close()
+
+        # The message of partition 1 was flushed before partition 0 was found
+        # to have more messages published than passed in.
+        assert self.partition_to_published_count == {0: 3, 1: 1}
+        position_data = producer.get_checkpoint_position_data()
+        assert position_data.last_published_message_position_info == {
+            'position': 2
+        }
+        position_tracker = producer._kafka_producer.position_data_tracker
+        assert position_tracker.get_position_data() == position_data
+
+    def test_messages_recovered_from_spool_not_published_twice(
+        self, messages, kafka_client, tmpdir
+    ):
+        kafka_client.get_partition_ids_for_topic.return_value = [0]
+        kafka_client.send_produce_request.side_effect = self._send_produce_request_slowly
+        spool_dir = str(tmpdir.join('spool'))
+        # A producer crashed with the first messages left in its spool.
+        spool = ProducerSpool(spool_dir)
+        spool.append({
+            _TopicPartition(self.topic, 0): [
+                _prepare(_EnvelopeAndMessage(Envelope(), message))
+                for message in messages[:2]
+            ]
+        })
+        spool.close()
+
+        with mock.patch(
+            'data_pipeline.client.Registrar'
+        ), Producer(
+            producer_name='producer_1',
+            team_name='bam',
+            expected_frequency_seconds=ExpectedFrequency.constantly,
+            monitoring_enabled=False,
+            spool_dir=spool_dir
+        ) as producer:
+            producer.ensure_messages_published(messages, {self.topic: {0: 0}})
+
+        assert self.partition_to_published_count == {0: len(messages)}
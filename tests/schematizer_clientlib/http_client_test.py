@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import threading
+
+import pytest
+from requests.exceptions import ReadTimeout
+
+from data_pipeline.schematizer_clientlib.http_client import PooledRequestsClient
+from data_pipeline.testing_helpers.fake_schematizer import FakeSchematizer
+
+
+class TestPooledRequestsClient(object):
+
+    @pytest.yield_fixture
+    def fake_schematizer(self):
+        with FakeSchematizer() as fake_schematizer:
+            yield fake_schematizer
+
+    @pytest.fixture
+    def schema_id(self, fake_schematizer):
+        return fake_schematizer.add_schema({
+            'type': 'record',
+            'name': 'foo',
+            'namespace': 'bar',
+            'fields': []
+        })
+
+    def _get_schema(self, http_client, fake_schematizer, schema_id):
+        return http_client.request({
+            'method': 'GET',
+            'url': 'http://{0}/v1/schemas/{1}'.format(
+                fake_schematizer.host_and_port,
+                schema_id
+            )
+        }).result()
+
+    def test_reuse_connection(self, fake_schematizer, schema_id):
+        http_client = PooledRequestsClient()
+        for _ in range(5):
+            self._get_schema(http_client, fake_schematizer, schema_id)
+        assert fake_schematizer.request_count == 5
+        assert fake_schematizer.connection_count == 1
+
+    def test_bound_connections_per_host(self, fake_schematizer, schema_id):
+        fake_schematizer.latency_seconds = 0.05
+        http_client = PooledRequestsClient(max_connections_per_host=2)
+        threads = [
+            threading.Thread(
+                target=self._get_schema,
+                args=(http_client, fake_schematizer, schema_id)
+            )
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert fake_schematizer.request_count == 6
+        assert fake_schematizer.connection_count <= 2
+
+    def test_read_timeout(self, fake_schematizer, schema_id):
+        fake_schematizer.latency_seconds = 0.5
+        http_client = PooledRequestsClient(read_timeout=0.05)
+        with pytest.raises(ReadTimeout):
+            self._get_schema(http_client, fake_schematizer, schema_id)
+
+    def test_default_timeouts(self):
+        http_client = PooledRequestsClient(connect_timeout=1, read_timeout=2)
+        future = http_client.request({'method': 'GET', 'url': 'http://foo'})
+        assert future.future.build_timeout(None) == (1, 2)
+        assert future.future.build_timeout(3) == (1, 3)
+
+    def test_request_options_override_default_timeouts(self):
+        http_client = PooledRequestsClient(connect_timeout=1, read_timeout=2)
+        future = http_client.request({
+            'method': 'GET',
+            'url': 'http://foo',
+            'connect_timeout': 3,
+            'timeout': 4
+        })
+        assert future.future.build_timeout(None) == (3, 4)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import sqlite3
+
+import mock
+import pytest
+from bravado.exception import HTTPError
+from frozendict import frozendict
+
+from data_pipeline.schematizer_clientlib.models.source import _Source
+from data_pipeline.schematizer_clientlib.persistent_cache import PersistentCache
+from data_pipeline.schematizer_clientlib.schematizer import _Cache
+
+
+class TestPersistentCache(object):
+
+    @pytest.fixture
+    def cache_path(self, tmpdir):
+        return str(tmpdir.join('schematizer', 'cache.db'))
+
+    @pytest.fixture
+    def cache_value(self):
+        return {
+            'schema_id': 1,
+            'schema_json': frozendict({'type': 'record', 'name': 'foo'}),
+            'topic_name': 'foo_topic'
+        }
+
+    def _create_cache(self, cache_path, **kwargs):
+        return PersistentCache(path=cache_path, flush_batch_size=10, **kwargs)
+
+    def test_get_missing_entry(self, cache_path):
+        cache = self._create_cache(cache_path)
+        assert cache.get('_AvroSchema', 1) is None
+
+    def test_get_pending_entry(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, cache_value)
+        assert cache.get('_AvroSchema', 1) == cache_value
+
+    def test_entries_survive_restart(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, cache_value)
+        cache.flush()
+
+        new_cache = self._create_cache(cache_path)
+        assert new_cache.get('_AvroSchema', 1) == cache_value
+
+    def test_flush_when_batch_is_full(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        for schema_id in range(10):
+            cache.set('_AvroSchema', schema_id, cache_value)
+
+        new_cache = self._create_cache(cache_path)
+        assert new_cache.get('_AvroSchema', 9) == cache_value
+
+    def test_keys_of_different_types(self, cache_path):
+        cache = self._create_cache(cache_path)
+        cache.set('_DataTarget', 1, {'by': 'id'})
+        cache.set('_DataTarget', '1', {'by': 'name'})
+        cache.flush()
+
+        new_cache = self._create_cache(cache_path)
+        assert new_cache.get('_DataTarget', 1) == {'by': 'id'}
+        assert new_cache.get('_DataTarget', '1') == {'by': 'name'}
+
+    def test_expired_entry(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path, max_age_seconds=60)
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.persistent_cache.time.time',
+            return_value=1000
+        ):
+            cache.set('_AvroSchema', 1, cache_value)
+            cache.flush()
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.persistent_cache.time.time',
+            return_value=1061
+        ):
+            assert cache.get('_AvroSchema', 1) is None
+
+    def test_discard_database_of_other_version(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, cache_value)
+        cache.flush()
+
+        with mock.patch.object(PersistentCache, 'VERSION', 2):
+            new_cache = self._create_cache(cache_path)
+            assert new_cache.get('_AvroSchema', 1) is None
+
+    def test_recover_from_corrupted_database(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, cache_value)
+        cache.flush()
+        with open(cache_path, 'wb') as f:
+            f.write(b'this is not a sqlite database' * 100)
+
+        new_cache = self._create_cache(cache_path)
+        assert new_cache.get('_AvroSchema', 1) is None
+        new_cache.set('_AvroSchema', 1, cache_value)
+        new_cache.flush()
+        assert self._create_cache(cache_path).get('_AvroSchema', 1) == cache_value
+
+    def test_drop_unreadable_entry(self, cache_path):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, {})
+        cache.flush()
+        connection = sqlite3.connect(cache_path)
+        with connection:
+            connection.execute(
+                'UPDATE cache SET value = ?',
+                (sqlite3.Binary(b'not a pickle'),)
+            )
+        connection.close()
+
+        assert cache.get('_AvroSchema', 1) is None
+
+    def test_unopenable_database(self, tmpdir, cache_value):
+        # The directory of the database can't be created under a file.
+        tmpdir.join('not_a_directory').write('')
+        cache = self._create_cache(
+            str(tmpdir.join('not_a_directory', 'cache.db'))
+        )
+        cache.set('_AvroSchema', 1, cache_value)
+        cache.flush()
+        assert cache.get('_AvroSchema', 2) is None
+
+    def test_locked_database(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, cache_value)
+        locked_error = sqlite3.OperationalError('database is locked')
+        with mock.patch.object(
+            cache,
+            '_insert_rows',
+            side_effect=locked_error
+        ), mock.patch.object(
+            cache,
+            '_select_row',
+            side_effect=locked_error
+        ):
+            cache.flush()
+            assert cache.get('_AvroSchema', 2) is None
+
+        cache.flush()
+        assert self._create_cache(cache_path).get('_AvroSchema', 1) == cache_value
+
+    def test_clear(self, cache_path, cache_value):
+        cache = self._create_cache(cache_path)
+        cache.set('_AvroSchema', 1, cache_value)
+        cache.flush()
+        cache.clear()
+        assert cache.get('_AvroSchema', 1) is None
+
+
+class TestCacheWithPersistentCache(object):
+
+    @pytest.fixture
+    def persistent_cache(self, tmpdir):
+        return PersistentCache(path=str(tmpdir.join('cache.db')))
+
+    @pytest.fixture
+    def source(self):
+        return _Source(
+            source_id=10,
+            name='biz',
+            owner_email='test@yelp.com',
+            namespace=None,
+            category=None
+        )
+
+    def test_read_through_on_miss(self, persistent_cache, source):
+        _Cache(persistent_cache=persistent_cache).set_value(
+            source.source_id,
+            source
+        )
+        persistent_cache.flush()
+
+        actual = _Cache(persistent_cache=persistent_cache).get_value(
+            _Source,
+            source.source_id
+        )
+        assert actual.to_cache_value() == source.to_cache_value()
+
+    def test_miss_in_both_caches(self, persistent_cache):
+        cache = _Cache(persistent_cache=persistent_cache)
+        assert cache.get_value(_Source, 10) is None
+
+    @pytest.fixture
+    def error(self):
+        response = mock.Mock(status_code=404, reason='Not Found', text='{}')
+        return HTTPError(response=response, message='Source 10 not found.')
+
+    def test_errors_survive_restart(self, persistent_cache, error):
+        _Cache(
+            persistent_cache=persistent_cache,
+            error_ttl_seconds=60
+        ).set_error(_Source, 10, error)
+        persistent_cache.flush()
+
+        cache = _Cache(persistent_cache=persistent_cache, error_ttl_seconds=60)
+        actual = cache.get_error(_Source, 10)
+        assert isinstance(actual, HTTPError)
+        assert actual.response.status_code == 404
+        assert actual.response.text == '{}'
+        assert actual.message == error.message
+        assert cache.get_value(_Source, 10) is None
+
+    def test_expired_persisted_error(self, persistent_cache, error):
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.time.time',
+            return_value=1000
+        ):
+            _Cache(
+                persistent_cache=persistent_cache,
+                error_ttl_seconds=60
+            ).set_error(_Source, 10, error)
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.time.time',
+            return_value=1060
+        ):
+            assert _Cache(
+                persistent_cache=persistent_cache,
+                error_ttl_seconds=60
+            ).get_error(_Source, 10) is None
+
+    def test_set_value_replaces_persisted_error(
+        self,
+        persistent_cache,
+        source,
+        error
+    ):
+        cache = _Cache(persistent_cache=persistent_cache, error_ttl_seconds=60)
+        cache.set_error(_Source, source.source_id, error)
+        cache.set_value(source.source_id, source)
+        persistent_cache.flush()
+
+        new_cache = _Cache(
+            persistent_cache=persistent_cache,
+            error_ttl_seconds=60
+        )
+        assert new_cache.get_error(_Source, source.source_id) is None
+        assert new_cache.get_value(
+            _Source,
+            source.source_id
+        ).to_cache_value() == source.to_cache_value()
@@ -16,7 +16,9 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import functools
 import random
+import threading
 import time
 from contextlib import contextmanager
 from datetime import datetime
@@ -30,6 +32,8 @@ from requests.exceptions import ConnectionError
 from requests.exceptions import ReadTimeout
 
 from data_pipeline.config import get_config
+from data_pipeline.helpers.single_flight import SingleFlight
+from data_pipeline.schematizer_clientlib.models.avro_schema import _AvroSchema
 from data_pipeline.schematizer_clientlib.models.data_source_type_enum import \
     DataSourceTypeEnum
 from data_pipeline.schematizer_clientlib.models.meta_attr_namespace_mapping \
@@ -37,17 +41,25 @@ from data_pipeline.schematizer_clientlib.models.meta_attr_namespace_mapping \
 from data_pipeline.schematizer_clientlib.models.meta_attr_source_mapping \
     import MetaAttributeSourceMapping
 from data_pipeline.schematizer_clientlib.models.namespace import Namespace
+from data_pipeline.schematizer_clientlib.models.source import _Source
 from data_pipeline.schematizer_clientlib.models.source import Source
 from data_pipeline.schematizer_clientlib.models.target_schema_type_enum import \
     TargetSchemaTypeEnum
+from data_pipeline.schematizer_clientlib.models.topic import _Topic
+from data_pipeline.schematizer_clientlib.schematizer import _Cache
+from data_pipeline.schematizer_clientlib.schematizer import _CachePolicy
+from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
 from data_pipeline.schematizer_clientlib.schematizer import SchematizerClient
+from data_pipeline.testing_helpers.fake_schematizer import FakeSchematizer
+from tests.helpers.config import reconfigure
 
 
 class SchematizerClientTestBase(object):
 
     @pytest.fixture
     def schematizer(self, containers):
-        return SchematizerClient()
+        return get_schematizer()
 
     def attach_spy_on_api(self, client, resource_name, api_name):
         # We replace what the client is actually returning instead of just patching
@@ -257,6 +269,451 @@ class TestAPIClient(SchematizerClientTestBase):
             assert api_spy.call_count == 3
 
 
+class TestGetSchematizer(object):
+
+    @pytest.yield_fixture(autouse=True)
+    def patch_client_init(self):
+        # Building a real client fetches the swagger spec; the registry
+        # behavior doesn't depend on it.
+        with mock.patch.object(
+            SchematizerClient,
+            '__init__',
+            return_value=None
+        ) as patched_init:
+            reset_schematizer()
+            yield patched_init
+            reset_schematizer()
+
+    def test_returns_same_client(self, patch_client_init):
+        assert get_schematizer() is get_schematizer()
+        assert patch_client_init.call_count == 1
+
+    def test_reset_creates_new_client(self, patch_client_init):
+        client = get_schematizer()
+        reset_schematizer()
+        assert get_schematizer() is not client
+        assert patch_client_init.call_count == 2
+
+    def test_forked_process_creates_new_client(self, patch_client_init):
+        client = get_schematizer()
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.os.getpid',
+            return_value=-1
+        ):
+            child_client = get_schematizer()
+            assert child_client is not client
+            assert get_schematizer() is child_client
+        assert patch_client_init.call_count == 2
+
+    def test_concurrent_calls_create_one_client(self, patch_client_init):
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(get_schematizer()))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(id(client) for client in clients)) == 1
+        assert patch_client_init.call_count == 1
+
+
+class TestCallApi(object):
+
+    @pytest.fixture
+    def schematizer(self):
+        with mock.patch.object(SchematizerClient, '__init__', return_value=None):
+            client = SchematizerClient()
+        client._single_flight = SingleFlight()
+        return client
+
+    @pytest.fixture
+    def request_future(self):
+        return mock.Mock()
+
+    def _create_api(self, api_name, request_future):
+        # Mimics the partial ZipkinClientDecorator returns for an operation.
+        return functools.partial(
+            lambda call_name, **kwargs: request_future,
+            api_name
+        )
+
+    def test_coalesce_concurrent_reads(self, schematizer, request_future):
+        release = threading.Event()
+
+        def get_result():
+            release.wait()
+            return mock.sentinel.response
+
+        request_future.result.side_effect = get_result
+        api = self._create_api('get_schema_by_id', request_future)
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(
+                schematizer._call_api(api, params={'schema_id': 1})
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        # Give all the threads time to join the in-flight request.
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert responses == [mock.sentinel.response] * 5
+        assert request_future.result.call_count == 1
+
+    def test_do_not_coalesce_writes(self, schematizer, request_future):
+        with mock.patch.object(schematizer._single_flight, 'do') as mock_do:
+            schematizer._call_api(
+                self._create_api('create_refresh', request_future),
+                params={'source_id': 1}
+            )
+            schematizer._call_api(
+                self._create_api('get_schema_by_id', request_future),
+                request_body={'schema_id': 1}
+            )
+        assert mock_do.call_count == 0
+        assert request_future.result.call_count == 2
+
+
+class TestCache(object):
+
+    @pytest.fixture
+    def cache(self):
+        return _Cache()
+
+    @pytest.fixture
+    def source(self):
+        return _Source(
+            source_id=1,
+            name='biz',
+            owner_email='test@yelp.com',
+            namespace=None,
+            category=None
+        )
+
+    @pytest.fixture
+    def topic(self, source):
+        return _Topic(
+            topic_id=2,
+            name='biz_topic',
+            source=source,
+            contains_pii=False,
+            cluster_type='datapipe',
+            primary_keys=[],
+            created_at=None,
+            updated_at=None
+        )
+
+    @pytest.fixture
+    def cached_results(self, cache, topic):
+        cache.set_value(topic.name, topic)
+        cache.set_value(topic.source.source_id, topic.source)
+        cache.set_result(_Source, 1, mock.sentinel.source)
+        cache.set_result(
+            _Topic,
+            topic.name,
+            mock.sentinel.topic,
+            dependencies=[(_Source, 1)]
+        )
+        cache.set_result(
+            _AvroSchema,
+            3,
+            mock.sentinel.schema,
+            dependencies=[(_Topic, topic.name)]
+        )
+
+    def test_get_result(self, cache, cached_results):
+        assert cache.get_result(_AvroSchema, 3) is mock.sentinel.schema
+        assert cache.get_result(_AvroSchema, 4) is None
+
+    def test_unchanged_value_keeps_results(self, cache, cached_results, topic):
+        cache.set_value(topic.name, topic)
+        assert cache.get_result(_Topic, topic.name) is mock.sentinel.topic
+        assert cache.get_result(_AvroSchema, 3) is mock.sentinel.schema
+
+    def test_changed_topic_invalidates_dependent_results(
+        self,
+        cache,
+        cached_results,
+        topic
+    ):
+        topic.contains_pii = True
+        cache.set_value(topic.name, topic)
+        assert cache.get_result(_Topic, topic.name) is None
+        assert cache.get_result(_AvroSchema, 3) is None
+        assert cache.get_result(_Source, 1) is mock.sentinel.source
+
+    def test_changed_source_invalidates_nested_results(
+        self,
+        cache,
+        cached_results,
+        source
+    ):
+        source.owner_email = 'new@yelp.com'
+        cache.set_value(source.source_id, source)
+        assert cache.get_result(_Source, 1) is None
+        assert cache.get_result(_Topic, 'biz_topic') is None
+        assert cache.get_result(_AvroSchema, 3) is None
+
+
+class TestCacheEviction(object):
+
+    @pytest.fixture
+    def cache(self):
+        return _Cache(policies={
+            _Source: _CachePolicy(max_entries=2, ttl_seconds=None)
+        })
+
+    def _create_source(self, source_id):
+        return _Source(
+            source_id=source_id,
+            name='biz_{}'.format(source_id),
+            owner_email='test@yelp.com',
+            namespace=None,
+            category=None
+        )
+
+    def _set_sources(self, cache, *source_ids):
+        for source_id in source_ids:
+            cache.set_value(source_id, self._create_source(source_id))
+
+    def test_evict_least_recently_used(self, cache):
+        self._set_sources(cache, 1, 2)
+        assert cache.get_value(_Source, 1) is not None
+        self._set_sources(cache, 3)
+        assert cache.get_value(_Source, 1) is not None
+        assert cache.get_value(_Source, 2) is None
+        assert cache.get_value(_Source, 3) is not None
+
+    def test_evict_oldest_if_none_used(self, cache):
+        self._set_sources(cache, 1, 2, 3)
+        assert cache.get_value(_Source, 1) is None
+        assert cache.get_value(_Source, 2) is not None
+
+    def test_evicted_entity_invalidates_dependent_results(self, cache):
+        self._set_sources(cache, 1)
+        cache.set_result(
+            _Topic,
+            'biz_topic',
+            mock.sentinel.topic,
+            dependencies=[(_Source, 1)]
+        )
+        self._set_sources(cache, 2, 3)
+        assert cache.get_result(_Topic, 'biz_topic') is None
+
+    def test_other_types_are_unbounded(self, cache):
+        for schema_id in range(10):
+            cache.set_result(_AvroSchema, schema_id, mock.sentinel.schema)
+        assert cache.get_result(_AvroSchema, 0) is mock.sentinel.schema
+
+
+class TestCacheErrors(object):
+
+    @pytest.fixture
+    def cache(self):
+        return _Cache(error_ttl_seconds=60)
+
+    @pytest.fixture
+    def source(self):
+        return _Source(
+            source_id=1,
+            name='biz',
+            owner_email='test@yelp.com',
+            namespace=None,
+            category=None
+        )
+
+    def test_get_error(self, cache):
+        cache.set_error(_Source, 1, mock.sentinel.error)
+        assert cache.get_error(_Source, 1) is mock.sentinel.error
+        assert cache.get_error(_Source, 2) is None
+        assert cache.get_error(_Topic, 1) is None
+
+    def test_expired_error(self, cache):
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.time.time',
+            return_value=1000
+        ):
+            cache.set_error(_Source, 1, mock.sentinel.error)
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.time.time',
+            return_value=1060
+        ):
+            assert cache.get_error(_Source, 1) is None
+
+    def test_set_value_drops_error(self, cache, source):
+        cache.set_error(_Source, source.source_id, mock.sentinel.error)
+        cache.set_value(source.source_id, source)
+        assert cache.get_error(_Source, source.source_id) is None
+
+    def test_errors_are_not_cached_without_ttl(self):
+        cache = _Cache()
+        cache.set_error(_Source, 1, mock.sentinel.error)
+        assert cache.get_error(_Source, 1) is None
+
+    def test_bounded_errors(self, cache):
+        with mock.patch.object(_Cache, 'MAX_ERRORS', 2):
+            for source_id in range(3):
+                cache.set_error(_Source, source_id, mock.sentinel.error)
+        assert cache.get_error(_Source, 0) is None
+        assert cache.get_error(_Source, 2) is mock.sentinel.error
+
+
+class TestNegativeCache(object):
+
+    @pytest.yield_fixture
+    def fake_schematizer(self):
+        with FakeSchematizer() as fake_schematizer, reconfigure(
+            schematizer_host_and_port=fake_schematizer.host_and_port,
+            schematizer_negative_cache_ttl_seconds=60
+        ):
+            reset_schematizer()
+            yield fake_schematizer
+        reset_schematizer()
+
+    @pytest.fixture
+    def schematizer(self, fake_schematizer):
+        return get_schematizer()
+
+    @pytest.mark.parametrize('get_entity', [
+        lambda schematizer: schematizer.get_schema_by_id(1),
+        lambda schematizer: schematizer.get_topic_by_name('foo_topic'),
+        lambda schematizer: schematizer.get_source_by_id(1),
+    ])
+    def test_repeated_lookup_of_missing_entity(
+        self,
+        fake_schematizer,
+        schematizer,
+        get_entity
+    ):
+        for _ in range(3):
+            with expect_HTTPError(404):
+                get_entity(schematizer)
+        # One request for the swagger spec and one for the entity.
+        assert fake_schematizer.request_count == 2
+        assert sum(schematizer.negative_cache_hit_counts.values()) == 2
+
+    def test_count_negative_hits_by_entity_type(self, schematizer):
+        for _ in range(2):
+            with expect_HTTPError(404):
+                schematizer.get_topic_by_name('foo_topic')
+        assert schematizer.negative_cache_hit_counts == {'topic': 1}
+
+    def test_registered_entity_is_found(self, fake_schematizer, schematizer):
+        with expect_HTTPError(404):
+            schematizer.get_schema_by_id(1)
+        schema_id = fake_schematizer.add_schema({
+            'type': 'record',
+            'name': 'foo',
+            'namespace': 'bar',
+            'fields': []
+        })
+        schematizer._fetch_schema_by_id(schema_id)
+        assert schematizer.get_schema_by_id(schema_id).schema_id == schema_id
+
+    def test_negative_cache_disabled(self, fake_schematizer):
+        with reconfigure(schematizer_negative_cache_ttl_seconds=0):
+            reset_schematizer()
+            schematizer = get_schematizer()
+            for _ in range(2):
+                with expect_HTTPError(404):
+                    schematizer.get_source_by_id(1)
+        assert fake_schematizer.request_count == 3
+
+
+class TestCacheExpiration(object):
+
+    @pytest.fixture
+    def source(self):
+        return _Source(
+            source_id=1,
+            name='biz',
+            owner_email='test@yelp.com',
+            namespace=None,
+            category=None
+        )
+
+    @pytest.fixture
+    def policies(self):
+        return {_Source: _CachePolicy(max_entries=None, ttl_seconds=60)}
+
+    @contextmanager
+    def _at(self, now):
+        with mock.patch(
+            'data_pipeline.schematizer_clientlib.schematizer.time.time',
+            return_value=now
+        ):
+            yield
+
+    def _cache_source(self, cache, source):
+        with self._at(1000):
+            cache.set_value(source.source_id, source)
+            cache.set_result(_Source, source.source_id, mock.sentinel.source)
+            cache.set_result(
+                _Topic,
+                'biz_topic',
+                mock.sentinel.topic,
+                dependencies=[(_Source, source.source_id)]
+            )
+
+    def test_fresh_entity(self, policies, source):
+        cache = _Cache(policies=policies)
+        self._cache_source(cache, source)
+        with self._at(1059):
+            assert cache.get_value(_Source, 1) is not None
+            assert cache.get_result(_Topic, 'biz_topic') is mock.sentinel.topic
+
+    def test_expired_entity_without_refresher(self, policies, source):
+        cache = _Cache(policies=policies)
+        self._cache_source(cache, source)
+        with self._at(1060):
+            assert cache.get_value(_Source, 1) is None
+            assert cache.get_result(_Source, 1) is None
+            assert cache.get_result(_Topic, 'biz_topic') is None
+
+    def test_serve_stale_entity_while_refreshing(self, policies, source):
+        refreshed = threading.Event()
+        release = threading.Event()
+        refresh_calls = []
+
+        def refresh_source(source_id):
+            refresh_calls.append(source_id)
+            release.wait()
+            cache.set_value(source_id, source)
+            refreshed.set()
+
+        cache = _Cache(policies=policies, refreshers={_Source: refresh_source})
+        self._cache_source(cache, source)
+        with self._at(1060):
+            for _ in range(3):
+                assert cache.get_result(_Source, 1) is mock.sentinel.source
+                assert cache.get_value(_Source, 1) is not None
+            release.set()
+            refreshed.wait(5)
+        assert refresh_calls == [1]
+        with self._at(1119):
+            assert cache.get_result(_Topic, 'biz_topic') is mock.sentinel.topic
+            assert cache.get_result(_Source, 1) is mock.sentinel.source
+        assert refresh_calls == [1]
+
+    def test_postpone_failed_refresh(self, policies, source):
+        cache = _Cache(
+            policies=policies,
+            refreshers={_Source: mock.Mock(side_effect=Exception)}
+        )
+        self._cache_source(cache, source)
+        with self._at(1060):
+            cache._refresh(('_Source', 1))
+        with self._at(1069):
+            assert cache.get_value(_Source, 1) is not None
+            assert not cache._refreshing
+
+
 class TestGetSchemaById(SchematizerClientTestBase):
 
     @pytest.fixture(autouse=True, scope='class')
@@ -298,6 +755,74 @@ class TestGetSchemaById(SchematizerClientTestBase):
             assert topic_api_spy.call_count == 0
             assert source_api_spy.call_count == 0
 
+    def test_cached_schema_is_shared(self, schematizer, biz_schema):
+        schema = schematizer.get_schema_by_id(biz_schema.schema_id)
+        assert schematizer.get_schema_by_id(biz_schema.schema_id) is schema
+        assert schematizer.get_topic_by_name(schema.topic.name) is schema.topic
+
+    def test_refreshed_topic_updates_cached_schema(
+        self,
+        schematizer,
+        biz_schema
+    ):
+        schema = schematizer.get_schema_by_id(biz_schema.schema_id)
+        schematizer.get_topics_by_source_id(schema.topic.source.source_id)
+        actual = schematizer.get_schema_by_id(biz_schema.schema_id)
+        self._assert_schema_values(actual, biz_schema)
+        assert actual.topic is schematizer.get_topic_by_name(schema.topic.name)
+
+
+class TestGetSchemasByIds(SchematizerClientTestBase):
+
+    @pytest.fixture(autouse=True, scope='class')
+    def biz_schema(self, yelp_namespace_name, biz_src_name):
+        return self._register_avro_schema(yelp_namespace_name, biz_src_name)
+
+    @pytest.fixture(autouse=True, scope='class')
+    def usr_schema(self, yelp_namespace_name, usr_src_name):
+        return self._register_avro_schema(yelp_namespace_name, usr_src_name)
+
+    def test_get_schemas_in_input_order(
+        self,
+        schematizer,
+        biz_schema,
+        usr_schema
+    ):
+        actual = schematizer.get_schemas_by_ids([
+            usr_schema.schema_id,
+            biz_schema.schema_id,
+            usr_schema.schema_id
+        ])
+        assert len(actual) == 3
+        self._assert_schema_values(actual[0], usr_schema)
+        self._assert_schema_values(actual[1], biz_schema)
+        assert actual[2] is actual[0]
+
+    def test_only_fetch_non_cached_schemas(
+        self,
+        schematizer,
+        biz_schema,
+        usr_schema
+    ):
+        schematizer.get_schema_by_id(biz_schema.schema_id)
+        with self.attach_spy_on_api(
+            schematizer._client,
+            'schemas',
+            'get_schema_by_id'
+        ) as api_spy:
+            schematizer.get_schemas_by_ids([
+                biz_schema.schema_id,
+                usr_schema.schema_id
+            ])
+            assert api_spy.call_count == 1
+
+    def test_get_no_schemas(self, schematizer):
+        assert schematizer.get_schemas_by_ids([]) == []
+
+    def test_non_existing_schema(self, schematizer, biz_schema):
+        with expect_HTTPError(404):
+            schematizer.get_schemas_by_ids([biz_schema.schema_id, 0])
+
 
 class TestGetSchemaElementsBySchemaId(SchematizerClientTestBase):
 
@@ -409,6 +934,48 @@ class TestGetSchemasCreatedAfterDate(SchematizerClientTestBase):
             # than the page size.
             assert schemas_api_spy.call_count == len(schemas) + 1
 
+    def test_iter_schemas_created_after_date(self, sorted_schemas, schematizer):
+        created_at = sorted_schemas[0].created_at
+        creation_timestamp = self._get_creation_timestamp(created_at)
+        expected = schematizer.get_schemas_created_after_date(
+            created_after=creation_timestamp,
+            min_id=1
+        )
+        actual = list(schematizer.iter_schemas_created_after_date(
+            created_after=creation_timestamp,
+            min_id=1,
+            page_size=1
+        ))
+        assert [schema.schema_id for schema in actual] == [
+            schema.schema_id for schema in expected
+        ]
+
+    def test_iter_schemas_created_after_date_grows_page_size(
+        self,
+        sorted_schemas,
+        schematizer
+    ):
+        created_at = sorted_schemas[0].created_at
+        creation_timestamp = self._get_creation_timestamp(created_at)
+        with self.attach_spy_on_api(
+            schematizer._client,
+            'schemas',
+            'get_schemas_created_after'
+        ) as schemas_api_spy:
+            schemas = list(schematizer.iter_schemas_created_after_date(
+                created_after=creation_timestamp,
+                min_id=1,
+                page_size=1,
+                max_page_size=2
+            ))
+            page_sizes = [
+                call_args[1]['count']
+                for call_args in schemas_api_spy.call_args_list
+            ]
+            assert page_sizes[:2] == [1, 2]
+            assert set(page_sizes[2:]) <= {2}
+            assert schemas_api_spy.call_count == (len(schemas) + 1) / 2 + 1
+
     def test_get_schemas_created_after_date(self, schematizer):
         created_after = self._get_created_after()
         creation_timestamp = self._get_creation_timestamp(created_after)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+from bravado.exception import HTTPError
+
+from data_pipeline.schematizer_clientlib.schematizer import get_schematizer
+from data_pipeline.schematizer_clientlib.schematizer import reset_schematizer
+from data_pipeline.testing_helpers.fake_schematizer import FakeSchematizer
+from tests.helpers.config import reconfigure
+
+
+class TestFakeSchematizer(object):
+
+    @pytest.fixture
+    def schema_json(self):
+        return {
+            'type': 'record',
+            'name': 'foo',
+            'namespace': 'bar',
+            'fields': [{'type': 'int', 'name': 'id'}]
+        }
+
+    @pytest.yield_fixture
+    def fake_schematizer(self):
+        with FakeSchematizer() as fake_schematizer, reconfigure(
+            schematizer_host_and_port=fake_schematizer.host_and_port
+        ):
+            reset_schematizer()
+            yield fake_schematizer
+        reset_schematizer()
+
+    def test_get_schema_by_id(self, fake_schematizer, schema_json):
+        schema_id = fake_schematizer.add_schema(
+            schema_json,
+            topic_name='foo_topic',
+            source_name='foo_source'
+        )
+        schema = get_schematizer().get_schema_by_id(schema_id)
+        assert schema.schema_id == schema_id
+        assert schema.schema_json == schema_json
+        assert schema.topic.name == 'foo_topic'
+        assert schema.topic.source.name == 'foo_source'
+
+    def test_share_topic_and_source(self, fake_schematizer, schema_json):
+        schema_ids = [
+            fake_schematizer.add_schema(schema_json, topic_name='foo_topic')
+            for _ in range(2)
+        ]
+        schemas = get_schematizer().get_schemas_by_ids(schema_ids)
+        assert schemas[0].topic == schemas[1].topic
+
+    def test_get_schemas_by_ids_concurrently(
+        self,
+        fake_schematizer,
+        schema_json
+    ):
+        schema_ids = [
+            fake_schematizer.add_schema(
+                schema_json,
+                topic_name='topic_{}'.format(i)
+            )
+            for i in range(50)
+        ]
+        schemas = get_schematizer().get_schemas_by_ids(schema_ids)
+        assert [schema.schema_id for schema in schemas] == schema_ids
+        assert [schema.topic.name for schema in schemas] == [
+            'topic_{}'.format(i) for i in range(50)
+        ]
+
+    def test_get_non_existing_schema(self, fake_schematizer):
+        with pytest.raises(HTTPError) as e:
+            get_schematizer().get_schema_by_id(1)
+        assert e.value.response.status_code == 404
+
+    def test_stop_closes_open_connections(self, schema_json):
+        fake_schematizer = FakeSchematizer()
+        fake_schematizer.start()
+        with reconfigure(
+            schematizer_host_and_port=fake_schematizer.host_and_port
+        ):
+            reset_schematizer()
+            get_schematizer().get_schema_by_id(
+                fake_schematizer.add_schema(schema_json)
+            )
+        reset_schematizer()
+        request_threads = list(fake_schematizer._server._thread_to_request)
+        # The client keeps its connection alive.
+        assert request_threads
+
+        fake_schematizer.stop()
+        assert not any(thread.is_alive() for thread in request_threads)
@@ -42,3 +42,19 @@ class TestStatsCounter(object):
             counter.increment('test_type')
             # Two increments are batched into 1 call.
             assert mock_count.call_count == 1
+
+    @mock.patch('yelp_meteorite.metrics.Counter.count', autospec=True)
+    def test_counted_dimension(self, mock_count):
+        counter = StatsCounter(
+            'test_stat',
+            message_count_timer=0,
+            counted_dimension='entity_type'
+        )
+        counter.increment('schema')
+        assert mock_count.call_args[0][2] == {'entity_type': 'schema'}
+
+    @mock.patch('yelp_meteorite.metrics.Counter.count', autospec=True)
+    def test_increment_by_count(self, mock_count):
+        counter = StatsCounter('test_stat', message_count_timer=0, stat_type='test_type')
+        counter.increment('test_type', 5)
+        assert mock_count.call_args[0][1] == 5
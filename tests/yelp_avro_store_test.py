@@ -123,3 +123,23 @@ class TestAvroStringStore(object):
         store = _AvroStringStore()
         store.get_reader(schema_id, schema_id, schema_types, schema_types)
         assert (schema_id, schema_id) in store._reader_cache
+
+    def test_get_reader_with_fields(self, schema_types):
+        schema_id = 5
+        store = _AvroStringStore()
+        reader = store.get_reader(
+            schema_id,
+            schema_id,
+            schema_types,
+            schema_types,
+            fields=['business_encid']
+        )
+        assert store._reader_cache[
+            (schema_id, schema_id, frozenset(['business_encid']))
+        ] is reader
+        assert reader is not store.get_reader(
+            schema_id,
+            schema_id,
+            schema_types,
+            schema_types
+        )